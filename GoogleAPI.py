@@ -4,11 +4,25 @@ import google.generativeai as genai
 import os
 import sys
 import threading # To run API calls without freezing the GUI
+import time
+from chatcontext import ChatContext
+from transcript import Transcript
+from modelcompare import ModelCompareWindow
+from recordreplay import install_from_env
+
+STREAM_FLUSH_MS = 16 # Streamed chunks are inserted at most once per frame (~60 fps)
+CONTEXT_TOKEN_BUDGET = 8000 # Older turns beyond this are folded into a rolling summary
+CONTEXT_MIN_RECENT_TURNS = 4 # Always resent verbatim
+TRANSCRIPT_MAX_VISIBLE = 200 # Messages kept in the widget; older ones reload when scrolling up
+TRANSCRIPT_PAGE_SIZE = 50
+
+# PROMPT_BACKEND_MODE=record|replay routes Gemini calls (chat and Compare Models) through a fixture file
+install_from_env()
 
 class GeminiApp:
     def __init__(self, root):
         self.root = root
-        self.root.title("Gemini Chat App v0.3 (Persistent Chat)")
+        self.root.title("Gemini Chat App v0.4 (Streaming Chat)")
         self.root.geometry("700x600") # Initial size
 
         # --- API Key Configuration ---
@@ -26,6 +40,12 @@ class GeminiApp:
         self.model = None
         self.chat_session = None
         self.current_chat_history_list = [] # Stores history [{'role': ..., 'parts': ...}]
+        self.context = ChatContext(CONTEXT_TOKEN_BUDGET, CONTEXT_MIN_RECENT_TURNS) # Bounded history sent to the API
+
+        # --- Streaming State ---
+        self._stream_lock = threading.Lock()
+        self._pending_stream = [] # (text, style) pairs waiting for the next frame flush
+        self._stream_flush_scheduled = False
 
         # --- UI Elements ---
         # Frame for top controls (Model selection)
@@ -46,10 +66,14 @@ class GeminiApp:
         # --- CHANGE: Bind event handler for model change ---
         self.model_dropdown.bind("<<ComboboxSelected>>", self.on_model_change)
 
+        self.compare_button = ttk.Button(controls_frame, text="Compare Models...", command=self.open_compare_window)
+        self.compare_button.pack(side=tk.LEFT)
+
         # Chat History Display
         self.chat_history = scrolledtext.ScrolledText(root, wrap=tk.WORD, state=tk.DISABLED, height=20, relief=tk.SUNKEN, borderwidth=1)
         self.chat_history.pack(padx=10, pady=(0, 5), fill=tk.BOTH, expand=True)
         self.configure_tags()
+        self.transcript = Transcript(self.chat_history, TRANSCRIPT_MAX_VISIBLE, TRANSCRIPT_PAGE_SIZE)
 
         # Frame for bottom input
         input_frame = ttk.Frame(root, padding="10")
@@ -72,6 +96,7 @@ class GeminiApp:
             self.add_to_history("System: WARNING - API Key not configured! Set GOOGLE_API_KEY.\n", style="error")
             self.send_button.config(state=tk.DISABLED)
             self.input_entry.config(state=tk.DISABLED)
+            self.compare_button.config(state=tk.DISABLED)
 
     # --- Core Methods ---
 
@@ -109,6 +134,7 @@ class GeminiApp:
             self.model = genai.GenerativeModel(model_name)
             # --- CHANGE: Clear history and start new chat session ---
             self.current_chat_history_list = []
+            self.context.reset()
             self.chat_session = self.model.start_chat(
                 history=self.current_chat_history_list # Start with empty history
             )
@@ -130,6 +156,13 @@ class GeminiApp:
         # Re-initialize chat with the new model (this will clear history)
         self._initialize_chat_session(selected_model_name)
 
+    def open_compare_window(self):
+        """Opens the side-by-side compare window (separate from the persistent chat)."""
+        if not self.api_key_configured:
+            self.add_to_history("System: Cannot compare models - API Key not configured.\n", "error")
+            return
+        ModelCompareWindow(self.root, self.available_models)
+
     def configure_tags(self):
         """Sets up text tags for styling the chat history."""
         self.chat_history.tag_configure("user", foreground="#0000AA") # Dark Blue
@@ -146,15 +179,34 @@ class GeminiApp:
     def _add_to_history_main_thread(self, text, style):
         """Internal method to update GUI history (runs in main thread)."""
         try:
-            scroll_pos = self.chat_history.yview()[1]
-            self.chat_history.config(state=tk.NORMAL)
-            self.chat_history.insert(tk.END, text, (style,))
-            self.chat_history.config(state=tk.DISABLED)
-            if scroll_pos > 0.95: # Auto-scroll only if near the bottom
-                 self.chat_history.see(tk.END)
+            self.transcript.append([(text, style if isinstance(style, tuple) else (style,))])
         except Exception as e:
             print(f"Error adding to history: {e}")
 
+    def _queue_stream_text(self, text, style):
+        """Buffers streamed text from any thread; one flush per frame inserts it all."""
+        with self._stream_lock:
+            self._pending_stream.append((text, style))
+            if self._stream_flush_scheduled:
+                return
+            self._stream_flush_scheduled = True
+        self.root.after(STREAM_FLUSH_MS, self._flush_stream_main_thread)
+
+    def _flush_stream_main_thread(self):
+        """Appends all buffered chunks to the transcript in one insert (runs in main thread)."""
+        with self._stream_lock:
+            pending = self._pending_stream
+            self._pending_stream = []
+            self._stream_flush_scheduled = False
+        if not pending:
+            return
+        try:
+            # The "Thinking..." placeholder is replaced by the first streamed output
+            self.transcript.remove_tag("thinking")
+            self.transcript.append([(text, (style,)) for text, style in pending])
+        except Exception as e:
+            print(f"Error flushing streamed text: {e}")
+
     def send_message_event(self, event=None):
         """Handles the Enter key press in the input field."""
         self.send_message_thread()
@@ -176,7 +228,7 @@ class GeminiApp:
         self.input_entry.delete("1.0", tk.END)
         self.input_entry.config(state=tk.DISABLED)
         self.send_button.config(state=tk.DISABLED)
-        self.add_to_history("Gemini: Thinking...\n", style="info")
+        self.root.after(0, self._add_to_history_main_thread, "Gemini: Thinking...\n", ("info", "thinking"))
 
         # Run the actual API call in a separate thread
         thread = threading.Thread(target=self._send_message_worker, args=(user_input,))
@@ -184,55 +236,66 @@ class GeminiApp:
         thread.start()
 
     def _send_message_worker(self, user_input):
-        """Makes the API call using the persistent chat session (runs in background)."""
+        """Streams the reply from the persistent chat session into the history (runs in background)."""
         try:
             if not self.chat_session:
                 # Should ideally not happen due to check in send_message_thread, but safety check
                 raise Exception("Chat session is not initialized.")
 
-            # --- CHANGE: Use persistent chat session ---
-            # Pass the raw user input string
-            response = self.chat_session.send_message(user_input)
-            # --- ------------------------------------ ---
-
-            # Extract response text safely
-            response_text = ""
-            # The chat session's history is automatically updated internally by send_message
-            # We update our list to match for potential saving/reloading later
-            if self.chat_session.history and self.chat_session.history[-1].role == 'model':
-                 response_part = self.chat_session.history[-1].parts[0]
-                 if hasattr(response_part, 'text'):
-                      response_text = response_part.text
-                 else: # Handle potential non-text parts or blocks if needed
-                      response_text = "[Non-text or blocked response part]"
-            elif hasattr(response, 'text'): # Fallback if history access differs
-                 response_text = response.text
-            else:
-                 try:
-                      # Check for explicit block reasons
-                      block_reason = response.prompt_feedback.block_reason
-                      response_text = f"[Blocked by API: {block_reason}]"
-                 except Exception:
-                      response_text = "[Blocked or Empty Response]"
-
-
-            # --- CHANGE: Update our history list *after* getting response ---
-            # Ensure consistency with the chat object's history
+            model_short_name = self.model.model_name.split('/')[-1] # Get name from self.model
+            header = f"Gemini ({model_short_name}): "
+            start_time = time.perf_counter()
+            first_token_time = None
+            response_parts = []
+
+            # --- Stream the reply; chunks are batched into one UI insert per frame ---
+            response = self.chat_session.send_message(user_input, stream=True)
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError: # Raised for blocked or non-text parts
+                    text = ""
+                if not text:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - start_time
+                    self._queue_stream_text(header, "gemini")
+                response_parts.append(text)
+                self._queue_stream_text(text, "gemini")
+            total_time = time.perf_counter() - start_time
+
+            response_text = "".join(response_parts)
+            if not response_text:
+                try:
+                    # Check for explicit block reasons
+                    block_reason = response.prompt_feedback.block_reason
+                    response_text = f"[Blocked by API: {block_reason}]"
+                except Exception:
+                    response_text = "[Blocked or Empty Response]"
+                self._queue_stream_text(header + response_text, "gemini")
+
+            # The chat session's history is updated internally once the stream is consumed;
+            # we update our list to match for potential saving/reloading later
             if self.chat_session.history and self.chat_session.history[-1].role == 'model':
                 self.current_chat_history_list.append({'role': 'model', 'parts': [response_text]})
-            # -------------------------------------------------------------
 
-            # Prepare text for display
-            model_short_name = self.model.model_name.split('/')[-1] # Get name from self.model
-            display_text = f"Gemini ({model_short_name}): {response_text}\n"
+            usage = getattr(response, "usage_metadata", None)
+            prompt_tokens = getattr(usage, "prompt_token_count", None)
+            reply_tokens = getattr(usage, "candidates_token_count", None)
+            self.context.add_turn(user_input, response_text, reply_tokens)
 
-            # Schedule GUI update to add response
-            self.add_to_history(display_text, "gemini")
+            ttft_text = f"{first_token_time:.2f}s" if first_token_time is not None else "n/a"
+            prompt_text = f"prompt {prompt_tokens} tokens, " if prompt_tokens is not None else ""
+            self._queue_stream_text("\n", "gemini")
+            self._queue_stream_text(f"[{prompt_text}first token {ttft_text}, total {total_time:.2f}s]\n", "system")
+
+            if self.context.over_budget():
+                self._compact_context()
 
         except Exception as e:
             error_message = f"API Error: {type(e).__name__}: {e}\n"
             print(error_message)
-            self.add_to_history(error_message, "error")
+            self._queue_stream_text(error_message, "error")
 
             # Clean up our history list if API call failed after adding user message
             if self.current_chat_history_list and self.current_chat_history_list[-1]['role'] == 'user':
@@ -245,6 +308,23 @@ class GeminiApp:
             # Schedule re-enabling input/button (runs in main thread)
             self.root.after(0, self.enable_input)
 
+    def _compact_context(self):
+        """Summarizes old turns and restarts the session on the bounded history (runs in background)."""
+        before = self.context.total_tokens()
+
+        def summarize(text):
+            return self.model.generate_content(text).text
+
+        evicted = self.context.compact(summarize)
+        if not evicted:
+            return
+        history = self.context.history()
+        self.chat_session = self.model.start_chat(history=history)
+        self.current_chat_history_list = history
+        self._queue_stream_text(
+            f"System: Context compacted - {evicted} older turns summarized "
+            f"(~{before} -> ~{self.context.total_tokens()} tokens).\n", "system")
+
     def enable_input(self):
         """Re-enables input widgets (called via root.after)."""
         self.input_entry.config(state=tk.NORMAL)
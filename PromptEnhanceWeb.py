@@ -4,10 +4,31 @@ import os
 import json
 from pathlib import Path
 import re
+from promptcleanup import clean_prompt
+from enhanceapi import serve_api
+from singleflight import SingleFlight
+from microbatch import BATCH_SESSION, MicroBatcher
+from safetensorsmeta import TriggerScanner, merge_triggers
+from modelindex import ModelIndex
+from adaptivelimit import AdaptiveLimiter
+from speculative import SessionSpeculators, SpeculationCancelled
+from cascade import CascadeStats, draft_problems, refine_messages
+from recordreplay import install_from_env
+from choicecatalog import ChoiceCatalog, page_label
+from fairqueue import BULK, SESSION_MAX_IN_FLIGHT, FairScheduler
+from similarcache import SimilarCache
+from structuredoutput import (
+    JSON_RESPONSE_FORMAT, StructuredOutputError, StructuredStats, enhance_structured, structured_to_prompt,
+)
+try:
+    from lorasuggest import LoraSuggester
+except ImportError:  # NumPy not installed: LoRA suggestions are disabled
+    LoraSuggester = None
 
 # --- Configuration ---
 OLLAMA_ENDPOINT = "http://localhost:11434/v1/chat/completions"
 LOCAL_LLM_MODEL = "trollek/qwen2-diffusion-prompter:latest"  # <--- CHANGE THIS to your desired model
+DRAFT_MODEL = "qwen2.5:1.5b"  # Small, fast model for the first cascade stage
 
 # Define paths (Make sure these are correct for your setup)
 BASE_FOOCUS_PATH = Path("E:/Fooocus_win64_2-5-0/Fooocus")  # Example Base Path
@@ -16,6 +37,83 @@ STYLE_PATH = Path("C:/Fooocus_win64_2-5-0_2/Fooocus/sdxl_styles")
 CHECKPOINT_PATH = BASE_FOOCUS_PATH / "models/checkpoints"
 LORA_TRIGGER_PATH = Path("loras.json")  # Assumed to be in the script's directory
 
+# PROMPT_BACKEND_MODE=record|replay routes Ollama calls through a fixture file for offline benchmarks
+install_from_env()
+
+# Identical requests that overlap in time share one Ollama call
+ollama_flight = SingleFlight()
+
+# Adaptive concurrency in front of Ollama: shrinks on 429/503/timeouts and rising latency.
+# The cascade's draft model gets its own limiter so its fast replies don't set the latency
+# baseline that LOCAL_LLM_MODEL calls are judged against.
+ollama_limiter = AdaptiveLimiter("Ollama", initial_limit=2, max_limit=16)
+draft_limiter = AdaptiveLimiter("Ollama draft", initial_limit=2, max_limit=16)
+
+# Fair queuing in front of the limiter: interactive requests before batch items, round-robin
+# across browser sessions / API keys, and at most SESSION_MAX_IN_FLIGHT (set in fairqueue.py)
+# running per session. Micro-batches are queued under their own session, capped only by the
+# limiter's ceiling.
+request_scheduler = FairScheduler(capacity=lambda: ollama_limiter.limit, session_limit=SESSION_MAX_IN_FLIGHT,
+                                  session_limits={BATCH_SESSION: ollama_limiter.max_limit})
+
+# Optional micro-batching: prompts with the same style/conciseness/NSFW settings that
+# arrive within the window are sent to Ollama as one JSON-array request. Callers waiting
+# for a batch don't count against the scheduler's capacity; each batch call takes one slot.
+# Covers the UI's Enhance button (which then stops streaming) and the API; the cascade and
+# speculative runs keep their own per-prompt calls.
+MICRO_BATCH_ENABLED = False
+MICRO_BATCH_WINDOW = 0.05  # Seconds to wait for more prompts before sending
+MICRO_BATCH_MAX_SIZE = 8
+
+# Ask Ollama for a JSON object (positive/negative tags, subject, style) instead of free
+# text; malformed replies are repaired locally before falling back to one re-roll
+STRUCTURED_OUTPUT = False
+STRUCTURED_MAX_REROLLS = 1
+structured_stats = StructuredStats()
+
+# Opt-in: start enhancing in the background once the prompt/settings stop changing,
+# so a click on Enhance with the same inputs returns immediately. Each browser session has
+# its own speculator; runs only start when nothing is queued and take a bulk slot.
+SPECULATIVE_ENABLED = False
+SPECULATE_SLOT_TIMEOUT = 1.0  # Seconds a speculative run waits for its bulk slot before giving up
+speculators = SessionSpeculators(
+    can_start=lambda: request_scheduler.has_spare_capacity() and ollama_limiter.has_spare_capacity())
+
+# Two-stage cascade: DRAFT_MODEL answers first, LOCAL_LLM_MODEL refines the draft unless
+# it already passes the token budget and format checks (or on request with the Refine button)
+CASCADE_ENABLED = False
+CASCADE_AUTO_REFINE = True
+cascade_stats = CascadeStats()
+
+# Near-duplicate cache: a base prompt whose normalized words mostly match an earlier one with
+# the same settings (word order, casing, an extra adjective) gets the earlier result instantly
+SIMILAR_CACHE_ENABLED = False
+# Jaccard similarity of the normalized word sets. Loose on purpose: one changed attribute in a
+# 10-word prompt still clears 0.75 ("red hair" vs "blue hair" scores ~0.8), so such hits reuse
+# a result that doesn't match the prompt; raise to ~0.9 if that matters more than hit rate
+SIMILAR_CACHE_THRESHOLD = 0.75
+SIMILAR_MATCH_NOTICE = True  # Tell the user when a result came from a similar, not identical, prompt
+similar_cache = SimilarCache(threshold=SIMILAR_CACHE_THRESHOLD)
+
+# Trigger words derived from safetensors training metadata, cached by file size/mtime
+trigger_scanner = TriggerScanner()
+lora_headers_scanned = False
+catalog_triggers = None  # Merged triggers from a catalog snapshot (multi-worker mode); skips disk reads
+
+# Base architecture (SD1/SD2/SDXL/...) of each LoRA and checkpoint, from file headers
+model_index = ModelIndex()
+
+SUGGEST_TOP_K = 5  # LoRAs and style tags suggested for the current prompt
+SUGGEST_SOURCES_CHECK_SECONDS = 10.0  # Suggestions run per keystroke; the LoRA tree is walked at most this often
+lora_suggester = LoraSuggester() if LoraSuggester else None
+
+# Dropdowns are searched and paged server-side; the browser only receives one page of names
+lora_catalog = ChoiceCatalog()
+checkpoint_catalog = ChoiceCatalog()
+style_tag_catalog = ChoiceCatalog()
+style_tag_entries = {}  # Style tag name -> "name::positive::negative"; the UI only sends names
+style_tags_loaded = False
+
 # --- Style Definitions ---
 STYLES = {
     "Visual Detail": "Rewrite the prompt using short, vivid, comma-separated phrases optimized for Stable Diffusion. Focus on clarity, detail, and visual density.",
@@ -34,14 +132,26 @@ STYLES = {
 }
 
 
+def scanned_lora_triggers(rescan=False):
+    """Triggers read from LoRA file headers. Scans on first use; later calls are in-memory."""
+    global lora_headers_scanned
+    if rescan or not lora_headers_scanned:
+        trigger_scanner.scan(LORA_PATH)
+        lora_headers_scanned = True
+    return trigger_scanner.triggers()
+
+
 def load_lora_triggers():
+    if catalog_triggers is not None:
+        return catalog_triggers
+    hand_triggers = {}
     try:
         if LORA_TRIGGER_PATH.exists():
             with open(LORA_TRIGGER_PATH, "r", encoding="utf-8") as f:
-                return json.load(f)
+                hand_triggers = json.load(f)
     except Exception as e:
         print(f"Error loading LoRA triggers from {LORA_TRIGGER_PATH}: {e}")
-    return {}
+    return merge_triggers(hand_triggers, scanned_lora_triggers())
 
 
 def get_lora_trigger(lora_name, lora_triggers):
@@ -105,15 +215,51 @@ def load_style_tags():
     return sorted(tags, key=str.lower)
 
 
-def enhance_prompt(prompt, style, nsfw, token_level, checkpoint, lora, style_tag_entry):
-    lora_triggers = load_lora_triggers()
+def index_style_tags(entries):
+    global style_tag_entries, style_tags_loaded
+    style_tag_entries = {entry.split("::", 1)[0]: entry for entry in entries}
+    style_tag_catalog.set(style_tag_entries)
+    style_tags_loaded = True
+
+
+def resolve_style_tag(style_tag):
+    """Full entry for a style tag name. Full "name::positive::negative" entries (API, CLI) pass through."""
+    if not style_tag or "::" in style_tag:
+        return style_tag
+    if not style_tags_loaded:
+        index_style_tags(load_style_tags())
+    return style_tag_entries.get(style_tag, style_tag)
+
+
+def catalog_snapshot():
+    """Scans everything the handlers read from disk into one JSON-serializable dict."""
+    model_index.scan(LORA_PATH, CHECKPOINT_PATH)
+    return {
+        "loras": load_loras(),
+        "checkpoints": load_checkpoints(),
+        "style_tags": load_style_tags(),
+        "lora_triggers": load_lora_triggers(),
+        "lora_arch": dict(model_index.lora_arch),
+        "checkpoint_arch": dict(model_index.checkpoint_arch),
+    }
+
+
+def install_catalog(snapshot):
+    """Uses a snapshot from catalog_snapshot() instead of scanning; handlers then never touch the disk."""
+    global loras, catalog_triggers
+    loras = snapshot["loras"]
+    lora_catalog.set(loras)
+    checkpoint_catalog.set(snapshot["checkpoints"])
+    index_style_tags(snapshot["style_tags"])
+    catalog_triggers = snapshot["lora_triggers"]
+    model_index.lora_arch = snapshot["lora_arch"]
+    model_index.checkpoint_arch = snapshot["checkpoint_arch"]
+
+
+def parse_style_tag(style_tag_entry):
+    style_tag_entry = resolve_style_tag(style_tag_entry)
     style_tag_prefix = ""
     negative_prompt = ""
-    lora_trigger = get_lora_trigger(lora, lora_triggers) if lora else ""
-
-    if not prompt:
-        return "Error: Please enter a basic prompt.", ""
-
     if style_tag_entry:
         try:
             parts = style_tag_entry.split("::", 2)
@@ -122,9 +268,10 @@ def enhance_prompt(prompt, style, nsfw, token_level, checkpoint, lora, style_tag
         except Exception as e:
             print(f"Error parsing style tag entry: {style_tag_entry} - {e}")
             style_tag_prefix = style_tag_entry if "::" not in style_tag_entry else ""
+    return style_tag_prefix, negative_prompt
 
-    lora_prefix = f"<lora:{lora}:0.8>, " if lora else ""
 
+def build_system_prompt(style, nsfw, token_level):
     if token_level < 25:
         token_prompt = "Respond using full sentences with rich descriptions. Do not use comma-separated tags."
     elif token_level < 50:
@@ -137,69 +284,381 @@ def enhance_prompt(prompt, style, nsfw, token_level, checkpoint, lora, style_tag
     system_prompt = f"You are a prompt enhancer for Stable Diffusion image generation. {STYLES[style]} {token_prompt}"
     if nsfw:
         system_prompt += " Add relevant NSFW, erotic, or suggestive elements as concise tags if appropriate for the base prompt."
+    return system_prompt
 
-    user_prompt_for_api = prompt
 
-    try:
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt_for_api}
-        ]
+def build_messages(prompt, style, nsfw, token_level):
+    return [
+        {"role": "system", "content": build_system_prompt(style, nsfw, token_level)},
+        {"role": "user", "content": prompt}
+    ]
 
-        payload = {
-            "model": LOCAL_LLM_MODEL,
-            "messages": messages,
-            "stream": False,
-        }
 
-        print(f"--- Sending to Ollama ({LOCAL_LLM_MODEL}) ---")
+def _payload_key(payload):
+    return json.dumps(payload, sort_keys=True)
 
+
+def limiter_for(model):
+    return draft_limiter if model == DRAFT_MODEL and model != LOCAL_LLM_MODEL else ollama_limiter
+
+
+def call_ollama(messages, model=LOCAL_LLM_MODEL, response_format=None):
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": False,
+    }
+    if response_format:
+        payload["response_format"] = response_format
+
+    def post():
         response = requests.post(OLLAMA_ENDPOINT, json=payload, timeout=120)
         response.raise_for_status()
+        return response
 
-        data = response.json()
-        enhanced_ai_part = data['choices'][0]['message']['content'].strip()
+    def fetch():
+        print(f"--- Sending to Ollama ({model}) ---")
+        data = limiter_for(model).call(post).json()
+        return data['choices'][0]['message']['content'].strip()
 
-        final_prompt_parts = []
-        if lora_prefix:
-            final_prompt_parts.append(lora_prefix.strip())
-        if style_tag_prefix:
-            final_prompt_parts.append(style_tag_prefix)
-        if lora_trigger:
-            final_prompt_parts.append(lora_trigger)
-        final_prompt_parts.append(enhanced_ai_part)
+    return ollama_flight.do(_payload_key(payload), fetch)
 
-        final_prompt = ", ".join(filter(None, final_prompt_parts))
-        final_prompt = re.sub(r'\s*,\s*', ', ', final_prompt).strip(', ')
 
-        return f"--checkpoint {checkpoint}\n{final_prompt}", negative_prompt
+def _iter_ollama_stream(payload):
+    """Content deltas of one SSE chat completion; closing the generator drops the connection."""
+    print(f"--- Streaming from Ollama ({payload['model']}) ---")
+    with limiter_for(payload["model"]).slot(), \
+            requests.post(OLLAMA_ENDPOINT, json=payload, timeout=120, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            delta = json.loads(data)['choices'][0].get('delta', {}).get('content')
+            if delta:
+                yield delta
+
+
+def stream_ollama(messages, model=LOCAL_LLM_MODEL):
+    """Yields content deltas from Ollama's streaming (SSE) chat completion."""
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+    }
+    return ollama_flight.stream(_payload_key(payload), lambda: _iter_ollama_stream(payload))
+
+
+micro_batcher = MicroBatcher(call_ollama, window=MICRO_BATCH_WINDOW, max_size=MICRO_BATCH_MAX_SIZE,
+                             scheduler=request_scheduler)
+
+
+def assemble_prompt(enhanced_ai_part, lora, style_tag_prefix, lora_trigger):
+    final_prompt_parts = []
+    if lora:
+        final_prompt_parts.append(f"<lora:{lora}:0.8>")
+    if style_tag_prefix:
+        final_prompt_parts.append(style_tag_prefix)
+    if lora_trigger:
+        final_prompt_parts.append(lora_trigger)
+    final_prompt_parts.append(enhanced_ai_part)
+    return clean_prompt(", ".join(filter(None, final_prompt_parts)))
+
+
+def request_enhancement(messages):
+    """LLM part of the pipeline: (enhanced text, model-suggested negative tags)."""
+    if STRUCTURED_OUTPUT:
+        result = enhance_structured(lambda msgs: call_ollama(msgs, response_format=JSON_RESPONSE_FORMAT),
+                                    messages, structured_stats, max_rerolls=STRUCTURED_MAX_REROLLS)
+        return structured_to_prompt(result)
+    if MICRO_BATCH_ENABLED:
+        return micro_batcher.submit(messages), ""
+    return call_ollama(messages), ""
+
+
+def draft_enhancement(messages):
+    return cascade_stats.timed("draft", lambda: call_ollama(messages, model=DRAFT_MODEL))
+
+
+def refine_enhancement(messages, draft, problems=None):
+    return cascade_stats.timed("refine", lambda: call_ollama(refine_messages(messages, draft, problems)))
+
+
+def cascade_enhancement(messages, token_level):
+    """Draft with the small model, refined by the large one only when the draft fails the checks."""
+    draft = draft_enhancement(messages)
+    problems = draft_problems(draft, token_level)
+    if not problems or not CASCADE_AUTO_REFINE:
+        cascade_stats.record_skip()
+        return draft, ""
+    return refine_enhancement(messages, draft, problems), ""
+
+
+def speculative_enhancement(messages, cancelled, session="local"):
+    """Background run for the speculator, in a bulk slot of the session's fair-queue share.
+
+    Free text is streamed so an edit aborts generation early.
+    """
+    with request_scheduler.slot(session, BULK, timeout=SPECULATE_SLOT_TIMEOUT):
+        if cancelled.is_set():
+            raise SpeculationCancelled()
+        if STRUCTURED_OUTPUT:
+            return request_enhancement(messages)
+        text = ""
+        stream = _iter_ollama_stream({"model": LOCAL_LLM_MODEL, "messages": messages, "stream": True})
+        try:
+            for chunk in stream:
+                if cancelled.is_set():
+                    raise SpeculationCancelled()
+                text += chunk
+        finally:
+            stream.close()
+        return text.strip(), ""
+
+
+def speculate(prompt, style, nsfw, token_level, request: gr.Request = None):
+    """Change handler: (re)starts the debounced background enhancement for the current inputs."""
+    if not SPECULATIVE_ENABLED:
+        return
+    session = session_id(request)
+    speculator = speculators.get(session)
+    if not prompt:
+        speculator.cancel()
+        return
+    messages = build_messages(prompt, style, nsfw, token_level)
+    speculator.schedule(_payload_key(messages),
+                        lambda cancelled: speculative_enhancement(messages, cancelled, session))
 
-    except requests.exceptions.ConnectionError as e:
-        error_msg = f"Connection Error: Could not connect to Ollama at {OLLAMA_ENDPOINT}.\nIs Ollama running? {e}"
-        print(error_msg)
-        return error_msg, ""
-    except requests.exceptions.Timeout:
-        error_msg = "Error: Request to Ollama timed out."
-        print(error_msg)
-        return error_msg, ""
-    except requests.exceptions.RequestException as e:
+
+def run_enhancement(prompt, style, nsfw, token_level, checkpoint, lora, style_tag_entry, speculative=False,
+                    session="local"):
+    """Runs the enhancement pipeline. Raises on backend errors instead of formatting them.
+
+    With speculative=True a matching background result from speculate() in the same session is
+    used if there is one.
+    """
+    lora_triggers = load_lora_triggers()
+    lora_trigger = get_lora_trigger(lora, lora_triggers) if lora else ""
+    style_tag_prefix, negative_prompt = parse_style_tag(style_tag_entry)
+
+    messages = build_messages(prompt, style, nsfw, token_level)
+    result = speculators.get(session).take(_payload_key(messages)) if speculative else None
+    if result is None and CASCADE_ENABLED and not STRUCTURED_OUTPUT:
+        result = cascade_enhancement(messages, token_level)
+    enhanced_ai_part, ai_negative = result or request_enhancement(messages)
+    if ai_negative:
+        negative_prompt = clean_prompt(", ".join(filter(None, [negative_prompt, ai_negative])))
+
+    final_prompt = assemble_prompt(enhanced_ai_part, lora, style_tag_prefix, lora_trigger)
+    return f"--checkpoint {checkpoint}\n{final_prompt}", negative_prompt
+
+
+def backend_stats():
+    stats = {"coalescing": ollama_flight.stats(), "limiter": ollama_limiter.stats(),
+             "scheduler": request_scheduler.stats()}
+    if STRUCTURED_OUTPUT:
+        stats["structured"] = structured_stats.stats()
+    if SPECULATIVE_ENABLED:
+        stats["speculation"] = speculators.stats()
+    if CASCADE_ENABLED:
+        stats["cascade"] = cascade_stats.stats()
+        stats["draft_limiter"] = draft_limiter.stats()
+    if SIMILAR_CACHE_ENABLED:
+        stats["similar_cache"] = similar_cache.stats()
+    return stats
+
+
+def format_error(e):
+    if isinstance(e, requests.exceptions.ConnectionError):
+        return f"Connection Error: Could not connect to Ollama at {OLLAMA_ENDPOINT}.\nIs Ollama running? {e}"
+    if isinstance(e, requests.exceptions.Timeout):
+        return "Error: Request to Ollama timed out."
+    if isinstance(e, requests.exceptions.RequestException):
         error_msg = f"Ollama Request Error: {e}"
         try:
             error_msg += f"\nResponse: {e.response.text}"
         except AttributeError:
             pass
+        return error_msg
+    if isinstance(e, StructuredOutputError):
+        return f"Error parsing Ollama response: {e}"
+    if isinstance(e, (KeyError, IndexError)):
+        return f"Error parsing Ollama response: Unexpected format.\n{e}"
+    return f"An unexpected error occurred: {type(e).__name__}: {e}"
+
+
+def session_id(request):
+    """Fair-queuing key for a Gradio event: one per browser session."""
+    return getattr(request, "session_hash", None) or "local"
+
+
+def similar_settings(style, nsfw, token_level, checkpoint, lora, style_tag_entry):
+    """Everything besides the base prompt that changes the result; only equal settings are compared."""
+    return (style, bool(nsfw), float(token_level), checkpoint or "", lora or "", style_tag_entry or "")
+
+
+def cached_similar(prompt, settings):
+    """(positive, negative[, draft]) of an earlier near-duplicate prompt, or None.
+
+    Cascade runs also store their raw draft so the Refine button still works on a cached result.
+    """
+    if not SIMILAR_CACHE_ENABLED:
+        return None
+    match = similar_cache.get(settings, prompt)
+    if match is None:
+        return None
+    result, similarity, earlier_prompt = match
+    if similarity < 1.0:
+        print(f"Similar match ({similarity:.0%}) of earlier prompt '{earlier_prompt}'")
+        if SIMILAR_MATCH_NOTICE:
+            try:
+                gr.Info(f"Similar match ({similarity:.0%}): reused the result for '{earlier_prompt}'")
+            except Exception:  # Outside a Gradio event (API, scripts)
+                pass
+    return result
+
+
+def enhance_prompt(prompt, style, nsfw, token_level, checkpoint, lora, style_tag_entry, request: gr.Request = None):
+    if not prompt:
+        return "Error: Please enter a basic prompt.", ""
+
+    settings = similar_settings(style, nsfw, token_level, checkpoint, lora, style_tag_entry)
+    cached = cached_similar(prompt, settings)
+    if cached:
+        return cached[:2]
+    try:
+        session = session_id(request)
+        with request_scheduler.slot(session):
+            result = run_enhancement(prompt, style, nsfw, token_level, checkpoint, lora, style_tag_entry,
+                                     speculative=SPECULATIVE_ENABLED, session=session)
+        if SIMILAR_CACHE_ENABLED:
+            similar_cache.put(settings, prompt, result)
+        return result
+    except Exception as e:
+        error_msg = format_error(e)
         print(error_msg)
         return error_msg, ""
-    except (KeyError, IndexError) as e:
-        error_msg = f"Error parsing Ollama response: Unexpected format.\n{e}"
+
+
+
+def enhance_prompt_stream(prompt, style, nsfw, token_level, checkpoint, lora, style_tag_entry,
+                          request: gr.Request = None):
+    """Gradio generator: shows the raw model text as it streams, then the cleaned prompt."""
+    if not prompt:
+        yield "Error: Please enter a basic prompt.", ""
+        return
+    # Partial JSON isn't worth showing, and a micro-batch reply only arrives whole: return the result in one go
+    if STRUCTURED_OUTPUT or MICRO_BATCH_ENABLED:
+        yield enhance_prompt(prompt, style, nsfw, token_level, checkpoint, lora, style_tag_entry, request)
+        return
+    settings = similar_settings(style, nsfw, token_level, checkpoint, lora, style_tag_entry)
+    cached = cached_similar(prompt, settings)
+    if cached:
+        yield cached[:2]
+        return
+
+    try:
+        lora_triggers = load_lora_triggers()
+        lora_trigger = get_lora_trigger(lora, lora_triggers) if lora else ""
+        style_tag_prefix, negative_prompt = parse_style_tag(style_tag_entry)
+
+        messages = build_messages(prompt, style, nsfw, token_level)
+        result = speculators.get(session_id(request)).take(_payload_key(messages)) if SPECULATIVE_ENABLED else None
+        if result:
+            enhanced_ai_part = result[0]
+        else:
+            enhanced_ai_part = ""
+            with request_scheduler.slot(session_id(request)):
+                for chunk in stream_ollama(messages):
+                    enhanced_ai_part += chunk
+                    yield enhanced_ai_part, negative_prompt
+
+        final_prompt = assemble_prompt(enhanced_ai_part.strip(), lora, style_tag_prefix, lora_trigger)
+        result = f"--checkpoint {checkpoint}\n{final_prompt}", negative_prompt
+        if SIMILAR_CACHE_ENABLED:
+            similar_cache.put(settings, prompt, result)
+        yield result
+    except Exception as e:
+        error_msg = format_error(e)
         print(error_msg)
-        return error_msg, ""
+        yield error_msg, ""
+    finally:
+        print(f"Ollama backend: {backend_stats()}")
+
+
+def enhance_prompt_cascade(prompt, style, nsfw, token_level, checkpoint, lora, style_tag_entry,
+                           request: gr.Request = None):
+    """Gradio generator for cascade mode: the draft right away, then the refined prompt if needed.
+
+    Also outputs the raw draft so the Refine button can refine it on request.
+    """
+    if not prompt:
+        yield "Error: Please enter a basic prompt.", "", ""
+        return
+    settings = similar_settings(style, nsfw, token_level, checkpoint, lora, style_tag_entry)
+    cached = cached_similar(prompt, settings)
+    if cached:
+        yield cached[0], cached[1], cached[2] if len(cached) > 2 else ""
+        return
+
+    try:
+        lora_triggers = load_lora_triggers()
+        lora_trigger = get_lora_trigger(lora, lora_triggers) if lora else ""
+        style_tag_prefix, negative_prompt = parse_style_tag(style_tag_entry)
+        messages = build_messages(prompt, style, nsfw, token_level)
+
+        with request_scheduler.slot(session_id(request)):
+            draft = draft_enhancement(messages)
+        final_prompt = assemble_prompt(draft, lora, style_tag_prefix, lora_trigger)
+        result = f"--checkpoint {checkpoint}\n{final_prompt}", negative_prompt, draft
+        yield result
+
+        problems = draft_problems(draft, token_level)
+        if problems and CASCADE_AUTO_REFINE:
+            print(f"Refining draft with {LOCAL_LLM_MODEL}: {'; '.join(problems)}")
+            with request_scheduler.slot(session_id(request)):
+                refined = refine_enhancement(messages, draft, problems)
+            final_prompt = assemble_prompt(refined, lora, style_tag_prefix, lora_trigger)
+            result = f"--checkpoint {checkpoint}\n{final_prompt}", negative_prompt, draft
+            yield result
+        else:
+            cascade_stats.record_skip()
+        if SIMILAR_CACHE_ENABLED:
+            similar_cache.put(settings, prompt, result)
     except Exception as e:
-        error_msg = f"An unexpected error occurred: {type(e).__name__}: {e}"
+        error_msg = format_error(e)
         print(error_msg)
-        return error_msg, ""
+        yield error_msg, "", ""
+    finally:
+        print(f"Ollama backend: {backend_stats()}")
 
 
+def refine_prompt(prompt, style, nsfw, token_level, checkpoint, lora, style_tag_entry, draft,
+                  request: gr.Request = None):
+    """Refine button: has the large model rewrite the last draft regardless of the checks."""
+    if not prompt or not draft:
+        return "Error: Enhance a prompt first.", ""
+
+    try:
+        lora_triggers = load_lora_triggers()
+        lora_trigger = get_lora_trigger(lora, lora_triggers) if lora else ""
+        style_tag_prefix, negative_prompt = parse_style_tag(style_tag_entry)
+        messages = build_messages(prompt, style, nsfw, token_level)
+        with request_scheduler.slot(session_id(request)):
+            refined = refine_enhancement(messages, draft, draft_problems(draft, token_level))
+        final_prompt = assemble_prompt(refined, lora, style_tag_prefix, lora_trigger)
+        result = f"--checkpoint {checkpoint}\n{final_prompt}", negative_prompt
+        if SIMILAR_CACHE_ENABLED:
+            similar_cache.put(similar_settings(style, nsfw, token_level, checkpoint, lora, style_tag_entry),
+                              prompt, result + (draft,))
+        return result
+    except Exception as e:
+        error_msg = format_error(e)
+        print(error_msg)
+        return error_msg, ""
+
 
 def save_to_file(positive, negative):
     if not positive:
@@ -213,11 +672,77 @@ def save_to_file(positive, negative):
         return f"Failed to save:\n{e}"
 
 
-def refresh_loras():
-    global loras, lora_triggers  # Declare global variables
+def dropdown_page(catalog, label, query, page, value, allowed=None):
+    """(dropdown update with one page of matching names, page). The current value stays selectable."""
+    names, page, total = catalog.page(query or "", int(page or 0), allowed=allowed)
+    choices = [""] + ([value] if value and value not in names else []) + names
+    return gr.Dropdown.update(choices=choices, value=value, label=page_label(label, page, len(names), total)), page
+
+
+def lora_page(query, checkpoint, lora, page=0):
+    allowed = set(model_index.compatible_loras(checkpoint, lora_catalog.names)) if checkpoint else None
+    return dropdown_page(lora_catalog, "LoRA", query, page, lora, allowed)
+
+
+def next_lora_page(query, checkpoint, lora, page):
+    return lora_page(query, checkpoint, lora, page + 1)
+
+
+def checkpoint_page(query, checkpoint, page=0):
+    return dropdown_page(checkpoint_catalog, "Checkpoint", query, page, checkpoint)
+
+
+def next_checkpoint_page(query, checkpoint, page):
+    return checkpoint_page(query, checkpoint, page + 1)
+
+
+def style_tag_page(query, style_tag, page=0):
+    return dropdown_page(style_tag_catalog, "Style Tag", query, page, style_tag)
+
+
+def next_style_tag_page(query, style_tag, page):
+    return style_tag_page(query, style_tag, page + 1)
+
+
+def refresh_loras(checkpoint="", query="", lora=""):
+    """Refresh button: re-reads the LoRA folder, trigger headers and model index. Nothing else scans the disk."""
+    global loras, lora_triggers, catalog_triggers  # Declare global variables
+    catalog_triggers = None
+    scanned_lora_triggers(rescan=True)
     lora_triggers = load_lora_triggers()
     loras = load_loras()
-    return gr.Dropdown.update(choices=[""] + loras)
+    lora_catalog.set(loras)
+    model_index.scan(LORA_PATH, CHECKPOINT_PATH)
+    return lora_page(query, checkpoint, lora)
+
+
+def filter_loras_for_checkpoint(checkpoint, lora, query=""):
+    """Checkpoint change: filters by the in-memory model index (built at startup and on 🔄)."""
+    if lora and lora not in model_index.compatible_loras(checkpoint, [lora]):
+        lora = ""
+    return lora_page(query, checkpoint, lora)
+
+
+def suggest_for_prompt(prompt):
+    if not lora_suggester:
+        return gr.Radio.update(choices=[]), gr.Radio.update(choices=[])
+    if lora_suggester.sources_changed(LORA_TRIGGER_PATH, LORA_PATH, STYLE_PATH,
+                                      min_interval=SUGGEST_SOURCES_CHECK_SECONDS):
+        lora_suggester.refresh(load_loras(), load_lora_triggers(), load_style_tags())
+    suggestions = lora_suggester.suggest(prompt or "", k=SUGGEST_TOP_K)
+    lora_choices = [name for name, _ in suggestions["loras"]]
+    style_choices = [entry.split("::", 1)[0] for entry, _ in suggestions["styles"]]
+    return gr.Radio.update(choices=lora_choices, value=None), gr.Radio.update(choices=style_choices, value=None)
+
+
+def apply_lora_suggestion(lora_name):
+    return gr.Dropdown.update(value=lora_name) if lora_name else gr.Dropdown.update()
+
+
+def apply_style_suggestion(style_name):
+    if not style_name or not lora_suggester:
+        return gr.Dropdown.update()
+    return gr.Dropdown.update(value=style_name if style_name in lora_suggester.style_entries else "")
 
 
 # --- Gradio UI ---
@@ -229,8 +754,13 @@ if __name__ == "__main__":
         exit()
 
     loras = load_loras()  # Load outside the interface
-    checkpoints = load_checkpoints()
-    style_tags = load_style_tags()
+    lora_catalog.set(loras)
+    checkpoint_catalog.set(load_checkpoints())
+    index_style_tags(load_style_tags())
+    model_index.scan(LORA_PATH, CHECKPOINT_PATH)
+    first_checkpoints, _ = checkpoint_page("", "")
+    first_loras, _ = lora_page("", "", "")
+    first_style_tags, _ = style_tag_page("", "")
 
     with gr.Blocks() as iface:
         gr.Markdown("# Stable Diffusion Prompt Enhancer (Ollama)")
@@ -242,11 +772,29 @@ if __name__ == "__main__":
                 token_slider = gr.Slider(minimum=0, maximum=100, value=75, step=1, label="Conciseness")
                 nsfw_checkbox = gr.Checkbox(label="NSFW Mode")
             with gr.Column(scale=2):
-                checkpoint_select = gr.Dropdown(choices=[""] + checkpoints, label="Checkpoint")
-                lora_select = gr.Dropdown(choices=[""] + [""] + loras, label="LoRA", allow_custom_value=True)
-                style_tag_select = gr.Dropdown(choices=[""] + style_tags, label="Style Tag", allow_custom_value=True)
+                # Only the first page of each catalog is sent with the page; search and ▸ fetch more
+                with gr.Row():
+                    checkpoint_select = gr.Dropdown(choices=first_checkpoints["choices"], label=first_checkpoints["label"], scale=4)
+                    checkpoint_search = gr.Textbox(placeholder="Search checkpoints", show_label=False, scale=2)
+                    checkpoint_more = gr.Button("▸", scale=0, min_width=40)
+                with gr.Row():
+                    lora_select = gr.Dropdown(choices=first_loras["choices"], label=first_loras["label"], allow_custom_value=True, scale=4)
+                    lora_search = gr.Textbox(placeholder="Search LoRAs", show_label=False, scale=2)
+                    lora_more = gr.Button("▸", scale=0, min_width=40)
+                    lora_refresh = gr.Button("🔄", scale=0, min_width=40)
+                with gr.Row():
+                    style_tag_select = gr.Dropdown(choices=first_style_tags["choices"], label=first_style_tags["label"], allow_custom_value=True, scale=4)
+                    style_tag_search = gr.Textbox(placeholder="Search style tags", show_label=False, scale=2)
+                    style_tag_more = gr.Button("▸", scale=0, min_width=40)
+                checkpoint_page_state = gr.State(0)
+                lora_page_state = gr.State(0)
+                style_tag_page_state = gr.State(0)
+                lora_suggestions = gr.Radio(choices=[], label="Suggested LoRAs")
+                style_suggestions = gr.Radio(choices=[], label="Suggested Style Tags")
 
         enhance_button = gr.Button("✨ Enhance Prompt ✨")
+        refine_button = gr.Button(f"Refine with {LOCAL_LLM_MODEL}", visible=CASCADE_ENABLED)
+        draft_state = gr.State("")  # Raw draft of the last cascade run
 
         with gr.Row():
             positive_output = gr.Textbox(label="Enhanced Prompt", lines=4)
@@ -255,11 +803,24 @@ if __name__ == "__main__":
         save_button = gr.Button("Save to File")
         save_status = gr.Textbox(label="Save Status", visible=False)  # Hidden textbox for status
 
-        enhance_button.click(
-            enhance_prompt,
-            inputs=[prompt_input, style_select, nsfw_checkbox, token_slider, checkpoint_select, lora_select, style_tag_select],
-            outputs=[positive_output, negative_output]
-        )
+        enhance_inputs = [prompt_input, style_select, nsfw_checkbox, token_slider, checkpoint_select, lora_select, style_tag_select]
+        if CASCADE_ENABLED:
+            enhance_button.click(
+                enhance_prompt_cascade,
+                inputs=enhance_inputs,
+                outputs=[positive_output, negative_output, draft_state]
+            )
+            refine_button.click(
+                refine_prompt,
+                inputs=enhance_inputs + [draft_state],
+                outputs=[positive_output, negative_output]
+            )
+        else:
+            enhance_button.click(
+                enhance_prompt_stream,
+                inputs=enhance_inputs,
+                outputs=[positive_output, negative_output]
+            )
 
         save_button.click(
             save_to_file,
@@ -267,11 +828,49 @@ if __name__ == "__main__":
             outputs=[save_status]
         )
 
-        lora_select.change(  # Changed from .click() to .change()
+        prompt_input.change(
+            suggest_for_prompt,
+            inputs=[prompt_input],
+            outputs=[lora_suggestions, style_suggestions]
+        )
+        lora_suggestions.change(apply_lora_suggestion, inputs=[lora_suggestions], outputs=[lora_select])
+        style_suggestions.change(apply_style_suggestion, inputs=[style_suggestions], outputs=[style_tag_select])
+
+        if SPECULATIVE_ENABLED:  # Debounced server-side; these events bypass the queue
+            for component in (prompt_input, style_select, nsfw_checkbox, token_slider):
+                component.change(speculate, inputs=[prompt_input, style_select, nsfw_checkbox, token_slider],
+                                 outputs=None, queue=False)
+
+        # Rescanning on every pick made selection and checkpoint filtering wait on the disk; only 🔄 rescans
+        lora_refresh.click(
             refresh_loras,
-            outputs=[lora_select]
+            inputs=[checkpoint_select, lora_search, lora_select],
+            outputs=[lora_select, lora_page_state]
+        )
+
+        checkpoint_select.change(
+            filter_loras_for_checkpoint,
+            inputs=[checkpoint_select, lora_select, lora_search],
+            outputs=[lora_select, lora_page_state]
         )
 
+        # Server-side search and paging; these only touch in-memory catalogs, so they skip the queue
+        checkpoint_search.change(checkpoint_page, inputs=[checkpoint_search, checkpoint_select],
+                                 outputs=[checkpoint_select, checkpoint_page_state], queue=False)
+        checkpoint_more.click(next_checkpoint_page, inputs=[checkpoint_search, checkpoint_select, checkpoint_page_state],
+                              outputs=[checkpoint_select, checkpoint_page_state], queue=False)
+        lora_search.change(lora_page, inputs=[lora_search, checkpoint_select, lora_select],
+                           outputs=[lora_select, lora_page_state], queue=False)
+        lora_more.click(next_lora_page, inputs=[lora_search, checkpoint_select, lora_select, lora_page_state],
+                        outputs=[lora_select, lora_page_state], queue=False)
+        style_tag_search.change(style_tag_page, inputs=[style_tag_search, style_tag_select],
+                                outputs=[style_tag_select, style_tag_page_state], queue=False)
+        style_tag_more.click(next_style_tag_page, inputs=[style_tag_search, style_tag_select, style_tag_page_state],
+                             outputs=[style_tag_select, style_tag_page_state], queue=False)
+
+    # JSON API for automation, next to the UI; shares the fair scheduler with it
+    serve_api(run_enhancement, format_error, stats_fn=backend_stats, scheduler=request_scheduler, styles=STYLES)
+    iface.queue()  # Required for streaming generator handlers
     iface.launch()
 
     print("Gradio interface launched. Visit the URL in your browser to use the Prompt Enhancer.")
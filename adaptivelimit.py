@@ -0,0 +1,161 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import requests
+
+RETRY_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.5  # Seconds; doubled per attempt before jitter
+RETRY_MAX_DELAY = 30.0
+RETRY_BUDGET_SECONDS = 60.0  # Total time call() may spend on failed attempts and backoff before giving up
+
+OVERLOAD = "overload"  # Backend is saturated: shrink concurrency and retry
+TIMEOUT = "timeout"  # No answer within the request timeout: shrink concurrency, but don't wait that long again
+FATAL = "fatal"  # Anything else: surface immediately
+
+
+def parse_retry_after(value):
+    """Retry-After header (delta seconds or HTTP date) -> seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff; a server-provided Retry-After takes precedence."""
+    if retry_after is not None:
+        return min(RETRY_MAX_DELAY, retry_after) + random.uniform(0, RETRY_BASE_DELAY)
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def classify_requests_error(e):
+    """(kind, retry_after) for errors from requests.post against Ollama or another HTTP backend."""
+    if isinstance(e, requests.exceptions.ReadTimeout):
+        return TIMEOUT, None
+    if isinstance(e, requests.exceptions.Timeout):  # Connect timeout: quick to fail, worth retrying
+        return OVERLOAD, None
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+        if e.response.status_code in (429, 502, 503, 504):
+            return OVERLOAD, parse_retry_after(e.response.headers.get("Retry-After"))
+    return FATAL, None
+
+
+class AdaptiveLimiter:
+    """Concurrency limit for one backend, adjusted with AIMD plus a latency gradient.
+
+    The limit grows by ~1 per round trip while calls succeed at normal latency and
+    the limit is actually in use. It is halved on overload signals (429/503,
+    timeouts) and trimmed by 10% when latency climbs well above the observed
+    baseline, so throughput stays near what the backend can really serve.
+    Read timeouts count as overload but are not retried.
+    """
+
+    def __init__(self, name, initial_limit=4, min_limit=1, max_limit=32, latency_tolerance=2.0):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.baseline_latency = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.overloads = 0
+        self.retries = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        with self._cond:
+            self.waiting += 1
+            try:
+                if not self._cond.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                    return False
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            return True
+
+    def has_spare_capacity(self):
+        """True when no caller is waiting and a slot is free; used to gate low-priority work."""
+        with self._cond:
+            return self.waiting == 0 and self.in_flight < int(self.limit)
+
+    def release(self, latency=None, overloaded=False):
+        with self._cond:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            if overloaded:
+                self.overloads += 1
+                self.limit = max(self.min_limit, self.limit * 0.5)
+            elif latency is not None:
+                if self.baseline_latency is None or latency < self.baseline_latency:
+                    self.baseline_latency = latency
+                else:
+                    self.baseline_latency += 0.01 * (latency - self.baseline_latency)  # Let the baseline drift up slowly
+                if latency > self.baseline_latency * self.latency_tolerance:
+                    self.limit = max(self.min_limit, self.limit * 0.9)
+                elif saturated:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, classify=classify_requests_error):
+        """Holds one slot for the body (e.g. a whole stream); no retries."""
+        self.acquire()
+        start = time.monotonic()
+        succeeded = overloaded = False
+        try:
+            yield
+            succeeded = True
+        except Exception as e:
+            overloaded = classify(e)[0] in (OVERLOAD, TIMEOUT)
+            raise
+        finally: # Also runs when a consumer abandons a stream (GeneratorExit)
+            self.release(latency=time.monotonic() - start if succeeded else None, overloaded=overloaded)
+
+    def call(self, fn, classify=classify_requests_error, max_attempts=RETRY_MAX_ATTEMPTS, budget=RETRY_BUDGET_SECONDS):
+        """Runs fn() under the limit, retrying overload errors with jittered backoff.
+
+        Gives up once another backoff would take the whole call past budget seconds.
+        """
+        first_start = time.monotonic()
+        for attempt in range(max_attempts):
+            self.acquire()
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                kind, retry_after = classify(e)
+                self.release(overloaded=kind in (OVERLOAD, TIMEOUT))
+                if kind != OVERLOAD or attempt == max_attempts - 1:
+                    raise
+                delay = backoff_delay(attempt, retry_after)
+                if time.monotonic() - first_start + delay > budget:
+                    raise
+                with self._cond:
+                    self.retries += 1
+                print(f"{self.name} overloaded ({type(e).__name__}); retrying in {delay:.1f}s "
+                      f"with concurrency limit {int(self.limit)}")
+                time.sleep(delay)
+                continue
+            self.release(latency=time.monotonic() - start)
+            return result
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "baseline_latency": round(self.baseline_latency, 3) if self.baseline_latency else None,
+                "overloads": self.overloads,
+                "retries": self.retries,
+            }
@@ -0,0 +1,101 @@
+import re
+import threading
+import time
+from collections import deque
+
+LATENCY_WINDOW = 500  # Samples kept per stage for percentiles
+
+# Rough CLIP-token budget per conciseness bucket; SDXL sees 75 tokens per chunk
+_TOKEN_BUDGETS = [(25, 150), (50, 110), (75, 90), (101, 75)]
+
+_CLIP_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_PREAMBLE_RE = re.compile(r"^\s*(sure|here is|here's|certainly|okay|i can't|i cannot|i'm sorry|as an ai)\b", re.IGNORECASE)
+_MARKDOWN_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s|\*\*|^#", re.MULTILINE)
+_SENTENCE_END_RE = re.compile(r"[.!?](?:\s|$)")
+
+REFINE_INSTRUCTION = (
+    " You are given a draft written by a smaller model. Rewrite it so it follows these instructions exactly,"
+    " keeping its subject and best details. Reply with the improved prompt only."
+)
+
+
+def estimate_clip_tokens(text):
+    """Words and punctuation each count as one token, close to what CLIP's BPE produces for prompts."""
+    return len(_CLIP_TOKEN_RE.findall(text))
+
+
+def token_budget(token_level):
+    for upper, budget in _TOKEN_BUDGETS:
+        if token_level < upper:
+            return budget
+    return _TOKEN_BUDGETS[-1][1]
+
+
+def draft_problems(draft, token_level):
+    """Cheap checks on a draft; an empty list means the refine stage can be skipped."""
+    problems = []
+    if estimate_clip_tokens(draft) < 4:
+        return ["empty or too short"]
+    if _PREAMBLE_RE.match(draft):
+        problems.append("chatty preamble or refusal")
+    if _MARKDOWN_RE.search(draft) or "\n" in draft.strip():
+        problems.append("list or markdown formatting")
+    if estimate_clip_tokens(draft) > token_budget(token_level):
+        problems.append(f"over the {token_budget(token_level)} token budget")
+    if token_level >= 50:
+        longest = max(len(segment.split()) for segment in draft.split(","))
+        if _SENTENCE_END_RE.search(draft.rstrip(".")) or longest > (6 if token_level >= 75 else 10):
+            problems.append("full sentences where tags/short phrases were asked for")
+    elif token_level < 25 and not _SENTENCE_END_RE.search(draft):
+        problems.append("tags where full sentences were asked for")
+    return problems
+
+
+def refine_messages(messages, draft, problems=None):
+    """Messages asking the large model to rewrite a draft under the original instructions."""
+    system = messages[0]["content"] + REFINE_INSTRUCTION
+    if problems:
+        system += f" Fix these problems: {'; '.join(problems)}."
+    user = f"Base prompt: {messages[-1]['content']}\nDraft: {draft}"
+    return [{"role": "system", "content": system}, {"role": "user", "content": user}]
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class CascadeStats:
+    """Latency per stage (draft / refine) recorded separately, plus how often refining was skipped."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self.latencies = {"draft": deque(maxlen=window), "refine": deque(maxlen=window)}
+        self.counts = {"draft": 0, "refine": 0}
+        self.skipped = 0
+
+    def timed(self, stage, fn):
+        """Runs fn() and records its latency under stage."""
+        start = time.perf_counter()
+        result = fn()
+        with self._lock:
+            self.latencies[stage].append(time.perf_counter() - start)
+            self.counts[stage] += 1
+        return result
+
+    def record_skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def stats(self):
+        with self._lock:
+            stats = {"skipped_refines": self.skipped,
+                     "skip_rate": round(self.skipped / self.counts["draft"], 3) if self.counts["draft"] else 0.0}
+            for stage, samples in self.latencies.items():
+                stats[stage] = {
+                    "count": self.counts[stage],
+                    "mean": round(sum(samples) / len(samples), 3) if samples else None,
+                    "p50": round(_percentile(samples, 0.5), 3) if samples else None,
+                    "p95": round(_percentile(samples, 0.95), 3) if samples else None,
+                }
+            return stats
@@ -0,0 +1,90 @@
+import threading
+
+SUMMARY_PROMPT = (
+    "Summarize the following conversation so it can replace the original turns as context"
+    " for continuing the chat. Keep names, facts, decisions, open questions and user"
+    " preferences. Be concise.\n\n"
+)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token) used when the API gives no count."""
+    return max(1, len(text) // 4) if text else 0
+
+
+class ChatContext:
+    """Sliding window of recent chat turns plus a rolling summary of older ones.
+
+    Turns are kept verbatim until the total (summary + turns) exceeds
+    token_budget; the oldest turns are then folded into the summary, always
+    keeping at least min_recent_turns verbatim.
+    """
+
+    def __init__(self, token_budget=8000, min_recent_turns=4):
+        self.token_budget = token_budget
+        self.min_recent_turns = min_recent_turns
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.turns = [] # [{'user': str, 'model': str, 'tokens': int}]
+            self.summary = ""
+            self.summary_tokens = 0
+
+    def add_turn(self, user_text, model_text, model_tokens=None):
+        tokens = estimate_tokens(user_text) + (model_tokens or estimate_tokens(model_text))
+        with self._lock:
+            self.turns.append({'user': user_text, 'model': model_text, 'tokens': tokens})
+        return tokens
+
+    def total_tokens(self):
+        with self._lock:
+            return self.summary_tokens + sum(turn['tokens'] for turn in self.turns)
+
+    def over_budget(self):
+        return self.total_tokens() > self.token_budget
+
+    def compact(self, summarize_fn=None):
+        """Folds the oldest turns into the summary until under budget.
+
+        summarize_fn(text) -> str produces the new rolling summary; without it (or
+        if it fails) the old turns are simply dropped and the previous summary is
+        kept. Returns the number of turns removed from the window.
+        """
+        with self._lock:
+            total = self.summary_tokens + sum(turn['tokens'] for turn in self.turns)
+            evicted = []
+            while total > self.token_budget and len(self.turns) > self.min_recent_turns:
+                turn = self.turns.pop(0)
+                total -= turn['tokens']
+                evicted.append(turn)
+            previous_summary = self.summary
+        if not evicted:
+            return 0
+
+        transcript = "".join(f"User: {turn['user']}\nModel: {turn['model']}\n" for turn in evicted)
+        if previous_summary:
+            transcript = f"Earlier summary: {previous_summary}\n{transcript}"
+        summary = previous_summary
+        if summarize_fn:
+            try:
+                summary = summarize_fn(SUMMARY_PROMPT + transcript).strip()
+            except Exception as e:
+                print(f"Context summary failed, dropping old turns instead: {type(e).__name__}: {e}")
+        with self._lock:
+            self.summary = summary
+            self.summary_tokens = estimate_tokens(summary)
+        return len(evicted)
+
+    def history(self):
+        """Returns the bounded history in the [{'role': ..., 'parts': [...]}] shape start_chat expects."""
+        with self._lock:
+            history = []
+            if self.summary:
+                history.append({'role': 'user', 'parts': [f"Summary of our earlier conversation: {self.summary}"]})
+                history.append({'role': 'model', 'parts': ["Understood, I'll continue from that context."]})
+            for turn in self.turns:
+                history.append({'role': 'user', 'parts': [turn['user']]})
+                history.append({'role': 'model', 'parts': [turn['model']]})
+            return history
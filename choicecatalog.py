@@ -0,0 +1,59 @@
+import threading
+
+CHOICE_PAGE_SIZE = 50  # Choices sent to the browser per dropdown page
+
+
+class ChoiceCatalog:
+    """A sorted list of names that the UI searches and pages through server-side.
+
+    Only the current page of names goes to the browser, instead of the whole catalog
+    in the page config and in every dropdown update.
+    """
+
+    def __init__(self, names=()):
+        self._lock = threading.Lock()
+        self.set(names)
+
+    def set(self, names):
+        names = list(names)
+        folded = [name.casefold() for name in names]
+        with self._lock:
+            self.names = names
+            self._folded = folded
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def search(self, query="", allowed=None):
+        """Names containing every word of query; names starting with the query come first."""
+        with self._lock:
+            names, folded = self.names, self._folded
+        words = query.casefold().split()
+        if not words and allowed is None:
+            return names
+        phrase = " ".join(words)
+        prefix, other = [], []
+        for name, key in zip(names, folded):
+            if allowed is not None and name not in allowed:
+                continue
+            if all(word in key for word in words):
+                (prefix if phrase and key.startswith(phrase) else other).append(name)
+        return prefix + other
+
+    def page(self, query="", page=0, page_size=CHOICE_PAGE_SIZE, allowed=None):
+        """(names on the page, page number, total matches). Page numbers past the end wrap to the first page."""
+        matches = self.search(query, allowed)
+        pages = max(1, -(-len(matches) // page_size))
+        page = page % pages
+        return matches[page * page_size:(page + 1) * page_size], page, len(matches)
+
+
+def page_label(label, page, count, total, page_size=CHOICE_PAGE_SIZE):
+    """'LoRA (51-100 of 812)'; just the label when everything fits on one page."""
+    if total <= page_size:
+        return label
+    first = page * page_size + 1
+    return f"{label} ({first}-{first + count - 1} of {total})"
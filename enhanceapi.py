@@ -0,0 +1,252 @@
+import json
+import math
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fairqueue import BULK, INTERACTIVE
+
+# --- Configuration ---
+API_HOST = "127.0.0.1"
+API_PORT = 7861
+MAX_IN_FLIGHT = 4  # Concurrent backend calls across all API requests
+SLOT_WAIT_SECONDS = 5.0  # How long /enhance waits for a free slot before returning 503
+MAX_BATCH_SIZE = 1000
+RETRY_AFTER_SECONDS = 2
+
+
+class EnhanceAPI:
+    """JSON front-end for an enhancement function shaped like run_enhancement()."""
+
+    def __init__(self, enhance_fn, format_error=str, stats_fn=None, max_in_flight=MAX_IN_FLIGHT, scheduler=None,
+                 styles=None):
+        self.enhance_fn = enhance_fn
+        self.format_error = format_error
+        self.stats_fn = stats_fn
+        self.styles = styles  # Known style names; unknown ones are rejected with 400 instead of failing in the backend
+        self.max_in_flight = max_in_flight
+        self.scheduler = scheduler  # Optional FairScheduler shared with the UI
+        # Bounded slots are the backpressure: nothing reaches the backend without one
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        # Batches never hold more than half the slots, so single requests aren't turned away with 503
+        self.batch_slots = threading.BoundedSemaphore(max(1, max_in_flight // 2))
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="enhance-api")
+
+    def parse_item(self, item, defaults=None):
+        """enhance_fn arguments for a JSON item. Raises ValueError with a message for the client."""
+        if not isinstance(item, dict):
+            raise ValueError(f"Each item must be a JSON object or a prompt string, got {type(item).__name__}.")
+        params = dict(defaults or {})
+        params.update(item)
+        prompt = params.get("prompt", "")
+        if not isinstance(prompt, str):
+            raise ValueError(f"'prompt' must be a string, got {type(prompt).__name__}.")
+        prompt = prompt.strip()
+        if not prompt:
+            raise ValueError("Missing 'prompt'.")
+        style = params.get("style", "Visual Detail")
+        if self.styles is not None and style not in self.styles:
+            raise ValueError(f"Unknown style '{style}'. Use one of: {', '.join(self.styles)}.")
+        try:
+            conciseness = float(params.get("conciseness", 75))
+        except (TypeError, ValueError):
+            conciseness = math.nan
+        if not math.isfinite(conciseness):
+            raise ValueError(f"'conciseness' must be a number, got {params.get('conciseness')!r}.")
+        nsfw = params.get("nsfw", False)
+        if not isinstance(nsfw, bool):  # The string "false" would otherwise switch NSFW mode on
+            raise ValueError("'nsfw' must be true or false.")
+        return (prompt, style, nsfw, conciseness,
+                params.get("checkpoint", ""), params.get("lora", ""), params.get("style_tag", ""))
+
+    def enhance_one(self, item, defaults=None, session="api", priority=INTERACTIVE):
+        """Runs one enhancement from a JSON item. The caller must hold a slot."""
+        try:
+            args = self.parse_item(item, defaults)
+        except ValueError as e:
+            return {"error": str(e)}
+        try:
+            with self.scheduler.slot(session, priority) if self.scheduler else nullcontext():
+                positive, negative = self.enhance_fn(*args)
+            return {"positive": positive, "negative": negative}
+        except Exception as e:
+            return {"error": self.format_error(e)}
+
+    def _run_with_slot(self, index, item, defaults, session):
+        try:
+            result = self.enhance_one(item, defaults, session, BULK)
+        finally:
+            self.slots.release()
+            self.batch_slots.release()
+        result["index"] = index
+        return result
+
+    def iter_batch(self, items, defaults, session="api", stop=None):
+        """Yields results as they complete. Submission blocks while all batch slots are busy.
+
+        Setting stop (or closing the generator) keeps the remaining items from being submitted.
+        """
+        results = queue.Queue()
+        stop = stop or threading.Event()
+
+        def feed():
+            for index, item in enumerate(items):
+                self.batch_slots.acquire()
+                self.slots.acquire()
+                if stop.is_set():  # Client went away while we waited for the slots
+                    self.slots.release()
+                    self.batch_slots.release()
+                    return
+                future = self.executor.submit(self._run_with_slot, index, item, defaults, session)
+                future.add_done_callback(lambda f: results.put(f.result()))
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        try:
+            for _ in range(len(items)):
+                yield results.get()
+        finally:
+            stop.set()
+
+
+def _make_handler(api):
+    class EnhanceRequestHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _session(self):
+            """Fair-queuing key: the API key if the client sends one, else its address."""
+            return self.headers.get("X-API-Key") or self.client_address[0]
+
+        def _read_json(self):
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                self._send_json(400, {"error": "Invalid Content-Length header."})
+                return None
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError as e:
+                self._send_json(400, {"error": f"Invalid JSON: {e}"})
+                return None
+            if not isinstance(body, dict):
+                self._send_json(400, {"error": "Request body must be a JSON object."})
+                return None
+            return body
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok", "max_in_flight": api.max_in_flight})
+            elif self.path == "/stats":
+                self._send_json(200, api.stats_fn() if api.stats_fn else {})
+            else:
+                self._send_json(404, {"error": f"Unknown endpoint: {self.path}"})
+
+        def do_POST(self):
+            if self.path == "/enhance":
+                self._handle_enhance()
+            elif self.path == "/enhance/batch":
+                self._handle_batch()
+            else:
+                self._send_json(404, {"error": f"Unknown endpoint: {self.path}"})
+
+        def _handle_enhance(self):
+            body = self._read_json()
+            if body is None:
+                return
+            try:
+                api.parse_item(body)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            if not api.slots.acquire(timeout=SLOT_WAIT_SECONDS):
+                self._send_json(503, {"error": "Backend is saturated, retry later."},
+                                {"Retry-After": str(RETRY_AFTER_SECONDS)})
+                return
+            try:
+                result = api.enhance_one(body, session=self._session())
+            finally:
+                api.slots.release()
+            self._send_json(502 if "error" in result else 200, result)
+
+        def _handle_batch(self):
+            body = self._read_json()
+            if body is None:
+                return
+            items = body.get("items")
+            if items is None:
+                items = [{"prompt": p} for p in body.get("prompts", [])]
+            if not isinstance(items, list) or not items:
+                self._send_json(400, {"error": "Provide a non-empty 'prompts' or 'items' list."})
+                return
+            if len(items) > MAX_BATCH_SIZE:
+                self._send_json(413, {"error": f"Batch too large (max {MAX_BATCH_SIZE})."})
+                return
+            items = [{"prompt": item} if isinstance(item, str) else item for item in items]
+            defaults = {k: v for k, v in body.items() if k not in ("items", "prompts")}
+
+            # Stream NDJSON without Content-Length; the connection closes when the batch is done
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            stop = threading.Event()
+            try:
+                for result in api.iter_batch(items, defaults, self._session(), stop):
+                    self.wfile.write((json.dumps(result) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                stop.set()  # Don't start the remaining items for nobody
+                print("Batch client disconnected before all results were sent.")
+
+        def log_message(self, format, *args):
+            print(f"[API] {self.address_string()} - {format % args}")
+
+    return EnhanceRequestHandler
+
+
+def serve_api(enhance_fn, format_error=str, stats_fn=None, host=API_HOST, port=API_PORT, background=True, sock=None,
+              scheduler=None, styles=None):
+    """Starts the JSON API. Returns the server; blocks unless background is True.
+
+    With sock, accepts on an already listening socket (shared by several worker processes).
+    With scheduler, single requests and batch items are fair-queued per API key or client.
+    With styles, requests naming any other style are rejected with 400.
+    """
+    api = EnhanceAPI(enhance_fn, format_error, stats_fn, scheduler=scheduler, styles=styles)
+    if sock is None:
+        server = ThreadingHTTPServer((host, port), _make_handler(api))
+    else:
+        server = ThreadingHTTPServer(sock.getsockname()[:2], _make_handler(api), bind_and_activate=False)
+        server.socket.close()
+        server.socket = sock
+    server.daemon_threads = True
+    host, port = server.server_address[:2]
+    print(f"Enhancement API listening on http://{host}:{port} (/enhance, /enhance/batch)")
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+# --- Headless Execution ---
+if __name__ == "__main__":
+    from PromptEnhanceWeb import STYLES, run_enhancement, format_error, backend_stats, request_scheduler
+
+    try:
+        serve_api(run_enhancement, format_error, backend_stats, background=False, scheduler=request_scheduler,
+                  styles=STYLES)
+    except KeyboardInterrupt:
+        print("API server stopped.")
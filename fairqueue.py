@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+INTERACTIVE = "interactive"  # One prompt typed into the UI or sent to /enhance
+BULK = "bulk"  # Batches, sweeps and other long runs
+PRIORITIES = (INTERACTIVE, BULK)
+
+SESSION_MAX_IN_FLIGHT = 2  # Backend calls one session (browser tab or API key) may have running
+BULK_EVERY = 8  # While both classes wait, every 8th dispatch goes to bulk so it never starves
+WAIT_WINDOW = 2000  # Queue-wait samples kept per class for percentiles
+_RECHECK_SECONDS = 0.25  # Waiters re-check a capacity callable that may have grown
+
+
+class QueueTimeout(RuntimeError):
+    """No backend slot became free within the timeout."""
+
+
+class _Waiter:
+    __slots__ = ("session", "priority", "enqueued", "granted")
+
+    def __init__(self, session, priority):
+        self.session = session
+        self.priority = priority
+        self.enqueued = time.perf_counter()
+        self.granted = False
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class FairScheduler:
+    """Orders backend calls by priority class, then round-robin across sessions.
+
+    Interactive requests go before bulk ones, and within a class each session gets a turn
+    in rotation, so one user's long run can't push everyone else to the back. A session
+    never has more than its cap running at once. capacity may be a callable (e.g. the
+    adaptive limiter's current limit) so requests queue here, in fair order, rather than
+    inside the limiter. A caller that hands its backend call to someone else (a micro-batch)
+    can park its slot so it stops counting against capacity while it waits.
+    """
+
+    def __init__(self, capacity, session_limit=SESSION_MAX_IN_FLIGHT, session_limits=None, bulk_every=BULK_EVERY,
+                 window=WAIT_WINDOW):
+        self.capacity = capacity if callable(capacity) else (lambda: capacity)
+        self.session_limit = session_limit
+        self.session_limits = dict(session_limits or {})  # Per-session (API key) overrides
+        self.bulk_every = bulk_every
+        self._cond = threading.Condition()
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}  # session -> deque of waiters
+        self._running = {}  # session -> calls in flight
+        self._held = threading.local()  # Slots held by the current thread, so parked() knows it has one
+        self.in_flight = 0
+        self._interactive_streak = 0
+        self.waits = {priority: deque(maxlen=window) for priority in PRIORITIES}
+        self.counts = {priority: 0 for priority in PRIORITIES}
+        self.timeouts = {priority: 0 for priority in PRIORITIES}
+
+    def limit_for(self, session):
+        return self.session_limits.get(session, self.session_limit)
+
+    # --- Dispatch (called with the condition held) ---
+    def _next_waiter(self, priority):
+        sessions = self._queues[priority]
+        for session, waiters in sessions.items():
+            if self._running.get(session, 0) < self.limit_for(session):
+                waiter = waiters.popleft()
+                if waiters:
+                    sessions.move_to_end(session)  # Its next request waits for the other sessions' turns
+                else:
+                    del sessions[session]
+                return waiter
+        return None
+
+    def _dispatch(self):
+        granted = False
+        while self.in_flight < max(1, int(self.capacity())):
+            order = PRIORITIES
+            if self._interactive_streak >= self.bulk_every:
+                order = (BULK, INTERACTIVE)
+            waiter = None
+            for priority in order:
+                waiter = self._next_waiter(priority)
+                if waiter:
+                    break
+            if waiter is None:
+                break
+            self._interactive_streak = self._interactive_streak + 1 if waiter.priority == INTERACTIVE else 0
+            waiter.granted = True
+            self.in_flight += 1
+            self._running[waiter.session] = self._running.get(waiter.session, 0) + 1
+            self.waits[waiter.priority].append(time.perf_counter() - waiter.enqueued)
+            self.counts[waiter.priority] += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _remove(self, waiter):
+        waiters = self._queues[waiter.priority].get(waiter.session)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._queues[waiter.priority][waiter.session]
+
+    # --- Public API ---
+    def acquire(self, session, priority=INTERACTIVE, timeout=None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}' (use {', '.join(PRIORITIES)})")
+        waiter = _Waiter(session, priority)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._queues[priority].setdefault(session, deque()).append(waiter)
+            self._dispatch()
+            while not waiter.granted:
+                remaining = _RECHECK_SECONDS if deadline is None else min(_RECHECK_SECONDS, deadline - time.monotonic())
+                if remaining <= 0:
+                    self._remove(waiter)
+                    self.timeouts[priority] += 1
+                    raise QueueTimeout(f"No backend slot for {priority} request within {timeout}s")
+                self._cond.wait(remaining)
+                if not waiter.granted:
+                    self._dispatch()  # Capacity may have grown without a release
+
+    def release(self, session):
+        with self._cond:
+            self.in_flight -= 1
+            running = self._running.get(session, 0) - 1
+            if running > 0:
+                self._running[session] = running
+            else:
+                self._running.pop(session, None)
+            self._dispatch()
+
+    def has_spare_capacity(self):
+        """True when nothing is queued and a slot is free; used to gate speculative work."""
+        with self._cond:
+            queued = any(self._queues[priority] for priority in PRIORITIES)
+            return not queued and self.in_flight < max(1, int(self.capacity()))
+
+    @contextmanager
+    def slot(self, session, priority=INTERACTIVE, timeout=None):
+        self.acquire(session, priority, timeout)
+        self._held.count = getattr(self._held, "count", 0) + 1
+        try:
+            yield
+        finally:
+            self._held.count -= 1
+            self.release(session)
+
+    @contextmanager
+    def parked(self):
+        """Stops the current thread's slot counting against capacity while it waits on a call
+        that takes a slot of its own (e.g. a shared micro-batch). The session keeps its place
+        against its cap. A no-op outside slot().
+        """
+        if not getattr(self._held, "count", 0):
+            yield
+            return
+        with self._cond:
+            self.in_flight -= 1
+            self._dispatch()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight += 1
+
+    def stats(self):
+        """Queue wait per class (seconds), plus what is queued and running right now."""
+        with self._cond:
+            stats = {"capacity": max(1, int(self.capacity())), "in_flight": self.in_flight,
+                     "sessions_running": len(self._running)}
+            for priority in PRIORITIES:
+                samples = self.waits[priority]
+                stats[priority] = {
+                    "dispatched": self.counts[priority],
+                    "queued": sum(len(w) for w in self._queues[priority].values()),
+                    "timeouts": self.timeouts[priority],
+                    "wait_p50": round(_percentile(samples, 0.5), 4) if samples else None,
+                    "wait_p95": round(_percentile(samples, 0.95), 4) if samples else None,
+                    "wait_p99": round(_percentile(samples, 0.99), 4) if samples else None,
+                    "wait_max": round(max(samples), 4) if samples else None,
+                }
+            return stats
@@ -0,0 +1,265 @@
+import argparse
+import json
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+EXPORT_FORMATS = ("wildcard", "list", "jsonl")
+SHARD_SIZE = 10000  # Records per output file; 0 writes a single file per format
+EXPORT_WORKERS = 4
+LORA_EXTENSION = ".safetensors"
+
+_CHECKPOINT_RE = re.compile(r"^\s*--checkpoint[ \t]*([^\n]*)\n?")
+_LORA_TAG_RE = re.compile(r"<lora:([^:>]+):([-0-9.]+)>")
+
+
+def parse_enhanced(positive, negative=""):
+    """Splits an enhancer result ('--checkpoint X' header, inline <lora:name:w> tags) into job fields."""
+    checkpoint = ""
+    match = _CHECKPOINT_RE.match(positive)
+    if match:
+        checkpoint = match.group(1).strip()
+        positive = positive[match.end():]
+    loras = [(name, float(weight)) for name, weight in _LORA_TAG_RE.findall(positive)]
+    prompt = _LORA_TAG_RE.sub("", positive)
+    prompt = re.sub(r"\s*,\s*(,\s*)+", ", ", " ".join(prompt.split())).strip(" ,")
+    return {"prompt": prompt, "negative_prompt": " ".join(negative.split()),
+            "checkpoint": checkpoint, "loras": loras}
+
+
+def to_fooocus_job(record):
+    """JSONL job in the request shape used by Fooocus-API (base_model_name, loras with model_name/weight)."""
+    job = {"prompt": record["prompt"], "negative_prompt": record["negative_prompt"]}
+    if record["checkpoint"]:
+        job["base_model_name"] = record["checkpoint"]
+    if record["loras"]:
+        job["loras"] = [{"model_name": name if name.endswith(LORA_EXTENSION) else name + LORA_EXTENSION, "weight": weight}
+                        for name, weight in record["loras"]]
+    return job
+
+
+def to_prompt_line(record):
+    """One-line prompt with LoRAs inline, as typed into Fooocus."""
+    tags = [f"<lora:{name}:{weight:g}>" for name, weight in record["loras"]]
+    return ", ".join(tags + [record["prompt"]]) if record["prompt"] else ", ".join(tags)
+
+
+class _ShardedWriter:
+    """Appends lines to path_for(shard), moving to the next shard every shard_size lines."""
+
+    def __init__(self, path_for, shard_size):
+        self.path_for = path_for
+        self.shard_size = shard_size
+        self.shard = 0
+        self.lines = 0
+        self.file = None
+        self.paths = []
+
+    def write(self, line):
+        if self.file is None or (self.shard_size and self.lines >= self.shard_size):
+            self._rotate()
+        self.file.write(line + "\n")
+        self.lines += 1
+
+    def _rotate(self):
+        if self.file is not None:
+            self.file.close()
+            self.shard += 1
+        path = Path(self.path_for(self.shard))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(path, "w", encoding="utf-8")
+        self.paths.append(path)
+        self.lines = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class FooocusExporter:
+    """Streams enhancement results into Fooocus files without holding them in memory.
+
+    - wildcard: wildcards/<name>.txt, one prompt per line (no LoRA tags), usable as __<name>__
+    - list: <name>_prompts.txt with LoRAs inline, plus a line-aligned <name>_negative.txt
+    - jsonl: <name>.jsonl, one job per line with checkpoint, LoRAs and negative prompt
+    With sharding, each file gets a _0000, _0001, ... suffix per shard_size records.
+    """
+
+    def __init__(self, out_dir, name="enhanced", formats=EXPORT_FORMATS, shard_size=SHARD_SIZE):
+        unknown = set(formats) - set(EXPORT_FORMATS)
+        if unknown:
+            raise ValueError(f"Unknown export format(s): {', '.join(sorted(unknown))}")
+        self.out_dir = Path(out_dir)
+        self.formats = tuple(formats)
+        self.written = 0
+        self.skipped = 0
+
+        def path_for(template):
+            return lambda shard: self.out_dir / template.format(suffix=f"_{shard:04d}" if shard_size else "")
+
+        self.writers = {}
+        if "wildcard" in formats:
+            self.writers["wildcard"] = _ShardedWriter(path_for(f"wildcards/{name}{{suffix}}.txt"), shard_size)
+        if "list" in formats:
+            self.writers["list"] = _ShardedWriter(path_for(f"{name}{{suffix}}_prompts.txt"), shard_size)
+            self.writers["negative"] = _ShardedWriter(path_for(f"{name}{{suffix}}_negative.txt"), shard_size)
+        if "jsonl" in formats:
+            self.writers["jsonl"] = _ShardedWriter(path_for(f"{name}{{suffix}}.jsonl"), shard_size)
+
+    def write(self, positive, negative=""):
+        """Adds one enhancer result. Empty results and error messages (no --checkpoint header) are skipped."""
+        positive = positive or ""
+        record = parse_enhanced(positive, negative or "")
+        if not record["prompt"] or not _CHECKPOINT_RE.match(positive):
+            self.skipped += 1
+            return False
+        if "wildcard" in self.writers:
+            self.writers["wildcard"].write(record["prompt"])
+        if "list" in self.writers:
+            self.writers["list"].write(to_prompt_line(record))
+            self.writers["negative"].write(record["negative_prompt"])
+        if "jsonl" in self.writers:
+            self.writers["jsonl"].write(json.dumps(to_fooocus_job(record), ensure_ascii=False))
+        self.written += 1
+        return True
+
+    def paths(self):
+        return [path for writer in self.writers.values() for path in writer.paths]
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- Result Sources (all lazy) ---
+def iter_ndjson_results(path):
+    """(positive, negative) from /enhance/batch output or other JSON lines with a 'positive' field."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if item.get("error"):
+                yield "", ""
+            else:
+                yield item.get("positive", ""), item.get("negative", "")
+
+
+def _is_record_separator(line):
+    """The Tk apps frame each saved entry with '--- Prompt ---' and a line of dashes."""
+    line = line.strip()
+    return line == "--- Prompt ---" or (len(line) >= 3 and set(line) == {"-"})
+
+
+def iter_saved_prompts(path):
+    """(positive, negative) from the enhanced_prompts.txt files written by the Save buttons."""
+    positive, negative, section = [], [], None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if _is_record_separator(line):
+                if section is not None:
+                    yield "\n".join(positive).strip(), "\n".join(negative).strip()
+                positive, negative, section = [], [], None
+            elif line == "Positive Prompt:":
+                if section is not None:
+                    yield "\n".join(positive).strip(), "\n".join(negative).strip()
+                positive, negative = [], []
+                section = positive
+            elif line == "Negative Prompt:" and section is not None:
+                section = negative
+            elif section is not None:
+                section.append(line)
+    if section is not None:
+        yield "\n".join(positive).strip(), "\n".join(negative).strip()
+
+
+def iter_lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        yield from f
+
+
+def iter_enhanced(base_prompts, options, workers=EXPORT_WORKERS):
+    """Enhances base prompts concurrently, yielding (positive, negative) as they finish.
+
+    At most 2 * workers prompts are pending, so arbitrarily long inputs use bounded memory.
+    """
+    from PromptEnhanceWeb import format_error, run_enhancement
+
+    def enhance(prompt):
+        try:
+            return run_enhancement(prompt, options["style"], options["nsfw"], options["conciseness"],
+                                   options["checkpoint"], options["lora"], options["style_tag"])
+        except Exception as e:
+            print(f"Failed to enhance '{prompt}': {format_error(e)}")
+            return "", ""
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for prompt in base_prompts:
+            prompt = prompt.strip()
+            if not prompt:
+                continue
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(pool.submit(enhance, prompt))
+        for future in pending:
+            yield future.result()
+
+
+# --- Command Line ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export enhanced prompts as Fooocus wildcard, prompt list and JSONL job files.")
+    parser.add_argument("source", help="Base prompts (one per line), or existing results with --from-ndjson/--from-saved")
+    source_kind = parser.add_mutually_exclusive_group()
+    source_kind.add_argument("--from-ndjson", action="store_true", help="Source is /enhance/batch NDJSON output")
+    source_kind.add_argument("--from-saved", action="store_true", help="Source is an enhanced_prompts.txt save file")
+    parser.add_argument("--out", default="fooocus_export", help="Output directory")
+    parser.add_argument("--name", default="enhanced", help="Base file name (also the wildcard name)")
+    parser.add_argument("--formats", default=",".join(EXPORT_FORMATS), help=f"Comma-separated: {', '.join(EXPORT_FORMATS)}")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="Records per file (0 = no sharding)")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS)
+    parser.add_argument("--style", default="Visual Detail")
+    parser.add_argument("--conciseness", type=float, default=75)
+    parser.add_argument("--nsfw", action="store_true")
+    parser.add_argument("--checkpoint", default="")
+    parser.add_argument("--lora", default="")
+    parser.add_argument("--style-tag", default="", help="Full style tag entry (name::positive::negative)")
+    args = parser.parse_args()
+
+    try:
+        exporter = FooocusExporter(args.out, args.name, [f.strip() for f in args.formats.split(",") if f.strip()],
+                                   args.shard_size)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.from_ndjson:
+        results = iter_ndjson_results(args.source)
+    elif args.from_saved:
+        results = iter_saved_prompts(args.source)
+    else:
+        options = {"style": args.style, "nsfw": args.nsfw, "conciseness": args.conciseness,
+                   "checkpoint": args.checkpoint, "lora": args.lora, "style_tag": args.style_tag}
+        results = iter_enhanced(iter_lines(args.source), options, workers=args.workers)
+
+    start = time.perf_counter()
+    with exporter:
+        for positive, negative in results:
+            exporter.write(positive, negative)
+            if (exporter.written + exporter.skipped) % 100 == 0:
+                sys.stdout.write(f"\r{exporter.written} exported, {exporter.skipped} skipped "
+                                 f"({time.perf_counter() - start:.1f}s) ")
+                sys.stdout.flush()
+    print(f"\nExported {exporter.written} prompts ({exporter.skipped} skipped) to {len(exporter.paths())} files in {args.out}.")
@@ -0,0 +1,175 @@
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _features(text):
+    """Word tokens plus padded character trigrams, so 'cyberpunk' still matches 'cyber punk'."""
+    words = _WORD_RE.findall(text.lower())
+    features = list(words)
+    for word in words:
+        padded = f" {word} "
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return Counter(features)
+
+
+def clean_lora_name(lora_name):
+    """LoRA file stem as searchable words: drops version suffixes, splits camelCase and separators."""
+    name = re.sub(r'_v\d+(\.\d+)?$', '', lora_name)
+    name = re.sub(r'([a-z])([A-Z])', r'\1 \2', name)
+    return name.replace("_", " ").replace("-", " ")
+
+
+class TextIndex:
+    """TF-IDF index over short documents, stored as NumPy posting lists.
+
+    update() only re-tokenizes documents whose text changed; the IDF weights and
+    posting arrays are then rebuilt with vectorized NumPy operations.
+    """
+
+    def __init__(self):
+        self._docs = {} # doc id -> (text, feature counts)
+        self._arrays = None # (ids, vocab, idf, ptr, post_docs, post_weights), swapped atomically
+
+    def __len__(self):
+        return len(self._docs)
+
+    def update(self, docs):
+        """Syncs the index with {doc id: text}. Returns True if anything changed."""
+        changed = False
+        for doc_id in [doc_id for doc_id in self._docs if doc_id not in docs]:
+            del self._docs[doc_id]
+            changed = True
+        for doc_id, text in docs.items():
+            current = self._docs.get(doc_id)
+            if current is None or current[0] != text:
+                self._docs[doc_id] = (text, _features(text))
+                changed = True
+        if changed or self._arrays is None:
+            self._build()
+        return changed
+
+    def _build(self):
+        ids = sorted(self._docs)
+        vocab = {}
+        rows, cols, counts = [], [], []
+        for row, doc_id in enumerate(ids):
+            for feature, count in self._docs[doc_id][1].items():
+                rows.append(row)
+                cols.append(vocab.setdefault(feature, len(vocab)))
+                counts.append(count)
+        rows = np.asarray(rows, dtype=np.int32)
+        cols = np.asarray(cols, dtype=np.int32)
+        counts = np.asarray(counts, dtype=np.float32)
+
+        doc_freq = np.bincount(cols, minlength=len(vocab))
+        idf = (np.log((1 + len(ids)) / (1 + doc_freq)) + 1).astype(np.float32)
+        weights = (1 + np.log(counts)) * idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(ids))).astype(np.float32)
+        weights /= np.maximum(norms[rows], 1e-12)
+
+        # Group entries by feature so a query touches only the postings of its own features
+        order = np.argsort(cols, kind="stable")
+        ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=ptr[1:])
+        self._arrays = (ids, vocab, idf, ptr, rows[order], weights[order])
+
+    def query(self, text, k=5):
+        """Returns up to k (doc id, cosine score) pairs, best first."""
+        if self._arrays is None or not text:
+            return []
+        ids, vocab, idf, ptr, post_docs, post_weights = self._arrays
+        terms = [(vocab[feature], count) for feature, count in _features(text).items() if feature in vocab]
+        if not terms or not ids:
+            return []
+        term_ids = np.array([term for term, _ in terms], dtype=np.int64)
+        query_weights = (1 + np.log(np.array([count for _, count in terms], dtype=np.float32))) * idf[term_ids]
+        query_weights /= np.linalg.norm(query_weights)
+
+        scores = np.zeros(len(ids), dtype=np.float32)
+        for term, weight in zip(term_ids, query_weights):
+            start, end = ptr[term], ptr[term + 1]
+            scores[post_docs[start:end]] += weight * post_weights[start:end]
+
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+
+class LoraSuggester:
+    """Suggests LoRAs (by trigger phrase and name) and style tags for a base prompt."""
+
+    def __init__(self):
+        self.lora_index = TextIndex()
+        self.style_index = TextIndex()
+        self.style_entries = {} # style name -> "name::positive::negative" entry
+        self._lock = threading.Lock()
+        self._signature = None
+        self._checked_at = 0.0
+
+    def refresh(self, loras, lora_triggers, style_tags=None):
+        """Rebuilds the parts of the index affected by changed LoRAs, triggers or style tags."""
+        lora_docs = {}
+        for lora_name in loras:
+            trigger = lora_triggers.get(lora_name, {}).get("trigger", "") if lora_name in lora_triggers else ""
+            lora_docs[lora_name] = f"{trigger} {clean_lora_name(lora_name)}"
+        with self._lock:
+            self.lora_index.update(lora_docs)
+            if style_tags is not None:
+                self.style_entries = {entry.split("::", 1)[0]: entry for entry in style_tags}
+                # Entries are "name::positive::negative"; only name and positive text describe the style
+                self.style_index.update({entry: " ".join(entry.split("::", 2)[:2]) for entry in style_tags})
+
+    def sources_changed(self, *paths, min_interval=0.0):
+        """Cheap change check: mtimes/sizes of the given files and of every directory under the given dirs.
+
+        With min_interval, the disk is checked at most that often; calls in between report no change.
+        """
+        now = time.monotonic()
+        if self._signature is not None and now - self._checked_at < min_interval:
+            return False
+        self._checked_at = now
+        signature = []
+        for path in paths:
+            path = str(path)
+            if os.path.isdir(path):
+                for dirpath, _, _ in os.walk(path):
+                    signature.append((dirpath, os.stat(dirpath).st_mtime_ns))
+            elif os.path.exists(path):
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size))
+        signature = tuple(signature)
+        changed = signature != self._signature
+        self._signature = signature
+        return changed
+
+    def suggest(self, prompt, k=5):
+        with self._lock:
+            return {
+                "loras": self.lora_index.query(prompt, k),
+                "styles": self.style_index.query(prompt, k),
+            }
+
+
+# --- Benchmark with the repo's loras.json ---
+if __name__ == "__main__":
+    import json
+
+    with open("loras.json", "r", encoding="utf-8") as f:
+        triggers = json.load(f)
+    suggester = LoraSuggester()
+    start = time.perf_counter()
+    suggester.refresh(list(triggers), triggers)
+    print(f"Indexed {len(suggester.lora_index)} LoRAs in {(time.perf_counter() - start) * 1000:.1f} ms")
+    for prompt in ["a cinematic 70s horror movie scene", "technicolor portrait of a woman", "add more detail"]:
+        start = time.perf_counter()
+        result = suggester.suggest(prompt)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{prompt!r} ({elapsed:.2f} ms): {[name for name, _ in result['loras']]}")
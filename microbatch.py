@@ -0,0 +1,179 @@
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+
+# --- Defaults (tunable per MicroBatcher) ---
+BATCH_WINDOW_SECONDS = 0.05
+BATCH_MAX_SIZE = 8
+BATCH_SESSION = "micro-batch"  # Scheduler session that batched backend calls are queued under
+
+BATCH_INSTRUCTION = (
+    " You will receive a JSON array of {count} independent base prompts. Enhance each one separately"
+    " following the instructions above. Respond ONLY with a JSON array of exactly {count} strings,"
+    " one enhanced prompt per input, in the same order. No commentary."
+)
+
+
+def parse_batch_response(text, count):
+    """Returns the list of enhanced prompts, or None if the reply is not a usable JSON array."""
+    start = text.find("[")
+    end = text.rfind("]")
+    if start == -1 or end <= start:
+        return None
+    try:
+        items = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(items, list) or len(items) != count:
+        return None
+    if not all(isinstance(item, str) and item.strip() for item in items):
+        return None
+    return [item.strip() for item in items]
+
+
+class MicroBatcher:
+    """Folds concurrent requests that share a system prompt into one multi-item LLM call.
+
+    call_fn(messages) -> str is the single-request backend call. Requests are held
+    for at most `window` seconds (or until `max_size` are queued) and then sent as
+    one JSON-array request; if the reply can't be split, each item falls back to
+    its own call_fn request.
+
+    With a scheduler (fairqueue.FairScheduler), callers park their own slot while they
+    wait and every backend call the batcher makes takes one slot under `session`, so
+    capacity counts backend calls rather than the callers folded into them.
+    """
+
+    def __init__(self, call_fn, window=BATCH_WINDOW_SECONDS, max_size=BATCH_MAX_SIZE, scheduler=None,
+                 session=BATCH_SESSION):
+        self.call_fn = call_fn
+        self.window = window
+        self.max_size = max_size
+        self.scheduler = scheduler
+        self.session = session
+        self._lock = threading.Lock()
+        self._groups = {}  # system prompt -> [(user prompt, Future), ...]
+        self.batches = 0
+        self.batched_items = 0
+        self.fallbacks = 0
+
+    def submit(self, messages):
+        """Blocks until the enhancement for this [system, user] message pair is ready."""
+        system_prompt = messages[0]["content"]
+        user_prompt = messages[-1]["content"]
+        future = Future()
+        full_group = None
+
+        with self._lock:
+            group = self._groups.get(system_prompt)
+            if group is None:
+                group = []
+                self._groups[system_prompt] = group
+                timer = threading.Timer(self.window, self._flush_expired, (system_prompt, group))
+                timer.daemon = True
+                timer.start()
+            group.append((user_prompt, future))
+            if len(group) >= self.max_size:
+                del self._groups[system_prompt]
+                full_group = group
+
+        if full_group is not None:
+            threading.Thread(target=self._run_batch, args=(system_prompt, full_group), daemon=True).start()
+        with self.scheduler.parked() if self.scheduler else nullcontext():
+            return future.result()
+
+    def _backend(self, messages):
+        with self.scheduler.slot(self.session) if self.scheduler else nullcontext():
+            return self.call_fn(messages)
+
+    def _flush_expired(self, system_prompt, group):
+        with self._lock:
+            # The group may already have been sent because it filled up
+            if self._groups.get(system_prompt) is not group:
+                return
+            del self._groups[system_prompt]
+        self._run_batch(system_prompt, group)
+
+    def _call_single(self, system_prompt, user_prompt, future):
+        try:
+            future.set_result(self._backend([
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _run_batch(self, system_prompt, group):
+        if len(group) == 1:
+            self._call_single(system_prompt, *group[0])
+            return
+
+        results = None
+        try:
+            reply = self._backend([
+                {"role": "system", "content": system_prompt + BATCH_INSTRUCTION.format(count=len(group))},
+                {"role": "user", "content": json.dumps([user_prompt for user_prompt, _ in group])}
+            ])
+            results = parse_batch_response(reply, len(group))
+        except Exception as e:
+            print(f"Micro-batch request failed ({type(e).__name__}: {e}); falling back to single calls.")
+
+        with self._lock:
+            self.batches += 1
+            self.batched_items += len(group)
+            if results is None:
+                self.fallbacks += 1
+
+        if results is not None:
+            for (_, future), result in zip(group, results):
+                future.set_result(result)
+            return
+
+        with ThreadPoolExecutor(max_workers=len(group)) as pool:
+            for user_prompt, future in group:
+                pool.submit(self._call_single, system_prompt, user_prompt, future)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "batched_items": self.batched_items,
+                "avg_batch_size": round(self.batched_items / self.batches, 2) if self.batches else 0.0,
+                "fallbacks": self.fallbacks,
+            }
+
+
+# --- Benchmark against a stub backend ---
+if __name__ == "__main__":
+    import time
+
+    CALL_OVERHEAD = 0.25  # Fixed cost per LLM call (prompt processing, scheduling)
+    PER_ITEM_COST = 0.03  # Generation cost per enhanced prompt
+    BACKEND_SLOTS = 2  # The backend only runs this many calls at once
+    backend = threading.Semaphore(BACKEND_SLOTS)
+
+    def stub_call(messages):
+        user = messages[-1]["content"]
+        items = json.loads(user) if user.startswith("[") else None
+        with backend:
+            time.sleep(CALL_OVERHEAD + PER_ITEM_COST * (len(items) if items else 1))
+        if items is not None:
+            return "Sure! " + json.dumps([f"enhanced {item}" for item in items])
+        return f"enhanced {user}"
+
+    def run(label, call, requests_count=64):
+        system = [{"role": "system", "content": "You are a prompt enhancer."}]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=requests_count) as pool:
+            results = list(pool.map(lambda i: call(system + [{"role": "user", "content": f"cat {i}"}]),
+                                    range(requests_count)))
+        elapsed = time.perf_counter() - start
+        assert results == [f"enhanced cat {i}" for i in range(requests_count)]
+        print(f"{label}: {requests_count} prompts in {elapsed:.2f}s ({requests_count / elapsed:.1f} prompts/s)")
+        return elapsed
+
+    direct = run("direct calls ", stub_call)
+    batcher = MicroBatcher(stub_call)
+    batched = run("micro-batched", batcher.submit)
+    print(f"speedup: {direct / batched:.1f}x, {batcher.stats()}")
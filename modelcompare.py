@@ -0,0 +1,191 @@
+import tkinter as tk
+from tkinter import ttk, scrolledtext
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import google.generativeai as genai
+
+COMPARE_MAX_WORKERS = 3 # Models queried at the same time
+COMPARE_FLUSH_MS = 16 # Pane updates are batched to one pass per frame
+
+
+class ModelCompareWindow:
+    """Sends one message to several models concurrently and shows the replies side by side."""
+
+    def __init__(self, root, available_models):
+        self.window = tk.Toplevel(root)
+        self.window.title("Compare Models")
+        self.window.geometry("1100x650")
+        self.available_models = available_models
+        self.executor = ThreadPoolExecutor(max_workers=COMPARE_MAX_WORKERS, thread_name_prefix="compare")
+        self.closed = False
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        # --- Shared State ---
+        self._lock = threading.Lock()
+        self._pending = {} # model name -> list of (text, style) waiting for the next flush
+        self._flush_scheduled = False
+        self.panes = {} # model name -> (ScrolledText, stats StringVar)
+        self.latency_history = {} # model name -> [{'ttft': s, 'total': s, 'tokens': n or None}]
+
+        # --- Model Selection ---
+        select_frame = ttk.Frame(self.window, padding="10")
+        select_frame.pack(side=tk.TOP, fill=tk.X)
+        ttk.Label(select_frame, text="Models:").pack(side=tk.LEFT, padx=(0, 5))
+        self.model_vars = {}
+        for index, model_name in enumerate(available_models):
+            var = tk.BooleanVar(value=index < 2)
+            ttk.Checkbutton(select_frame, text=model_name.split('/')[-1], variable=var).pack(side=tk.LEFT, padx=(0, 10))
+            self.model_vars[model_name] = var
+
+        # --- Input ---
+        input_frame = ttk.Frame(self.window, padding=(10, 0))
+        input_frame.pack(side=tk.TOP, fill=tk.X)
+        self.input_entry = tk.Text(input_frame, height=3, relief=tk.SUNKEN, borderwidth=1)
+        self.input_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        self.send_button = ttk.Button(input_frame, text="Compare", command=self.send)
+        self.send_button.pack(side=tk.RIGHT)
+
+        # --- Per-model Latency Summary ---
+        self.summary = ttk.Treeview(self.window, columns=("runs", "ttft", "total", "tokens"), height=len(available_models))
+        self.summary.heading("#0", text="Model")
+        self.summary.heading("runs", text="Runs")
+        self.summary.heading("ttft", text="Avg first token (s)")
+        self.summary.heading("total", text="Avg total (s)")
+        self.summary.heading("tokens", text="Avg output tokens")
+        self.summary.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(5, 10))
+
+        # --- Response Panes ---
+        self.panes_frame = ttk.Frame(self.window, padding="10")
+        self.panes_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+    def close(self):
+        """Drops queued model calls and stops running streams before the window goes away."""
+        self.closed = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.window.destroy()
+
+    def _after(self, delay, callback):
+        """window.after from a pool thread; a no-op once the window is closed."""
+        if self.closed:
+            return
+        try:
+            self.window.after(delay, callback)
+        except tk.TclError: # Closed in between
+            pass
+
+    def _build_panes(self, model_names):
+        for child in self.panes_frame.winfo_children():
+            child.destroy()
+        self.panes = {}
+        for column, model_name in enumerate(model_names):
+            self.panes_frame.grid_columnconfigure(column, weight=1, uniform="pane")
+            pane = ttk.LabelFrame(self.panes_frame, text=model_name.split('/')[-1], padding=5)
+            pane.grid(row=0, column=column, sticky="nsew", padx=5)
+            stats_var = tk.StringVar(value="Waiting...")
+            ttk.Label(pane, textvariable=stats_var).pack(side=tk.BOTTOM, fill=tk.X)
+            text = scrolledtext.ScrolledText(pane, wrap=tk.WORD, state=tk.DISABLED, width=30)
+            text.tag_configure("error", foreground="#CC0000")
+            text.pack(fill=tk.BOTH, expand=True)
+            self.panes[model_name] = (text, stats_var)
+        self.panes_frame.grid_rowconfigure(0, weight=1)
+
+    def send(self):
+        message = self.input_entry.get("1.0", tk.END).strip()
+        model_names = [name for name, var in self.model_vars.items() if var.get()]
+        if not message or not model_names:
+            return
+        self._build_panes(model_names)
+        self.send_button.config(state=tk.DISABLED)
+        remaining = [len(model_names)]
+
+        def done(_future):
+            with self._lock:
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+            if finished:
+                self._after(0, lambda: self.send_button.config(state=tk.NORMAL))
+
+        for model_name in model_names:
+            self.executor.submit(self._run_model, model_name, message).add_done_callback(done)
+
+    def _run_model(self, model_name, message):
+        """Streams one model's reply into its pane (runs in a pool thread)."""
+        if self.closed:
+            return
+        start_time = time.perf_counter()
+        first_token_time = None
+        try:
+            response = genai.GenerativeModel(model_name).generate_content(message, stream=True)
+            for chunk in response:
+                if self.closed: # Stop reading; the rest of the reply has nowhere to go
+                    return
+                try:
+                    text = chunk.text
+                except ValueError: # Raised for blocked or non-text parts
+                    text = ""
+                if not text:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - start_time
+                self._queue(model_name, text, None)
+            total_time = time.perf_counter() - start_time
+            usage = getattr(response, "usage_metadata", None)
+            tokens = getattr(usage, "candidates_token_count", None) or None # Not every reply reports a count
+        except Exception as e:
+            self._queue(model_name, f"API Error: {type(e).__name__}: {e}\n", "error")
+            self._set_stats(model_name, "Failed")
+            return
+
+        ttft = first_token_time if first_token_time is not None else total_time
+        with self._lock:
+            self.latency_history.setdefault(model_name, []).append({'ttft': ttft, 'total': total_time, 'tokens': tokens})
+        token_text = f"{tokens} tokens" if tokens is not None else "tokens n/a"
+        self._set_stats(model_name, f"First token {ttft:.2f}s | total {total_time:.2f}s | {token_text}")
+        self._after(0, self._refresh_summary)
+
+    def _set_stats(self, model_name, text):
+        self._after(0, lambda: self.panes[model_name][1].set(text) if model_name in self.panes else None)
+
+    def _queue(self, model_name, text, style):
+        with self._lock:
+            self._pending.setdefault(model_name, []).append((text, style))
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        self._after(COMPARE_FLUSH_MS, self._flush)
+
+    def _flush(self):
+        """Writes buffered chunks for every pane in one pass (runs in main thread)."""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._flush_scheduled = False
+        for model_name, segments in pending.items():
+            if model_name not in self.panes:
+                continue
+            text_widget = self.panes[model_name][0]
+            args = []
+            for text, style in segments:
+                args.extend((text, (style,) if style else ()))
+            text_widget.config(state=tk.NORMAL)
+            text_widget.insert(tk.END, *args)
+            text_widget.config(state=tk.DISABLED)
+            text_widget.see(tk.END)
+
+    def _refresh_summary(self):
+        with self._lock:
+            history = {name: list(runs) for name, runs in self.latency_history.items()}
+        for model_name, runs in history.items():
+            count = len(runs)
+            token_counts = [run['tokens'] for run in runs if run['tokens'] is not None]
+            values = (
+                count,
+                f"{sum(run['ttft'] for run in runs) / count:.2f}",
+                f"{sum(run['total'] for run in runs) / count:.2f}",
+                f"{sum(token_counts) / len(token_counts):.0f}" if token_counts else "n/a",
+            )
+            if self.summary.exists(model_name):
+                self.summary.item(model_name, values=values)
+            else:
+                self.summary.insert("", tk.END, iid=model_name, text=model_name.split('/')[-1], values=values)
@@ -0,0 +1,181 @@
+import json
+import os
+import pickletools
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from safetensorsmeta import read_safetensors_header
+
+MODEL_INDEX_CACHE_PATH = Path("model_index_cache.json")  # Architectures keyed by path, size and mtime
+MAX_PICKLE_BYTES = 64 * 1024 * 1024  # data.pkl of a .ckpt holds names only; weights are separate entries
+SCAN_WORKERS = 8
+UNKNOWN = "unknown"
+
+# Cross-attention context width -> base architecture
+_CONTEXT_DIMS = {768: "sd1", 1024: "sd2", 2048: "sdxl"}
+
+_METADATA_MARKERS = [
+    ("stable-diffusion-xl", "sdxl"), ("sdxl", "sdxl"),
+    ("stable-diffusion-v1", "sd1"), ("sd_v1", "sd1"),
+    ("stable-diffusion-v2", "sd2"), ("sd_v2", "sd2"),
+    ("stable-diffusion-3", "sd3"), ("sd3", "sd3"),
+    ("flux", "flux"),
+]
+
+
+def _arch_from_metadata(metadata):
+    for key in ("modelspec.architecture", "ss_base_model_version"):
+        value = str(metadata.get(key, "")).lower()
+        for marker, arch in _METADATA_MARKERS:
+            if marker in value:
+                return arch
+    return UNKNOWN
+
+
+def _arch_from_keys(keys, shapes=None):
+    """Guesses the base model from tensor names, using cross-attention shapes when available."""
+    for key in keys:
+        if "double_blocks" in key or "single_transformer_blocks" in key:
+            return "flux"
+        if "joint_blocks" in key:
+            return "sd3"
+
+    if shapes:
+        for key in keys:
+            # Checkpoint: attn2.to_k.weight is [out, ctx]; kohya LoRA: attn2_to_k.lora_down.weight is [rank, ctx]
+            if ("attn2.to_k.weight" in key or "attn2_to_k.lora_down.weight" in key) and key in shapes:
+                shape = shapes[key]
+                if len(shape) >= 2 and shape[1] in _CONTEXT_DIMS:
+                    return _CONTEXT_DIMS[shape[1]]
+
+    has_te1 = False
+    for key in keys:
+        if "conditioner.embedders.1" in key or key.startswith("lora_te2_") or "label_emb" in key:
+            return "sdxl"
+        if "cond_stage_model.model." in key:
+            return "sd2"
+        if "cond_stage_model.transformer" in key or key.startswith("lora_te_"):
+            has_te1 = True
+    return "sd1" if has_te1 else UNKNOWN
+
+
+def detect_safetensors_architecture(path):
+    header = read_safetensors_header(path)
+    arch = _arch_from_metadata(header.get("__metadata__") or {})
+    if arch != UNKNOWN:
+        return arch
+    shapes = {key: value.get("shape", []) for key, value in header.items()
+              if key != "__metadata__" and isinstance(value, dict)}
+    return _arch_from_keys(list(shapes), shapes)
+
+
+def detect_ckpt_architecture(path):
+    """Reads tensor names from the pickle inside a zip-format .ckpt without unpickling anything."""
+    if not zipfile.is_zipfile(path):
+        return UNKNOWN  # Legacy single-pickle checkpoints would need the whole file
+    with zipfile.ZipFile(path) as archive:
+        pickle_name = next((name for name in archive.namelist() if name.endswith("data.pkl")), None)
+        if pickle_name is None or archive.getinfo(pickle_name).file_size > MAX_PICKLE_BYTES:
+            return UNKNOWN
+        data = archive.read(pickle_name)
+    keys = [arg for opcode, arg, _ in pickletools.genops(data)
+            if isinstance(arg, str) and opcode.name in ("BINUNICODE", "SHORT_BINUNICODE", "BINUNICODE8", "UNICODE")]
+    return _arch_from_keys(keys)
+
+
+def detect_architecture(path):
+    path = Path(path)
+    if path.suffix == ".safetensors":
+        return detect_safetensors_architecture(path)
+    if path.suffix == ".ckpt":
+        return detect_ckpt_architecture(path)
+    return UNKNOWN
+
+
+def is_compatible(lora_arch, checkpoint_arch):
+    """Unknown on either side is treated as compatible so nothing is hidden by a failed detection."""
+    return UNKNOWN in (lora_arch, checkpoint_arch) or lora_arch == checkpoint_arch
+
+
+class ModelIndex:
+    """Header-only architecture index for LoRAs and checkpoints, persisted between runs."""
+
+    def __init__(self, cache_path=MODEL_INDEX_CACHE_PATH, workers=SCAN_WORKERS):
+        self.cache_path = Path(cache_path)
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.entries = self._load_cache()  # path -> {'size', 'mtime_ns', 'arch'}
+        self.lora_arch = {}  # LoRA stem -> arch
+        self.checkpoint_arch = {}  # checkpoint file name -> arch
+
+    def _load_cache(self):
+        try:
+            if self.cache_path.exists():
+                with open(self.cache_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"Error loading model index from {self.cache_path}: {e}")
+        return {}
+
+    def _save_cache(self):
+        try:
+            tmp_path = self.cache_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"Error saving model index to {self.cache_path}: {e}")
+
+    @staticmethod
+    def _scan_file(path, stat):
+        try:
+            arch = detect_architecture(path)
+        except Exception as e:
+            print(f"Could not read header of {path.name}: {e}")
+            arch = UNKNOWN
+        return str(path), {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "arch": arch}
+
+    def _collect(self, target_path, extensions):
+        files = []
+        if Path(target_path).is_dir():
+            for ext in extensions:
+                files.extend(Path(target_path).rglob(f"*{ext}"))
+        return files
+
+    def scan(self, lora_path, checkpoint_path):
+        """Detects architectures of new or changed files; unchanged files come from the cache."""
+        loras = self._collect(lora_path, [".safetensors"])
+        checkpoints = self._collect(checkpoint_path, [".safetensors", ".ckpt"])
+        with self._lock:
+            fresh = {}
+            todo = []
+            for path in loras + checkpoints:
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                cached = self.entries.get(str(path))
+                if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+                    fresh[str(path)] = cached
+                else:
+                    todo.append((path, stat))
+            if todo:
+                with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    for key, entry in pool.map(lambda item: self._scan_file(*item), todo):
+                        fresh[key] = entry
+            removed = len(self.entries.keys() - fresh.keys())
+            self.entries = fresh
+            self.lora_arch = {path.stem: fresh[str(path)]["arch"] for path in loras if str(path) in fresh}
+            self.checkpoint_arch = {path.name: fresh[str(path)]["arch"] for path in checkpoints if str(path) in fresh}
+            if todo or removed:
+                print(f"Indexed {len(todo)} model headers ({len(fresh)} total, {removed} removed).")
+                self._save_cache()
+
+    def compatible_loras(self, checkpoint, loras):
+        """Filters LoRA names to those usable with the checkpoint (all of them if none is selected)."""
+        if not checkpoint:
+            return list(loras)
+        checkpoint_arch = self.checkpoint_arch.get(checkpoint, UNKNOWN)
+        return [lora for lora in loras if is_compatible(self.lora_arch.get(lora, UNKNOWN), checkpoint_arch)]
@@ -0,0 +1,210 @@
+import argparse
+import csv
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+import PromptEnhanceWeb as web
+from cascade import draft_problems, estimate_clip_tokens, token_budget
+from promptsweep import CONCISENESS_BUCKETS, parse_conciseness, print_progress
+
+SCORE_WORKERS = 4  # Concurrent requests to one model; models themselves run one after another
+QUALITY_BAR = 0.8  # Share of outputs that must pass every check for a model to qualify
+CORPUS_FIELDS = ("prompt", "text", "title")  # Tried in order for JSONL corpora
+
+
+def iter_corpus(path, field=None):
+    """Base prompts from a text file (one per line) or JSONL (the given field, else prompt/text/title)."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith("{"):
+                yield line
+                continue
+            item = json.loads(line)
+            for name in ([field] if field else CORPUS_FIELDS):
+                if item.get(name):
+                    yield str(item[name]).strip()
+                    break
+
+
+def timed_completion(model, messages):
+    """(text, output tokens, seconds to first token, total seconds) from one streamed Ollama call.
+
+    Output tokens come from the usage block when the server sends one; otherwise each content
+    delta is counted, which is what Ollama streams (one token per chunk).
+    """
+    payload = {"model": model, "messages": messages, "stream": True, "stream_options": {"include_usage": True}}
+    start = time.perf_counter()
+    first_token = None
+    parts = []
+    usage_tokens = None
+    with requests.post(web.OLLAMA_ENDPOINT, json=payload, timeout=300, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            event = json.loads(data)
+            if event.get("usage"):
+                usage_tokens = event["usage"].get("completion_tokens")
+            for choice in event.get("choices") or []:
+                delta = choice.get("delta", {}).get("content")
+                if delta:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    parts.append(delta)
+    total = time.perf_counter() - start
+    return "".join(parts).strip(), usage_tokens or len(parts), first_token if first_token is not None else total, total
+
+
+def score_output(text, token_level):
+    """Cheap quality checks shared with the cascade: CLIP-token fit and format problems."""
+    clip_tokens = estimate_clip_tokens(text)
+    problems = draft_problems(text, token_level)
+    fits = clip_tokens <= token_budget(token_level)
+    format_problems = [p for p in problems if "token budget" not in p]
+    return {"clip_tokens": clip_tokens, "fits_budget": fits, "format_ok": not format_problems,
+            "passed": not problems, "problems": "; ".join(problems)}
+
+
+def run_model(model, prompts, styles, levels, workers=SCORE_WORKERS, progress=print_progress, seed=0):
+    """Every prompt x style x level on one model, after a warm-up call that loads it."""
+    jobs = [(prompt, style, level) for prompt in prompts for style in styles for level in levels]
+    random.Random(seed).shuffle(jobs)  # Mixes short and long requests over the run
+    try:
+        timed_completion(model, web.build_messages(prompts[0], styles[0], False, levels[0]))
+    except Exception as e:
+        print(f"Warm-up of {model} failed: {web.format_error(e)}")
+
+    def run(job):
+        prompt, style, level = job
+        row = {"model": model, "prompt": prompt, "style": style, "conciseness": level}
+        try:
+            text, tokens, ttft, total = timed_completion(model, web.build_messages(prompt, style, False, level))
+        except Exception as e:
+            return dict(row, error=web.format_error(e))
+        generating = max(total - ttft, 1e-6)
+        row.update(output=text, latency=round(total, 4), ttft=round(ttft, 4), output_tokens=tokens,
+                   tokens_per_sec=round(tokens / generating, 1) if tokens > 1 else None, error="")
+        row.update(score_output(text, level))
+        return row
+
+    rows = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run, job) for job in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            rows.append(future.result())
+            if progress:
+                progress(done, len(futures), time.perf_counter() - start)
+    return rows
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _mean(values):
+    return round(sum(values) / len(values), 2) if values else None
+
+
+def scoreboard(rows, quality_bar=QUALITY_BAR):
+    """One entry per model, ranked: qualifying models by p50 latency, then the rest by quality."""
+    by_model = {}
+    for row in rows:
+        by_model.setdefault(row["model"], []).append(row)
+    board = []
+    for model, model_rows in by_model.items():
+        ok = [row for row in model_rows if not row["error"]]
+        latencies = [row["latency"] for row in ok]
+        rates = [row["tokens_per_sec"] for row in ok if row["tokens_per_sec"]]
+        board.append({
+            "model": model,
+            "runs": len(model_rows),
+            "errors": len(model_rows) - len(ok),
+            "quality": round(sum(row["passed"] for row in ok) / len(model_rows), 3),
+            "format_ok": round(sum(row["format_ok"] for row in ok) / len(ok), 3) if ok else 0.0,
+            "fits_budget": round(sum(row["fits_budget"] for row in ok) / len(ok), 3) if ok else 0.0,
+            "p50_latency": round(_percentile(latencies, 0.5), 3) if latencies else None,
+            "p95_latency": round(_percentile(latencies, 0.95), 3) if latencies else None,
+            "mean_ttft": _mean([row["ttft"] for row in ok]),
+            "tokens_per_sec": _mean(rates),
+            "mean_output_tokens": _mean([row["output_tokens"] for row in ok]),
+            "mean_clip_tokens": _mean([row["clip_tokens"] for row in ok]),
+        })
+    for entry in board:
+        entry["qualifies"] = entry["quality"] >= quality_bar and entry["p50_latency"] is not None
+    board.sort(key=lambda e: (not e["qualifies"], e["p50_latency"] if e["qualifies"] else -e["quality"]))
+    return board
+
+
+def print_scoreboard(board, quality_bar=QUALITY_BAR):
+    print(f"\n{'#':>2}  {'model':<40} {'quality':>7} {'format':>6} {'fit':>5} {'p50 s':>7} {'p95 s':>7} "
+          f"{'ttft s':>7} {'tok/s':>7} {'out tok':>7} {'errors':>6}")
+    for rank, e in enumerate(board, 1):
+        mark = "" if e["qualifies"] else "  (below bar)"
+        print(f"{rank:>2}  {e['model'][:40]:<40} {e['quality']:>7.0%} {e['format_ok']:>6.0%} {e['fits_budget']:>5.0%} "
+              f"{e['p50_latency'] or 0:>7.2f} {e['p95_latency'] or 0:>7.2f} {e['mean_ttft'] or 0:>7.2f} "
+              f"{e['tokens_per_sec'] or 0:>7.1f} {e['mean_output_tokens'] or 0:>7.1f} {e['errors']:>6}{mark}")
+    best = next((e for e in board if e["qualifies"]), None)
+    if best:
+        print(f"\nFastest model meeting the {quality_bar:.0%} quality bar: {best['model']}")
+    else:
+        print(f"\nNo model met the {quality_bar:.0%} quality bar.")
+
+
+FIELDS = ["model", "style", "conciseness", "prompt", "latency", "ttft", "output_tokens", "tokens_per_sec",
+          "clip_tokens", "fits_budget", "format_ok", "passed", "problems", "error", "output"]
+
+
+def write_csv(rows, path):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# --- Command Line ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank Ollama models by prompt quality and latency over a corpus.")
+    parser.add_argument("corpus", help="Base prompts: text (one per line) or JSONL")
+    parser.add_argument("--field", help="JSONL field holding the prompt (default: prompt, text or title)")
+    parser.add_argument("--models", nargs="+", default=[web.LOCAL_LLM_MODEL, web.DRAFT_MODEL])
+    parser.add_argument("--styles", nargs="+", default=["Visual Detail"], choices=list(web.STYLES), metavar="STYLE")
+    parser.add_argument("--conciseness", nargs="+", default=list(CONCISENESS_BUCKETS),
+                        help=f"Slider values or buckets: {', '.join(CONCISENESS_BUCKETS)}")
+    parser.add_argument("--limit", type=int, help="Use only the first N prompts")
+    parser.add_argument("--workers", type=int, default=SCORE_WORKERS)
+    parser.add_argument("--quality-bar", type=float, default=QUALITY_BAR)
+    parser.add_argument("--endpoint", default=web.OLLAMA_ENDPOINT, help="OpenAI-compatible chat completions URL")
+    parser.add_argument("--out", default="scoreboard", help="Output path prefix (.json scoreboard, .csv runs)")
+    args = parser.parse_args()
+
+    web.OLLAMA_ENDPOINT = args.endpoint
+    prompts = list(iter_corpus(args.corpus, args.field))[:args.limit]
+    if not prompts:
+        parser.error(f"No prompts found in {args.corpus}")
+    levels = list(dict.fromkeys(parse_conciseness(value) for value in args.conciseness))
+    print(f"Scoring {len(args.models)} models on {len(prompts)} prompts x {len(args.styles)} styles x "
+          f"{len(levels)} conciseness levels ({len(prompts) * len(args.styles) * len(levels)} runs each).")
+
+    rows = []
+    for model in args.models:
+        print(f"--- {model} ---")
+        rows.extend(run_model(model, prompts, args.styles, levels, workers=args.workers))
+
+    board = scoreboard(rows, args.quality_bar)
+    print_scoreboard(board, args.quality_bar)
+    with open(f"{args.out}.json", "w", encoding="utf-8") as f:
+        json.dump({"scoreboard": board, "quality_bar": args.quality_bar}, f, indent=2)
+    write_csv(rows, f"{args.out}.csv")
+    print(f"Wrote {args.out}.json and {args.out}.csv ({len(rows)} runs).")
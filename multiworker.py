@@ -0,0 +1,316 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from enhanceapi import API_HOST, API_PORT, serve_api
+
+WORKERS = os.cpu_count() or 2
+WORKER_START_TIMEOUT = 120.0  # Seconds; each worker imports the web app (and Gradio) on start
+LISTEN_BACKLOG = 128
+RESPONSE_CACHE_PATH = "response_cache.sqlite3"
+RESPONSE_CACHE_TTL = 3600.0  # Seconds a cached enhancement is served before asking the model again
+RESPONSE_CACHE_MAX_ENTRIES = 20000
+RESPONSE_CACHE_PRUNE_EVERY = 200  # Inserts between pruning expired/excess rows
+
+
+def cache_key(*params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Enhancement results shared by all worker processes through one SQLite file (WAL mode).
+
+    Unlike SingleFlight this serves earlier results to later requests, for up to ttl seconds.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.inserts = 0
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, created REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:  # One connection per thread; SQLite handles locking across processes
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        row = self._connection().execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        hit = row is not None and time.time() - row[1] < self.ttl
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return json.loads(row[0]) if hit else None
+
+    def put(self, key, value):
+        with self._connection() as db:
+            db.execute("INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                       (key, json.dumps(value), time.time()))
+        with self._lock:
+            self.inserts += 1
+            prune = self.inserts % RESPONSE_CACHE_PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        with self._connection() as db:
+            db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                       (self.max_entries,))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
+
+
+def cached_enhancement(enhance_fn, cache):
+    """Wraps a run_enhancement-shaped function with the shared response cache."""
+    def enhance(prompt, style, nsfw, token_level, checkpoint, lora, style_tag_entry):
+        key = cache_key(prompt, style, bool(nsfw), float(token_level), checkpoint, lora, style_tag_entry)
+        cached = cache.get(key)
+        if cached is not None:
+            return tuple(cached)
+        result = enhance_fn(prompt, style, nsfw, token_level, checkpoint, lora, style_tag_entry)
+        cache.put(key, list(result))  # run_enhancement raises on errors, so only real results get here
+        return result
+    return enhance
+
+
+# --- Worker processes ---
+def share_limits(limiter, workers):
+    """Gives one of `workers` processes its share of the limiter, so all of them together
+    stay near the single-process concurrency against the backend (never below min_limit each).
+    """
+    limiter.max_limit = max(limiter.min_limit, limiter.max_limit // workers)
+    limiter.limit = max(float(limiter.min_limit), min(limiter.limit / workers, limiter.max_limit))
+
+
+def _worker_main(sock, snapshot_path, options, ready):
+    if options["quiet"]:
+        sys.stdout = open(os.devnull, "w")
+    import PromptEnhanceWeb as web
+
+    if options["endpoint"]:
+        web.OLLAMA_ENDPOINT = options["endpoint"]
+    # Each process has its own limiter and scheduler; split the backend budget between them
+    for limiter in (web.ollama_limiter, web.draft_limiter):
+        share_limits(limiter, options["workers"])
+    with open(snapshot_path, "r", encoding="utf-8") as f:
+        web.install_catalog(json.load(f))
+    cache = ResponseCache(options["cache_path"], options["cache_ttl"]) if options["cache_path"] else None
+    enhance = cached_enhancement(web.run_enhancement, cache) if cache else web.run_enhancement
+
+    def stats():
+        stats = web.backend_stats()
+        stats["worker"] = {"pid": os.getpid(), "cache": cache.stats() if cache else None}
+        return stats
+
+    server = serve_api(enhance, web.format_error, stats_fn=stats, sock=sock, scheduler=web.request_scheduler,
+                       styles=web.STYLES)
+    ready.put(os.getpid())
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+class WorkerPool:
+    """N API worker processes accepting on one listening socket.
+
+    The catalog (LoRAs, checkpoints, triggers, style tags, architectures) is scanned once
+    here and written to a snapshot file that every worker loads instead of rescanning.
+    Workers share enhancement results through a ResponseCache file.
+
+    Limiters and fair queues are per process: each worker gets 1/workers of the Ollama
+    concurrency limits, and session caps and round-robin fairness hold within a worker
+    (the kernel spreads connections across workers, not sessions).
+    """
+
+    def __init__(self, workers=WORKERS, host=API_HOST, port=API_PORT, cache_path=RESPONSE_CACHE_PATH,
+                 cache_ttl=RESPONSE_CACHE_TTL, endpoint=None, quiet=False):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.options = {"cache_path": cache_path, "cache_ttl": cache_ttl, "endpoint": endpoint, "quiet": quiet,
+                        "workers": workers}
+        self.processes = []
+        self.sock = None
+        self.snapshot_path = None
+
+    @property
+    def url(self):
+        host, port = self.sock.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        import PromptEnhanceWeb as web
+
+        start = time.perf_counter()
+        snapshot = web.catalog_snapshot()
+        fd, self.snapshot_path = tempfile.mkstemp(prefix="catalog_", suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        print(f"Catalog snapshot: {len(snapshot['loras'])} LoRAs, {len(snapshot['checkpoints'])} checkpoints, "
+              f"{len(snapshot['style_tags'])} style tags ({time.perf_counter() - start:.2f}s)")
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(LISTEN_BACKLOG)
+
+        context = multiprocessing.get_context("spawn")  # Same behaviour on Windows and Linux
+        ready = context.Queue()
+        for _ in range(self.workers):
+            process = context.Process(target=_worker_main, args=(self.sock, self.snapshot_path, self.options, ready),
+                                      daemon=True)
+            process.start()
+            self.processes.append(process)
+        for _ in range(self.workers):
+            ready.get(timeout=WORKER_START_TIMEOUT)
+        print(f"{self.workers} API worker(s) listening on {self.url} ({time.perf_counter() - start:.1f}s to start)")
+        return self
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join(timeout=10)
+        self.processes = []
+        if self.sock is not None:
+            self.sock.close()
+        if self.snapshot_path:
+            try:
+                os.remove(self.snapshot_path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# --- Stub-backend benchmark ---
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def benchmark(workers, duration=20.0, concurrency=16, latency=0.0, repeat=0.0, seed=0):
+    """Drives /enhance on a WorkerPool backed by a stub Ollama; returns throughput and latency figures.
+
+    repeat is the share of requests that reuse an earlier prompt, i.e. the expected cache hit rate.
+    """
+    from stubollama import StubOllama
+
+    stub = StubOllama(latency=latency).start()
+    cache_dir = tempfile.TemporaryDirectory(prefix="bench_cache_")
+    cache_path = os.path.join(cache_dir.name, "cache.sqlite3")
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def client(index):
+        nonlocal errors
+        rng = random.Random(seed + index)
+        session = requests.Session()
+        sent = 0
+        while not stop.is_set():
+            if sent and rng.random() < repeat:
+                prompt = f"subject {index}-{rng.randrange(sent)}"
+            else:
+                prompt = f"subject {index}-{sent}"
+            sent += 1
+            start = time.perf_counter()
+            try:
+                ok = session.post(f"{pool.url}/enhance", json={"prompt": prompt}, timeout=60).status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                errors += not ok
+
+    with WorkerPool(workers, port=0, cache_path=cache_path, endpoint=stub.endpoint, quiet=True) as pool:
+        threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=60)
+        elapsed = time.perf_counter() - start
+    stub.stop()
+    cache_dir.cleanup()
+    return {"workers": workers, "requests": len(latencies), "errors": errors,
+            "throughput": round(len(latencies) / elapsed, 1), "stub_calls": stub.requests,
+            "p50_ms": round(_percentile(latencies, 0.5) * 1000, 1),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 1)}
+
+
+# --- Command Line ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the enhancement API from several worker processes on one port.")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--cache", default=RESPONSE_CACHE_PATH, help="Shared response cache file ('' disables it)")
+    parser.add_argument("--cache-ttl", type=float, default=RESPONSE_CACHE_TTL)
+    parser.add_argument("--benchmark", metavar="COUNTS",
+                        help="Benchmark against a stub Ollama instead of serving, e.g. '1,2,4' workers")
+    parser.add_argument("--duration", type=float, default=20.0, help="Benchmark seconds per worker count")
+    parser.add_argument("--concurrency", type=int, default=16, help="Benchmark client threads")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub Ollama latency per call")
+    parser.add_argument("--repeat", type=float, default=0.0, help="Share of benchmark requests reusing a prompt")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        print(f"{os.cpu_count()} CPU cores, {args.concurrency} clients, stub latency {args.latency}s, "
+              f"repeat {args.repeat:.0%}")
+        baseline = None
+        for count in [int(c) for c in args.benchmark.split(",") if c.strip()]:
+            result = benchmark(count, args.duration, args.concurrency, args.latency, args.repeat)
+            baseline = baseline or result["throughput"]
+            print(f"{count:>3} workers: {result['throughput']:>8.1f} req/s (x{result['throughput'] / baseline:.2f}), "
+                  f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, {result['errors']} errors, "
+                  f"{result['stub_calls']} stub calls for {result['requests']} requests")
+        sys.exit(0)
+
+    pool = WorkerPool(args.workers, args.host, args.port, args.cache or None, args.cache_ttl)
+    pool.start()
+    try:
+        while all(process.is_alive() for process in pool.processes):
+            time.sleep(1)
+        print("A worker exited; shutting down.")
+    except KeyboardInterrupt:
+        print("Stopping workers...")
+    finally:
+        pool.stop()
@@ -3,10 +3,26 @@ from tkinter import ttk, messagebox
 # import openai <--- REMOVE or comment out
 import pyperclip
 import os
+import sys
 import json
 from pathlib import Path
 import re
 import requests # <--- ADD THIS IMPORT
+import threading
+from promptcleanup import clean_prompt
+from safetensorsmeta import TriggerScanner, merge_triggers
+from modelindex import ModelIndex
+from adaptivelimit import AdaptiveLimiter
+from speculative import Speculator, SpeculationCancelled
+from cascade import CascadeStats, draft_problems, refine_messages
+from recordreplay import install_from_env
+from structuredoutput import (
+    JSON_RESPONSE_FORMAT, StructuredOutputError, StructuredStats, enhance_structured, structured_to_prompt,
+)
+try:
+    from lorasuggest import LoraSuggester
+except ImportError: # NumPy not installed: LoRA suggestions are disabled
+    LoraSuggester = None
 
 # --- Configuration ---
 # REMOVE OpenAI Key Section
@@ -16,8 +32,12 @@ OLLAMA_ENDPOINT = "http://localhost:11434/v1/chat/completions" # Default Ollama
 # Choose the local model you want to use for enhancing prompts (must be pulled in Ollama)
 # Examples: "llama3", "mistral", "phi3", "deepseek-coder-v2-lite"
 LOCAL_LLM_MODEL = "llama2-uncensored:latest" # <--- CHANGE THIS to your desired model
+DRAFT_MODEL = "qwen2.5:1.5b" # Small, fast model for the first cascade stage
 # --- End Change ---
 
+# PROMPT_BACKEND_MODE=record|replay routes Ollama calls through a fixture file for offline benchmarks
+install_from_env()
+
 
 # Define paths (Make sure these are still correct for your setup)
 BASE_FOOCUS_PATH = Path("E:/Fooocus_win64_2-5-0/Fooocus") # Example Base Path
@@ -25,6 +45,30 @@ LORA_PATH = BASE_FOOCUS_PATH / "models/loras"
 STYLE_PATH = Path("C:/Fooocus_win64_2-5-0_2/Fooocus/sdxl_styles")
 CHECKPOINT_PATH = BASE_FOOCUS_PATH / "models/checkpoints"
 LORA_TRIGGER_PATH = Path("loras.json") # Assumed to be in the script's directory
+SUGGEST_TOP_K = 5 # LoRAs and style tags suggested for the current prompt
+SUGGEST_DEBOUNCE_MS = 300
+
+# Retries 429/503/timeouts with jittered backoff and adapts how many calls run at once.
+# The cascade's draft model has its own limiter so its latency isn't the baseline for refines.
+ollama_limiter = AdaptiveLimiter("Ollama", initial_limit=2, max_limit=8)
+draft_limiter = AdaptiveLimiter("Ollama draft", initial_limit=2, max_limit=8)
+
+# Ask for a JSON object (positive/negative tags, subject, style) instead of free text;
+# malformed replies are repaired locally before falling back to one re-roll
+STRUCTURED_OUTPUT = False
+STRUCTURED_MAX_REROLLS = 1
+structured_stats = StructuredStats()
+
+# Opt-in: enhance in the background once the prompt/settings stop changing, so a click
+# on Enhance with the same inputs returns immediately
+SPECULATIVE_ENABLED = False
+speculator = Speculator(can_start=ollama_limiter.has_spare_capacity)
+
+# Two-stage cascade: DRAFT_MODEL answers first, LOCAL_LLM_MODEL refines the draft in the
+# background unless it already passes the token budget and format checks (or via "Refine")
+CASCADE_ENABLED = False
+CASCADE_AUTO_REFINE = True
+cascade_stats = CascadeStats()
 
 # --- Style Definitions (Keep as is) ---
 STYLES = {
@@ -43,6 +87,62 @@ STYLES = {
     "Dystopian Future": "Enhance the prompt using dystopian sci-fi elements like ruined cities, authoritarian tech, bleak environments, and oppressed society themes."
 }
 
+# --- Ollama Requests ---
+def request_completion(messages, response_format=None, model=LOCAL_LLM_MODEL):
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": False, # Set to False for a single response
+        # Add options if needed, e.g., temperature
+        # "options": {
+        #     "temperature": 0.7
+        # }
+    }
+    if response_format:
+        payload["response_format"] = response_format # Ollama maps this to its JSON `format`
+
+    print(f"--- Sending to Ollama ({model}) ---")
+    # print(f"Payload Messages: {messages}") # Debug print
+
+    # Make the POST request
+    def post():
+        response = requests.post(OLLAMA_ENDPOINT, json=payload, timeout=120) # 120 second timeout
+        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+        return response
+
+    # Parse the response
+    limiter = draft_limiter if model == DRAFT_MODEL and model != LOCAL_LLM_MODEL else ollama_limiter
+    data = limiter.call(post).json()
+    return data['choices'][0]['message']['content'].strip()
+
+def request_enhancement(messages):
+    """(enhanced text, model-suggested negative tags) for one request."""
+    if STRUCTURED_OUTPUT:
+        result = enhance_structured(lambda msgs: request_completion(msgs, JSON_RESPONSE_FORMAT),
+                                    messages, structured_stats, max_rerolls=STRUCTURED_MAX_REROLLS)
+        print(f"Structured output: {structured_stats.stats()}")
+        return structured_to_prompt(result)
+    return request_completion(messages), ""
+
+def speculative_enhancement(messages, cancelled):
+    """Background run for the speculator. Free text is streamed so an edit aborts generation early."""
+    if STRUCTURED_OUTPUT:
+        return request_enhancement(messages)
+    payload = {"model": LOCAL_LLM_MODEL, "messages": messages, "stream": True}
+    text = ""
+    with ollama_limiter.slot(), requests.post(OLLAMA_ENDPOINT, json=payload, timeout=120, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if cancelled.is_set():
+                raise SpeculationCancelled() # Leaving the block closes the connection; Ollama stops generating
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            text += json.loads(data)['choices'][0].get('delta', {}).get('content') or ""
+    return text.strip(), ""
+
 # --- Main Application Class ---
 class PromptEnhancerGUI:
     # __init__ method remains largely the same, BUT remove any OpenAI key checks
@@ -54,11 +154,19 @@ class PromptEnhancerGUI:
         self.root.title("Prompt Enhancer (Ollama Backend)")
         self.root.geometry("700x750") # Adjusted size maybe
 
+        # --- Internal state ---
+        self.status_clear_job = None # To store the 'after' job ID for status clear
+        self.status_var = tk.StringVar() # Created early so loaders can report errors
+
         # --- Pre-load data ---
+        self.trigger_scanner = TriggerScanner() # Trigger words read from LoRA file headers
         self.lora_triggers = self.load_lora_triggers()
         self.checkpoints = self.load_checkpoints()
         self.loras = self.load_loras()
         self.style_tags = self.load_style_tags()
+        self.model_index = ModelIndex() # Base architecture of each LoRA/checkpoint, from file headers
+        self.model_index.scan(LORA_PATH, CHECKPOINT_PATH)
+        self.lora_folder_mtime = self.folder_mtime(LORA_PATH)
 
         # --- Configure Root Grid Weights ---
         self.root.grid_columnconfigure(0, weight=1)
@@ -109,14 +217,17 @@ class PromptEnhancerGUI:
         self.checkpoint_menu = ttk.Combobox(model_frame, textvariable=self.checkpoint_var, values=self.checkpoints, state="readonly", width=25)
         self.checkpoint_menu.grid(row=0, column=1, sticky="ew", pady=(0, 5))
         if self.checkpoints: self.checkpoint_menu.current(0)
+        self.checkpoint_menu.bind("<<ComboboxSelected>>", lambda e: self.update_lora_choices())
 
         lora_label = ttk.Label(model_frame, text="LoRA:")
         lora_label.grid(row=1, column=0, sticky="w", padx=(0, 5))
         self.lora_var = tk.StringVar()
-        lora_options = [""] + self.loras
+        lora_options = [""] + self.model_index.compatible_loras(self.checkpoint_var.get(), self.loras)
         self.lora_menu = ttk.Combobox(model_frame, textvariable=self.lora_var, values=lora_options, state="readonly", width=25)
         self.lora_menu.grid(row=1, column=1, sticky="ew", pady=(0, 5))
-        self.lora_menu.bind("<Button-1>", lambda e: self.refresh_loras())
+        self.lora_menu.bind("<Button-1>", lambda e: self.refresh_loras_if_changed())
+        refresh_button = ttk.Button(model_frame, text="↻", width=3, command=self.refresh_loras)
+        refresh_button.grid(row=1, column=2, sticky="w", padx=(5, 0), pady=(0, 5))
 
         style_tag_label = ttk.Label(model_frame, text="Style Tag:")
         style_tag_label.grid(row=2, column=0, sticky="w", padx=(0, 5))
@@ -124,10 +235,25 @@ class PromptEnhancerGUI:
         style_tag_options = [""] + self.style_tags
         self.style_tag_menu = ttk.Combobox(model_frame, textvariable=self.style_tag_var, values=style_tag_options, state="readonly", width=25)
         self.style_tag_menu.grid(row=2, column=1, sticky="ew", pady=(0, 5))
+        suggest_label = ttk.Label(model_frame, text="Suggested:")
+        suggest_label.grid(row=3, column=0, sticky="nw", padx=(0, 5))
+        self.suggestion_list = tk.Listbox(model_frame, height=5, activestyle="none")
+        self.suggestion_list.grid(row=3, column=1, sticky="ew", pady=(0, 5))
+        self.suggestion_list.bind("<Double-Button-1>", self.apply_suggestion)
+        self.suggestion_items = [] # (kind, value) per listbox row
+        self.suggest_job = None
+        self.lora_suggester = LoraSuggester() if LoraSuggester else None
+        self.input_text.bind("<KeyRelease>", self.schedule_suggestions)
+
+        if SPECULATIVE_ENABLED: # Restart the background enhancement whenever an input that reaches the LLM changes
+            self.input_text.bind("<KeyRelease>", self.schedule_speculation, add="+")
+            self.style_menu.bind("<<ComboboxSelected>>", self.schedule_speculation)
+            self.token_scale.configure(command=self.schedule_speculation)
+            self.nsfw_var.trace_add("write", self.schedule_speculation)
 
         # --- Enhance Button ---
-        enhance_button = ttk.Button(root, text="✨ Enhance Prompt ✨", command=self.enhance_prompt)
-        enhance_button.grid(row=1, column=0, columnspan=2, pady=10)
+        self.enhance_button = ttk.Button(root, text="✨ Enhance Prompt ✨", command=self.enhance_prompt)
+        self.enhance_button.grid(row=1, column=0, columnspan=2, pady=10)
 
         # --- Populate Output Frame ---
         positive_label = ttk.Label(output_frame, text="Enhanced Prompt:")
@@ -143,22 +269,29 @@ class PromptEnhancerGUI:
         save_button = ttk.Button(output_frame, text="Save to File", command=self.save_to_file)
         save_button.grid(row=2, column=1, sticky="e", pady=(5, 0))
 
+        self.cascade_context = None # Inputs and draft of the last cascade run
+        self.cascade_generation = 0 # Bumped per click so a late refine never overwrites a newer result
+        if CASCADE_ENABLED:
+            self.refine_button = ttk.Button(output_frame, text=f"Refine ({LOCAL_LLM_MODEL})", command=self.refine_on_request, state=tk.DISABLED)
+            self.refine_button.grid(row=2, column=1, sticky="w", pady=(5, 0))
+
         # --- Optional: Add status bar ---
-        self.status_var = tk.StringVar()
         self.status_var.set("Ready. Ensure Ollama is running.")
         status_bar = ttk.Label(root, textvariable=self.status_var, relief=tk.SUNKEN, anchor='w', padding=(5, 2))
         status_bar.grid(row=3, column=0, columnspan=2, sticky='ew', padx=5, pady=(5, 5))
 
 
     def load_lora_triggers(self):
+        hand_triggers = {}
         try:
             if LORA_TRIGGER_PATH.exists():
                 with open(LORA_TRIGGER_PATH, "r", encoding="utf-8") as f:
-                    return json.load(f)
+                    hand_triggers = json.load(f)
         except Exception as e:
             print(f"Error loading LoRA triggers from {LORA_TRIGGER_PATH}: {e}")
             self.show_status(f"Could not load LoRA triggers: {e}", error=True)
-        return {}
+        # Only new or changed files have their headers re-read
+        return merge_triggers(hand_triggers, self.trigger_scanner.scan(LORA_PATH))
 
     def get_lora_trigger(self, lora_name):
         if lora_name in self.lora_triggers:
@@ -188,14 +321,74 @@ class PromptEnhancerGUI:
     def load_loras(self):
         return self.load_files_from_path(LORA_PATH, [".safetensors"])
 
-    def refresh_loras(self):
+    @staticmethod
+    def folder_mtime(path):
+        try:
+            return path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def refresh_loras_if_changed(self):
+        """Menu click: one stat of the LoRA folder; the full rescan only runs if files were added or removed."""
+        if self.folder_mtime(LORA_PATH) != self.lora_folder_mtime:
+            self.refresh_loras(rescan_models=False)
+
+    def refresh_loras(self, rescan_models=True):
+        """Refresh button: re-reads the LoRA folder and trigger headers, and the model index.
+
+        Automatic refreshes pass rescan_models=False: the index is built at startup and on the
+        button, and LoRAs it hasn't seen yet count as compatible until then.
+        """
         self.show_status("Refreshing LoRAs...")
+        self.lora_folder_mtime = self.folder_mtime(LORA_PATH)
         self.lora_triggers = self.load_lora_triggers()
         self.loras = self.load_loras()
-        lora_options = [""] + self.loras
-        self.lora_menu["values"] = lora_options
+        if rescan_models:
+            self.model_index.scan(LORA_PATH, CHECKPOINT_PATH)
+        self.update_lora_choices()
+        if self.lora_suggester:
+            self.lora_suggester.refresh(self.loras, self.lora_triggers, self.style_tags)
         self.show_status(f"Found {len(self.loras)} LoRAs.", duration=3000)
 
+    # --- LoRA / Style Suggestions ---
+    def schedule_suggestions(self, event=None):
+        """Debounces typing so the index is only queried once the user pauses."""
+        if self.suggest_job:
+            self.root.after_cancel(self.suggest_job)
+        self.suggest_job = self.root.after(SUGGEST_DEBOUNCE_MS, self.update_suggestions)
+
+    def update_suggestions(self):
+        self.suggest_job = None
+        if not self.lora_suggester:
+            return
+        if self.lora_suggester.sources_changed(LORA_TRIGGER_PATH, LORA_PATH):
+            self.refresh_loras(rescan_models=False) # loras.json or the LoRA folder changed: re-read and re-index
+        prompt = self.input_text.get("1.0", tk.END).strip()
+        suggestions = self.lora_suggester.suggest(prompt, k=SUGGEST_TOP_K)
+        self.suggestion_items = [("lora", name) for name, _ in suggestions["loras"]]
+        self.suggestion_items += [("style", entry) for entry, _ in suggestions["styles"]]
+        self.suggestion_list.delete(0, tk.END)
+        for kind, value in self.suggestion_items:
+            label = value if kind == "lora" else value.split("::", 1)[0]
+            self.suggestion_list.insert(tk.END, f"{'LoRA' if kind == 'lora' else 'Style'}: {label}")
+
+    def apply_suggestion(self, event=None):
+        selection = self.suggestion_list.curselection()
+        if not selection:
+            return
+        kind, value = self.suggestion_items[selection[0]]
+        if kind == "lora":
+            self.lora_var.set(value)
+        else:
+            self.style_tag_var.set(value)
+
+    def update_lora_choices(self):
+        """Limits the LoRA list to those matching the selected checkpoint's architecture."""
+        compatible = self.model_index.compatible_loras(self.checkpoint_var.get(), self.loras)
+        self.lora_menu["values"] = [""] + compatible
+        if self.lora_var.get() and self.lora_var.get() not in compatible:
+            self.lora_var.set("")
+
     def load_checkpoints(self):
         return self.load_files_from_path(CHECKPOINT_PATH, [".safetensors", ".ckpt"])
 
@@ -229,16 +422,48 @@ class PromptEnhancerGUI:
                 print(f"Error loading style from {file.name}: {e}")
                 self.show_status(f"Error loading style {file.name}", error=True)
         return sorted(tags, key=str.lower)
+    def build_messages(self):
+        """System + user messages for the current prompt, style, conciseness and NSFW setting."""
+        prompt = self.input_text.get("1.0", tk.END).strip()
+        token_level = self.token_scale.get() # Get value from ttk.Scale
+
+        if token_level < 25: token_prompt = "Respond using full sentences with rich descriptions. Do not use comma-separated tags."
+        elif token_level < 50: token_prompt = "Respond using short phrases and some natural language. Blend detail with clarity. Minimal use of tags."
+        elif token_level < 75: token_prompt = "Compress the description using very short phrases and comma-separated visual descriptors. Avoid full sentences."
+        else: token_prompt = "Respond ONLY using concise, comma-separated tags and visual descriptors. NO full sentences. Be extremely brief and dense."
+
+        # Construct system prompt (same as before)
+        system_prompt = f"You are a prompt enhancer for Stable Diffusion image generation. {STYLES[self.style_var.get()]} {token_prompt}"
+        if self.nsfw_var.get():
+            system_prompt += " Add relevant NSFW, erotic, or suggestive elements as concise tags if appropriate for the base prompt."
+
+        # Construct user prompt (same as before, maybe without lora trigger hint?)
+        # Let's keep it simple and let the system prompt guide the LLM
+        user_prompt_for_api = prompt
+        # if lora_trigger: user_prompt_for_api += f" (incorporate elements related to: {lora_trigger})" # Keep this? Test it.
+
+        # Prepare messages payload for Ollama (OpenAI format)
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt_for_api}
+        ]
+
+    # --- Speculative Enhancement ---
+    def schedule_speculation(self, *args):
+        """Called on every relevant edit; the speculator debounces and cancels stale runs."""
+        if not self.input_text.get("1.0", tk.END).strip():
+            speculator.cancel()
+            return
+        messages = self.build_messages()
+        speculator.schedule(json.dumps(messages), lambda cancelled: speculative_enhancement(messages, cancelled))
+
     # --- MODIFIED enhance_prompt Method ---
     def enhance_prompt(self):
         # Get inputs from GUI (same as before)
         prompt = self.input_text.get("1.0", tk.END).strip()
-        selected_style_name = self.style_var.get()
-        nsfw = self.nsfw_var.get()
         lora = self.lora_var.get()
         style_tag_entry = self.style_tag_var.get()
         checkpoint = self.checkpoint_var.get()
-        token_level = self.token_scale.get() # Get value from ttk.Scale
 
         style_tag_prefix = ""
         negative_prompt = ""
@@ -258,92 +483,67 @@ class PromptEnhancerGUI:
                 style_tag_prefix = style_tag_entry if "::" not in style_tag_entry else ""
 
         lora_prefix = f"<lora:{lora}:0.8>, " if lora else ""
+        prefix_parts = [lora_prefix.strip(), style_tag_prefix, lora_trigger]
 
-        if token_level < 25: token_prompt = "Respond using full sentences with rich descriptions. Do not use comma-separated tags."
-        elif token_level < 50: token_prompt = "Respond using short phrases and some natural language. Blend detail with clarity. Minimal use of tags."
-        elif token_level < 75: token_prompt = "Compress the description using very short phrases and comma-separated visual descriptors. Avoid full sentences."
-        else: token_prompt = "Respond ONLY using concise, comma-separated tags and visual descriptors. NO full sentences. Be extremely brief and dense."
-
-        # Construct system prompt (same as before)
-        system_prompt = f"You are a prompt enhancer for Stable Diffusion image generation. {STYLES[selected_style_name]} {token_prompt}"
-        if nsfw:
-            system_prompt += " Add relevant NSFW, erotic, or suggestive elements as concise tags if appropriate for the base prompt."
-
-        # Construct user prompt (same as before, maybe without lora trigger hint?)
-        # Let's keep it simple and let the system prompt guide the LLM
-        user_prompt_for_api = prompt
-        # if lora_trigger: user_prompt_for_api += f" (incorporate elements related to: {lora_trigger})" # Keep this? Test it.
+        messages = self.build_messages()
+        self.cascade_generation += 1
+        context = {
+            "generation": self.cascade_generation, "messages": messages, "token_level": self.token_scale.get(),
+            "checkpoint": checkpoint, "prefix_parts": prefix_parts, "negative_prompt": negative_prompt,
+        }
 
         # --- START Ollama API Call ---
+        # Off the Tk thread: retries and backoff can take a while and must not freeze the window
         self.status_var.set(f"Sending prompt to {LOCAL_LLM_MODEL} via Ollama...")
-        self.root.update_idletasks()
+        self.enhance_button.config(state=tk.DISABLED)
+        threading.Thread(target=self.enhance_worker, args=(context,), daemon=True).start()
 
+    def enhance_worker(self, context):
+        messages = context["messages"]
+        draft = None
         try:
-            # Prepare messages payload for Ollama (OpenAI format)
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt_for_api}
-            ]
-
-            payload = {
-                "model": LOCAL_LLM_MODEL,
-                "messages": messages,
-                "stream": False, # Set to False for a single response
-                # Add options if needed, e.g., temperature
-                # "options": {
-                #     "temperature": 0.7
-                # }
-            }
-
-            print(f"--- Sending to Ollama ({LOCAL_LLM_MODEL}) ---")
-            # print(f"Payload Messages: {messages}") # Debug print
-
-            # Make the POST request
-            response = requests.post(OLLAMA_ENDPOINT, json=payload, timeout=120) # 120 second timeout
-            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-            # Parse the response
-            data = response.json()
-            enhanced_ai_part = data['choices'][0]['message']['content'].strip()
-
-            # --- END Ollama API Call ---
-
-            # --- Format Final Output (Same as before) ---
-            final_prompt_parts = []
-            if lora_prefix: final_prompt_parts.append(lora_prefix.strip())
-            if style_tag_prefix: final_prompt_parts.append(style_tag_prefix)
-            if lora_trigger: final_prompt_parts.append(lora_trigger)
-            final_prompt_parts.append(enhanced_ai_part)
-
-            # Regex cleanup might need adjustment depending on local LLM output style
-            final_prompt = ", ".join(filter(None, final_prompt_parts))
-            # This regex might be too aggressive or not needed depending on the local model
-            # final_prompt = re.sub(r'(?<!<lora:[^>]+):', '', final_prompt) # Using regex module might be needed here if kept
-            final_prompt = re.sub(r'\s*,\s*', ', ', final_prompt).strip(', ')
-
-            # --- Display Results (Same as before) ---
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert(tk.END, f"--checkpoint {checkpoint}\n{final_prompt}")
-            self.negative_text.delete("1.0", tk.END)
-            self.negative_text.insert(tk.END, negative_prompt)
-
-            pyperclip.copy(final_prompt)
-            # Use status bar instead of messagebox
-            self.status_var.set("Enhanced prompt copied to clipboard!")
-            self.root.after(3000, lambda: self.status_var.set("Ready.")) # Clear after 3 secs
-
-        # --- Updated Error Handling ---
-        except requests.exceptions.ConnectionError as e:
+            result = speculator.take(json.dumps(messages)) if SPECULATIVE_ENABLED else None
+            if SPECULATIVE_ENABLED:
+                print(f"Speculation: {speculator.stats()}")
+            if result is None and CASCADE_ENABLED and not STRUCTURED_OUTPUT:
+                self.root.after(0, lambda: self.status_var.set(f"Drafting with {DRAFT_MODEL}..."))
+                draft = cascade_stats.timed("draft", lambda: request_completion(messages, model=DRAFT_MODEL))
+                result = draft, ""
+            result = result or request_enhancement(messages)
+        except Exception as e:
+            self.root.after(0, self.show_enhance_error, e)
+            return
+        # --- END Ollama API Call ---
+        self.root.after(0, self.finish_enhance, context, result, draft)
+
+    def finish_enhance(self, context, result, draft):
+        self.enhance_button.config(state=tk.NORMAL)
+        if context["generation"] != self.cascade_generation:
+            return # Superseded by a newer click
+        enhanced_ai_part, ai_negative = result
+        negative_prompt = context["negative_prompt"]
+        if ai_negative:
+            negative_prompt = clean_prompt(", ".join(filter(None, [negative_prompt, ai_negative])))
+        self.display_prompt(context["checkpoint"], context["prefix_parts"], enhanced_ai_part, negative_prompt)
+        if draft is not None:
+            self.cascade_context = dict(context, draft=draft)
+            self.refine_button.config(state=tk.NORMAL)
+            self.maybe_refine()
+
+    # --- Updated Error Handling ---
+    def show_enhance_error(self, e):
+        self.enhance_button.config(state=tk.NORMAL)
+        if isinstance(e, requests.exceptions.ConnectionError):
             error_msg = f"Connection Error: Could not connect to Ollama at {OLLAMA_ENDPOINT}.\nIs Ollama running? {e}"
             print(error_msg)
             messagebox.showerror("Connection Error", error_msg)
             self.status_var.set("Error: Ollama connection failed.")
-        except requests.exceptions.Timeout:
+        elif isinstance(e, requests.exceptions.Timeout):
             error_msg = "Error: Request to Ollama timed out."
             print(error_msg)
             messagebox.showerror("Timeout Error", error_msg)
             self.status_var.set("Error: Ollama request timed out.")
-        except requests.exceptions.RequestException as e: # Catch other request errors (like 4xx/5xx)
+        elif isinstance(e, requests.exceptions.RequestException): # Other request errors (like 4xx/5xx)
             error_msg = f"Ollama Request Error: {e}"
             # Try to get more detail from response if available
             try:
@@ -353,60 +553,114 @@ class PromptEnhancerGUI:
             print(error_msg)
             messagebox.showerror("Ollama Error", error_msg)
             self.status_var.set("Error: Ollama request failed.")
-        except (KeyError, IndexError) as e:
+        elif isinstance(e, StructuredOutputError):
+            error_msg = f"Error parsing Ollama response: {e}"
+            print(error_msg)
+            messagebox.showerror("Response Error", error_msg)
+            self.status_var.set("Error: Could not parse Ollama response.")
+        elif isinstance(e, (KeyError, IndexError)):
             error_msg = f"Error parsing Ollama response: Unexpected format.\n{e}"
             print(error_msg)
-            # print(f"Response Data: {data}") # Debug: print response data if parsing failed
             messagebox.showerror("Response Error", error_msg)
             self.status_var.set("Error: Could not parse Ollama response.")
-        except Exception as e: # Catch any other unexpected errors
+        else: # Any other unexpected error
             error_msg = f"An unexpected error occurred: {type(e).__name__}: {e}"
             print(error_msg)
             messagebox.showerror("Unexpected Error", error_msg)
             self.status_var.set("Error: An unexpected error occurred.")
 
 
-    # save_to_file method remains the SAME as before.
-
-    # --- Helper methods for loading files ---
-    # load_lora_triggers, get_lora_trigger, load_files_from_path,
-    # load_loras, refresh_loras, load_checkpoints, load_style_tags
-    # remain the SAME as before. Make sure they handle path errors gracefully.
-    def load_lora_triggers(self):
-        # (Include the implementation from previous versions)
-        # ...
-        return {} # Placeholder
-
-    def get_lora_trigger(self, lora_name):
-        # (Include the implementation from previous versions)
-        # ...
-        return "" # Placeholder
-
-    def load_files_from_path(self, target_path, extensions):
-        # (Include the implementation from previous versions)
-        # ...
-        return [] # Placeholder
-
-    def load_loras(self):
-        return self.load_files_from_path(LORA_PATH, [".safetensors"])
+    def display_prompt(self, checkpoint, prefix_parts, enhanced_ai_part, negative_prompt, status="Enhanced prompt copied to clipboard!"):
+        # --- Format Final Output (Same as before) ---
+        # Single-pass cleanup: keeps <lora:...> tags, strips stray colons, dedupes tags
+        final_prompt = clean_prompt(", ".join(filter(None, prefix_parts + [enhanced_ai_part])))
+
+        # --- Display Results (Same as before) ---
+        self.output_text.delete("1.0", tk.END)
+        self.output_text.insert(tk.END, f"--checkpoint {checkpoint}\n{final_prompt}")
+        self.negative_text.delete("1.0", tk.END)
+        self.negative_text.insert(tk.END, negative_prompt)
+
+        pyperclip.copy(final_prompt)
+        # Use status bar instead of messagebox
+        self.status_var.set(status)
+        self.root.after(3000, lambda: self.status_var.set("Ready.")) # Clear after 3 secs
+
+    # --- Draft / Refine Cascade ---
+    def maybe_refine(self):
+        """Refines in the background unless the draft already passes the budget/format checks."""
+        context = self.cascade_context
+        problems = draft_problems(context["draft"], context["token_level"])
+        if not problems or not CASCADE_AUTO_REFINE:
+            cascade_stats.record_skip()
+            print(f"Cascade: {cascade_stats.stats()}")
+            return
+        print(f"Refining draft with {LOCAL_LLM_MODEL}: {'; '.join(problems)}")
+        self.start_refine(context, problems)
 
-    def refresh_loras(self):
-        # (Include the implementation from previous versions)
-        # ...
-        pass # Placeholder
+    def refine_on_request(self):
+        if self.cascade_context:
+            context = self.cascade_context
+            self.start_refine(context, draft_problems(context["draft"], context["token_level"]))
 
-    def load_checkpoints(self):
-        return self.load_files_from_path(CHECKPOINT_PATH, [".safetensors", ".ckpt"])
+    def start_refine(self, context, problems):
+        self.status_var.set(f"Draft ready. Refining with {LOCAL_LLM_MODEL} in the background...")
+        self.refine_button.config(state=tk.DISABLED)
+        threading.Thread(target=self.refine_worker, args=(context, problems), daemon=True).start()
 
-    def load_style_tags(self):
-        # (Include the implementation from previous versions)
-        # ...
-        return [] # Placeholder
+    def refine_worker(self, context, problems):
+        try:
+            refined = cascade_stats.timed("refine", lambda: request_completion(
+                refine_messages(context["messages"], context["draft"], problems)))
+        except Exception as e:
+            print(f"Refine failed: {type(e).__name__}: {e}")
+            error_name = type(e).__name__
+            self.root.after(0, lambda: self.show_status(f"Refine failed: {error_name}", error=True))
+            self.root.after(0, lambda: self.refine_button.config(state=tk.NORMAL))
+            return
+        self.root.after(0, self.finish_refine, context, refined)
+
+    def finish_refine(self, context, refined):
+        print(f"Cascade: {cascade_stats.stats()}")
+        self.refine_button.config(state=tk.NORMAL)
+        if context["generation"] != self.cascade_generation:
+            return # The user has enhanced again since; this refinement is stale
+        self.display_prompt(context["checkpoint"], context["prefix_parts"], refined, context["negative_prompt"],
+                            status="Refined prompt copied to clipboard!")
+
+    # --- Helper Methods for Status Bar ---
+    def show_status(self, message, duration=4000, error=False):
+        """Updates the status bar message and optionally clears it after a duration."""
+        if self.status_clear_job:
+            self.root.after_cancel(self.status_clear_job)
+            self.status_clear_job = None
+        self.status_var.set(f"Error: {message}" if error else message)
+        if duration:
+            self.status_clear_job = self.root.after(duration, self.clear_status)
+
+    def clear_status(self):
+        """Clears the status bar message."""
+        self.status_var.set("")
+        self.status_clear_job = None
 
     def save_to_file(self):
-        # (Include the implementation from previous versions)
-        # ...
-        pass # Placeholder
+        positive = self.output_text.get("1.0", tk.END).strip()
+        negative = self.negative_text.get("1.0", tk.END).strip()
+        if not positive:
+            self.show_status("No enhanced prompt to save.", error=True)
+            return
+
+        output_filename = "enhanced_prompts.txt"
+        try:
+            with open(output_filename, "a", encoding="utf-8") as f:
+                f.write("--- Prompt ---\n")
+                f.write("Positive Prompt:\n" + positive + "\n\n")
+                f.write("Negative Prompt:\n" + negative + "\n")
+                f.write("--------------\n\n")
+            self.show_status(f"Prompt saved to {output_filename}", duration=3000)
+        except Exception as e:
+            self.show_status(f"Save Error: {e}", error=True)
+            messagebox.showerror("Save Error", f"Failed to save to {output_filename}:\n{e}")
 
 
 # --- Main Execution ---
@@ -420,8 +674,5 @@ if __name__ == "__main__":
     # ---
 
     root = tk.Tk()
-    # Make sure to include the full implementations for all helper methods
-    # (load_loras, load_checkpoints, etc.) in the class definition above.
-    # The placeholders above need to be replaced with the actual code.
     app = PromptEnhancerGUI(root)
     root.mainloop()
\ No newline at end of file
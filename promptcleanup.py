@@ -0,0 +1,79 @@
+import re
+
+# --- Tokenizer ---
+# One left-to-right pass over the prompt: LoRA tags are kept verbatim, text runs
+# have stray colons dropped, and commas close the current tag. No lookbehind, so
+# the cost is linear in the prompt length.
+_TOKEN_RE = re.compile(r"<lora:[^>]*>|[^,<]+|[,<]")
+
+
+def _tag_key(tag):
+    """Case- and whitespace-insensitive key used to detect repeated tags."""
+    return " ".join(tag.lower().split())
+
+
+def split_tags(text, dedupe=True):
+    """Splits a prompt into cleaned tags, preserving <lora:...> tags."""
+    tags = []
+    seen = set()
+    current = []
+
+    def flush():
+        tag = "".join(current).strip()
+        current.clear()
+        if not tag:
+            return
+        if dedupe:
+            key = _tag_key(tag)
+            if key in seen:
+                return
+            seen.add(key)
+        tags.append(tag)
+
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group()
+        if token == ",":
+            flush()
+        elif token.startswith("<lora:"):
+            current.append(token)
+        else:
+            current.append(token.replace(":", ""))
+    flush()
+    return tags
+
+
+def clean_prompt(text, dedupe=True):
+    """Strips stray colons, normalizes comma spacing and drops repeated tags."""
+    if not text:
+        return ""
+    return ", ".join(split_tags(text, dedupe=dedupe))
+
+
+# --- Benchmark against the previous regex chain ---
+if __name__ == "__main__":
+    import timeit
+
+    sample = ", ".join(
+        ["<lora:add-detail-xl:0.8>", "add detail", "masterpiece: best quality"]
+        + [f"tag {i % 40}, Detail: {i}" for i in range(400)]
+    )
+
+    try:
+        import regex
+
+        lookbehind = regex.compile(r'(?<!<lora:[^>]+):')
+
+        def old_chain():
+            cleaned = lookbehind.sub('', sample)
+            return re.sub(r'\s*,\s*', ', ', cleaned).strip(', ')
+    except ImportError:
+        old_chain = None
+        print("The 'regex' module is not installed; skipping the old chain.")
+
+    runs = 200
+    new_time = timeit.timeit(lambda: clean_prompt(sample), number=runs)
+    print(f"clean_prompt: {new_time / runs * 1000:.3f} ms per prompt ({len(sample)} chars)")
+    if old_chain:
+        old_time = timeit.timeit(old_chain, number=runs)
+        print(f"regex chain:  {old_time / runs * 1000:.3f} ms per prompt")
+        print(f"speedup:      {old_time / new_time:.1f}x")
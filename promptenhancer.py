@@ -4,8 +4,22 @@ import openai
 import pyperclip
 import os
 import json
+import threading
 from pathlib import Path
 import regex as re
+from promptcleanup import clean_prompt
+from safetensorsmeta import TriggerScanner, merge_triggers
+from modelindex import ModelIndex
+from adaptivelimit import AdaptiveLimiter, OVERLOAD, TIMEOUT, FATAL, parse_retry_after
+from speculative import Speculator, SpeculationCancelled
+from recordreplay import install_from_env
+from structuredoutput import (
+    JSON_RESPONSE_FORMAT, StructuredOutputError, StructuredStats, enhance_structured, structured_to_prompt,
+)
+try:
+    from lorasuggest import LoraSuggester
+except ImportError: # NumPy not installed: LoRA suggestions are disabled
+    LoraSuggester = None
 
 # Set your OpenAI API key here directly or via environment variable
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -14,6 +28,9 @@ openai.api_key = os.getenv("OPENAI_API_KEY")
 # BUT DO NOT COMMIT YOUR KEY TO VERSION CONTROL
 # if not openai.api_key: openai.api_key = "sk-REPLACE_THIS_WITH_YOUR_KEY"
 
+# PROMPT_BACKEND_MODE=record|replay routes OpenAI calls through a fixture file for offline benchmarks
+install_from_env()
+
 # Define paths (Consider making these configurable)
 BASE_FOOCUS_PATH = Path("E:/Fooocus_win64_2-5-0/Fooocus") # Example Base Path
 LORA_PATH = BASE_FOOCUS_PATH / "models/loras"
@@ -21,6 +38,66 @@ LORA_PATH = BASE_FOOCUS_PATH / "models/loras"
 STYLE_PATH = Path("C:/Fooocus_win64_2-5-0_2/Fooocus/sdxl_styles")
 CHECKPOINT_PATH = BASE_FOOCUS_PATH / "models/checkpoints"
 LORA_TRIGGER_PATH = Path("loras.json") # Assumed to be in the script's directory or a config location
+SUGGEST_TOP_K = 5 # LoRAs and style tags suggested for the current prompt
+SUGGEST_DEBOUNCE_MS = 300
+
+# Retries rate limits/overloads with jittered backoff and adapts how many calls run at once
+openai_limiter = AdaptiveLimiter("OpenAI", initial_limit=2, max_limit=8)
+
+# JSON mode: the reply is a {positive, negative, subject, style} object instead of free text.
+# Plain gpt-4 doesn't accept response_format, so structured requests use a model that does.
+STRUCTURED_OUTPUT = False
+STRUCTURED_MAX_REROLLS = 1
+OPENAI_MODEL = "gpt-4"
+OPENAI_JSON_MODEL = "gpt-4-turbo"
+structured_stats = StructuredStats()
+
+# Opt-in: enhance in the background once the prompt/settings stop changing, so a click
+# on Enhance with the same inputs returns immediately
+SPECULATIVE_ENABLED = False
+speculator = Speculator(can_start=openai_limiter.has_spare_capacity)
+
+
+def classify_openai_error(e):
+    """(kind, retry_after) for the adaptive limiter; rate limits and overloads are retried, timeouts aren't."""
+    if isinstance(e, openai.error.Timeout):
+        return TIMEOUT, None
+    if isinstance(e, (openai.error.RateLimitError, openai.error.ServiceUnavailableError)):
+        headers = getattr(e, "headers", None) or {}
+        return OVERLOAD, parse_retry_after(headers.get("retry-after") or headers.get("Retry-After"))
+    return FATAL, None
+
+
+def request_enhancement(messages):
+    """(enhanced text, model-suggested negative tags) for one request."""
+    if STRUCTURED_OUTPUT:
+        def request_json(msgs):
+            response = openai_limiter.call(lambda: openai.ChatCompletion.create(
+                model=OPENAI_JSON_MODEL, messages=msgs, response_format=JSON_RESPONSE_FORMAT
+            ), classify_openai_error)
+            return response['choices'][0]['message']['content']
+
+        result = enhance_structured(request_json, messages, structured_stats, max_rerolls=STRUCTURED_MAX_REROLLS)
+        print(f"Structured output: {structured_stats.stats()}")
+        return structured_to_prompt(result)
+
+    response = openai_limiter.call(lambda: openai.ChatCompletion.create(
+        model=OPENAI_MODEL, messages=messages
+    ), classify_openai_error)
+    return response['choices'][0]['message']['content'].strip(), ""
+
+
+def speculative_enhancement(messages, cancelled):
+    """Background run for the speculator. Free text is streamed so an edit stops it early."""
+    if STRUCTURED_OUTPUT:
+        return request_enhancement(messages)
+    text = ""
+    with openai_limiter.slot(classify_openai_error):
+        for chunk in openai.ChatCompletion.create(model=OPENAI_MODEL, messages=messages, stream=True):
+            if cancelled.is_set():
+                raise SpeculationCancelled()
+            text += chunk['choices'][0].get('delta', {}).get('content') or ""
+    return text.strip(), ""
 
 # --- Style Definitions ---
 STYLES = {
@@ -50,10 +127,14 @@ class PromptEnhancerGUI:
         self.status_clear_job = None # To store the 'after' job ID for status clear
 
         # --- Pre-load data ---
+        self.trigger_scanner = TriggerScanner() # Trigger words read from LoRA file headers
         self.lora_triggers = self.load_lora_triggers()
         self.checkpoints = self.load_checkpoints()
         self.loras = self.load_loras()
         self.style_tags = self.load_style_tags()
+        self.model_index = ModelIndex() # Base architecture of each LoRA/checkpoint, from file headers
+        self.model_index.scan(LORA_PATH, CHECKPOINT_PATH)
+        self.lora_folder_mtime = self.folder_mtime(LORA_PATH)
 
         # --- Configure Root Grid Weights (for resizing) ---
         self.root.grid_columnconfigure(0, weight=1)
@@ -107,24 +188,43 @@ class PromptEnhancerGUI:
         self.checkpoint_menu = ttk.Combobox(model_frame, textvariable=self.checkpoint_var, values=self.checkpoints, state="readonly", width=25)
         self.checkpoint_menu.grid(row=0, column=1, sticky="ew", pady=(0, 5))
         if self.checkpoints: self.checkpoint_menu.current(0)
+        self.checkpoint_menu.bind("<<ComboboxSelected>>", lambda e: self.update_lora_choices())
         lora_label = ttk.Label(model_frame, text="LoRA:")
         lora_label.grid(row=1, column=0, sticky="w", padx=(0, 5))
         self.lora_var = tk.StringVar()
-        lora_options = [""] + self.loras
+        lora_options = [""] + self.model_index.compatible_loras(self.checkpoint_var.get(), self.loras)
         self.lora_menu = ttk.Combobox(model_frame, textvariable=self.lora_var, values=lora_options, state="readonly", width=25)
         self.lora_menu.grid(row=1, column=1, sticky="ew", pady=(0, 5))
-        self.lora_menu.bind("<Button-1>", lambda e: self.refresh_loras())
+        self.lora_menu.bind("<Button-1>", lambda e: self.refresh_loras_if_changed())
+        refresh_button = ttk.Button(model_frame, text="↻", width=3, command=self.refresh_loras)
+        refresh_button.grid(row=1, column=2, sticky="w", padx=(5, 0), pady=(0, 5))
         style_tag_label = ttk.Label(model_frame, text="Style Tag:")
         style_tag_label.grid(row=2, column=0, sticky="w", padx=(0, 5))
         self.style_tag_var = tk.StringVar()
         style_tag_options = [""] + self.style_tags
         self.style_tag_menu = ttk.Combobox(model_frame, textvariable=self.style_tag_var, values=style_tag_options, state="readonly", width=25)
         self.style_tag_menu.grid(row=2, column=1, sticky="ew", pady=(0, 5))
+        suggest_label = ttk.Label(model_frame, text="Suggested:")
+        suggest_label.grid(row=3, column=0, sticky="nw", padx=(0, 5))
+        self.suggestion_list = tk.Listbox(model_frame, height=5, activestyle="none")
+        self.suggestion_list.grid(row=3, column=1, sticky="ew", pady=(0, 5))
+        self.suggestion_list.bind("<Double-Button-1>", self.apply_suggestion)
+        self.suggestion_items = [] # (kind, value) per listbox row
+        self.suggest_job = None
+        self.lora_suggester = LoraSuggester() if LoraSuggester else None
+        self.input_text.bind("<KeyRelease>", self.schedule_suggestions)
+
+        if SPECULATIVE_ENABLED: # Restart the background enhancement whenever an input that reaches the LLM changes
+            self.input_text.bind("<KeyRelease>", self.schedule_speculation, add="+")
+            self.style_menu.bind("<<ComboboxSelected>>", self.schedule_speculation)
+            self.lora_menu.bind("<<ComboboxSelected>>", self.schedule_speculation) # The trigger is part of the user prompt
+            self.token_scale.configure(command=self.schedule_speculation)
+            self.nsfw_var.trace_add("write", self.schedule_speculation)
 
         # --- Enhance Button ---
         # Place enhance button in row 1
-        enhance_button = ttk.Button(root, text="✨ Enhance Prompt ✨", command=self.enhance_prompt)
-        enhance_button.grid(row=1, column=0, columnspan=2, pady=10)
+        self.enhance_button = ttk.Button(root, text="✨ Enhance Prompt ✨", command=self.enhance_prompt)
+        self.enhance_button.grid(row=1, column=0, columnspan=2, pady=10)
 
         # --- Populate Output Frame ---
         # (Widgets placed inside output_frame as before)
@@ -149,7 +249,7 @@ class PromptEnhancerGUI:
         # --- Final Check for API Key ---
         if not openai.api_key:
             self.show_status("Warning: OpenAI API key not found.", error=True)
-            enhance_button.configure(state=tk.DISABLED)
+            self.enhance_button.configure(state=tk.DISABLED)
 
     # --- Helper Method for Status Bar ---
     def show_status(self, message, duration=4000, error=False):
@@ -182,14 +282,16 @@ class PromptEnhancerGUI:
     # --- Backend Methods (Mostly Unchanged, except enhance_prompt) ---
 
     def load_lora_triggers(self):
+        hand_triggers = {}
         try:
             if LORA_TRIGGER_PATH.exists():
                 with open(LORA_TRIGGER_PATH, "r", encoding="utf-8") as f:
-                    return json.load(f)
+                    hand_triggers = json.load(f)
         except Exception as e:
             print(f"Error loading LoRA triggers from {LORA_TRIGGER_PATH}: {e}")
             self.show_status(f"Could not load LoRA triggers: {e}", error=True)
-        return {}
+        # Only new or changed files have their headers re-read
+        return merge_triggers(hand_triggers, self.trigger_scanner.scan(LORA_PATH))
 
     def get_lora_trigger(self, lora_name):
         if lora_name in self.lora_triggers:
@@ -219,14 +321,74 @@ class PromptEnhancerGUI:
     def load_loras(self):
         return self.load_files_from_path(LORA_PATH, [".safetensors"])
 
-    def refresh_loras(self):
+    @staticmethod
+    def folder_mtime(path):
+        try:
+            return path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def refresh_loras_if_changed(self):
+        """Menu click: one stat of the LoRA folder; the full rescan only runs if files were added or removed."""
+        if self.folder_mtime(LORA_PATH) != self.lora_folder_mtime:
+            self.refresh_loras(rescan_models=False)
+
+    def refresh_loras(self, rescan_models=True):
+        """Refresh button: re-reads the LoRA folder and trigger headers, and the model index.
+
+        Automatic refreshes pass rescan_models=False: the index is built at startup and on the
+        button, and LoRAs it hasn't seen yet count as compatible until then.
+        """
         self.show_status("Refreshing LoRAs...")
+        self.lora_folder_mtime = self.folder_mtime(LORA_PATH)
         self.lora_triggers = self.load_lora_triggers()
         self.loras = self.load_loras()
-        lora_options = [""] + self.loras
-        self.lora_menu["values"] = lora_options
+        if rescan_models:
+            self.model_index.scan(LORA_PATH, CHECKPOINT_PATH)
+        self.update_lora_choices()
+        if self.lora_suggester:
+            self.lora_suggester.refresh(self.loras, self.lora_triggers, self.style_tags)
         self.show_status(f"Found {len(self.loras)} LoRAs.", duration=3000)
 
+    # --- LoRA / Style Suggestions ---
+    def schedule_suggestions(self, event=None):
+        """Debounces typing so the index is only queried once the user pauses."""
+        if self.suggest_job:
+            self.root.after_cancel(self.suggest_job)
+        self.suggest_job = self.root.after(SUGGEST_DEBOUNCE_MS, self.update_suggestions)
+
+    def update_suggestions(self):
+        self.suggest_job = None
+        if not self.lora_suggester:
+            return
+        if self.lora_suggester.sources_changed(LORA_TRIGGER_PATH, LORA_PATH):
+            self.refresh_loras(rescan_models=False) # loras.json or the LoRA folder changed: re-read and re-index
+        prompt = self.input_text.get("1.0", tk.END).strip()
+        suggestions = self.lora_suggester.suggest(prompt, k=SUGGEST_TOP_K)
+        self.suggestion_items = [("lora", name) for name, _ in suggestions["loras"]]
+        self.suggestion_items += [("style", entry) for entry, _ in suggestions["styles"]]
+        self.suggestion_list.delete(0, tk.END)
+        for kind, value in self.suggestion_items:
+            label = value if kind == "lora" else value.split("::", 1)[0]
+            self.suggestion_list.insert(tk.END, f"{'LoRA' if kind == 'lora' else 'Style'}: {label}")
+
+    def apply_suggestion(self, event=None):
+        selection = self.suggestion_list.curselection()
+        if not selection:
+            return
+        kind, value = self.suggestion_items[selection[0]]
+        if kind == "lora":
+            self.lora_var.set(value)
+        else:
+            self.style_tag_var.set(value)
+
+    def update_lora_choices(self):
+        """Limits the LoRA list to those matching the selected checkpoint's architecture."""
+        compatible = self.model_index.compatible_loras(self.checkpoint_var.get(), self.loras)
+        self.lora_menu["values"] = [""] + compatible
+        if self.lora_var.get() and self.lora_var.get() not in compatible:
+            self.lora_var.set("")
+
     def load_checkpoints(self):
         return self.load_files_from_path(CHECKPOINT_PATH, [".safetensors", ".ckpt"])
 
@@ -261,6 +423,38 @@ class PromptEnhancerGUI:
                 self.show_status(f"Error loading style {file.name}", error=True)
         return sorted(tags, key=str.lower)
 
+    def build_messages(self):
+        """System + user messages for the current prompt, style, conciseness, NSFW setting and LoRA trigger."""
+        prompt = self.input_text.get("1.0", tk.END).strip()
+        token_level = self.token_scale.get()
+        lora = self.lora_var.get()
+        lora_trigger = self.get_lora_trigger(lora) if lora else ""
+
+        if token_level < 25: token_prompt = "Respond using full sentences with rich descriptions. Do not use comma-separated tags."
+        elif token_level < 50: token_prompt = "Respond using short phrases and some natural language. Blend detail with clarity. Minimal use of tags."
+        elif token_level < 75: token_prompt = "Compress the description using very short phrases and comma-separated visual descriptors. Avoid full sentences."
+        else: token_prompt = "Respond ONLY using concise, comma-separated tags and visual descriptors. NO full sentences. Be extremely brief and dense."
+
+        system_prompt = f"You are a prompt enhancer for Stable Diffusion. {STYLES[self.style_var.get()]} {token_prompt}"
+        if self.nsfw_var.get(): system_prompt += " Add relevant NSFW, erotic, or suggestive elements as concise tags if appropriate for the base prompt."
+
+        user_prompt_for_api = prompt
+        if lora_trigger: user_prompt_for_api += f" (incorporate elements related to: {lora_trigger})"
+
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt_for_api}
+        ]
+
+    # --- Speculative Enhancement ---
+    def schedule_speculation(self, *args):
+        """Called on every relevant edit; the speculator debounces and cancels stale runs."""
+        if not openai.api_key or not self.input_text.get("1.0", tk.END).strip():
+            speculator.cancel()
+            return
+        messages = self.build_messages()
+        speculator.schedule(json.dumps(messages), lambda cancelled: speculative_enhancement(messages, cancelled))
+
     def enhance_prompt(self):
         if not openai.api_key:
              messagebox.showerror("API Key Error", "OpenAI API key is missing. Cannot enhance.")
@@ -277,12 +471,9 @@ class PromptEnhancerGUI:
         self.show_status("Enhancing prompt...", duration=None) # None = indefinite until next update
         self.root.update_idletasks() # Force UI update to show status immediately
 
-        selected_style_name = self.style_var.get()
-        nsfw = self.nsfw_var.get()
         lora = self.lora_var.get()
         style_tag_entry = self.style_tag_var.get()
         checkpoint = self.checkpoint_var.get()
-        token_level = self.token_scale.get()
 
         style_tag_prefix = ""
         negative_prompt = ""
@@ -299,31 +490,36 @@ class PromptEnhancerGUI:
 
         lora_prefix = f"<lora:{lora}:0.8>, " if lora else ""
 
-        if token_level < 25: token_prompt = "Respond using full sentences with rich descriptions. Do not use comma-separated tags."
-        elif token_level < 50: token_prompt = "Respond using short phrases and some natural language. Blend detail with clarity. Minimal use of tags."
-        elif token_level < 75: token_prompt = "Compress the description using very short phrases and comma-separated visual descriptors. Avoid full sentences."
-        else: token_prompt = "Respond ONLY using concise, comma-separated tags and visual descriptors. NO full sentences. Be extremely brief and dense."
-
-        system_prompt = f"You are a prompt enhancer for Stable Diffusion. {STYLES[selected_style_name]} {token_prompt}"
-        if nsfw: system_prompt += " Add relevant NSFW, erotic, or suggestive elements as concise tags if appropriate for the base prompt."
-
-        user_prompt_for_api = prompt
-        if lora_trigger: user_prompt_for_api += f" (incorporate elements related to: {lora_trigger})"
+        messages = self.build_messages()
 
         print("--- Sending to OpenAI ---")
-        print(f"System Prompt: {system_prompt}")
-        print(f"User Prompt: {user_prompt_for_api}")
+        print(f"System Prompt: {messages[0]['content']}")
+        print(f"User Prompt: {messages[1]['content']}")
         print("-------------------------")
 
+        # The request (with retries and backoff) runs off the Tk thread so the window stays responsive
+        self.enhance_button.configure(state=tk.DISABLED)
+        parts = (lora_prefix, style_tag_prefix, lora_trigger, checkpoint, negative_prompt)
+        threading.Thread(target=self.enhance_worker, args=(messages, parts), daemon=True).start()
+
+    def enhance_worker(self, messages, parts):
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt_for_api}
-                ]
-            )
-            enhanced_ai_part = response['choices'][0]['message']['content'].strip()
+            result = speculator.take(json.dumps(messages)) if SPECULATIVE_ENABLED else None
+            if SPECULATIVE_ENABLED:
+                print(f"Speculation: {speculator.stats()}")
+            result = result or request_enhancement(messages)
+        except Exception as e:
+            self.root.after(0, self.show_enhance_error, e)
+            return
+        self.root.after(0, self.finish_enhance, result, parts)
+
+    def finish_enhance(self, result, parts):
+        self.enhance_button.configure(state=tk.NORMAL)
+        lora_prefix, style_tag_prefix, lora_trigger, checkpoint, negative_prompt = parts
+        enhanced_ai_part, ai_negative = result
+        try:
+            if ai_negative:
+                negative_prompt = clean_prompt(", ".join(filter(None, [negative_prompt, ai_negative])))
 
             final_prompt_parts = []
             if lora_prefix: final_prompt_parts.append(lora_prefix.strip())
@@ -332,8 +528,7 @@ class PromptEnhancerGUI:
             final_prompt_parts.append(enhanced_ai_part)
 
             final_prompt = ", ".join(filter(None, final_prompt_parts))
-            final_prompt = re.sub(r'(?<!<lora:[^>]+):', '', final_prompt) # Remove colons unless inside lora tag
-            final_prompt = re.sub(r'\s*,\s*', ', ', final_prompt).strip(', ') # Standardize comma spacing
+            final_prompt = clean_prompt(final_prompt) # Remove stray colons, standardize commas, drop repeated tags
 
             self.output_text.delete("1.0", tk.END)
             self.output_text.insert(tk.END, f"--checkpoint {checkpoint}\n{final_prompt}")
@@ -343,14 +538,21 @@ class PromptEnhancerGUI:
             pyperclip.copy(final_prompt)
             # *** THIS IS THE CHANGED LINE ***
             self.show_status("Prompt copied to clipboard!", duration=3000) # Show status instead of messagebox
+        except Exception as e:
+            self.show_enhance_error(e)
 
-        except openai.error.AuthenticationError as e:
+    def show_enhance_error(self, e):
+        self.enhance_button.configure(state=tk.NORMAL)
+        if isinstance(e, openai.error.AuthenticationError):
              messagebox.showerror("API Error", f"Authentication Failed. Check your OpenAI API key.\n{e}")
              self.show_status("API Authentication Error", error=True)
-        except openai.error.RateLimitError as e:
+        elif isinstance(e, openai.error.RateLimitError):
              messagebox.showerror("API Error", f"Rate limit exceeded. Please wait and try again.\n{e}")
              self.show_status("API Rate Limit Error", error=True)
-        except Exception as e:
+        elif isinstance(e, StructuredOutputError):
+             messagebox.showerror("API Error", f"Could not parse the structured reply:\n{e}")
+             self.show_status("Structured Output Error", error=True)
+        else:
             error_type = type(e).__name__
             print(f"Unhandled error during enhancement: {error_type}: {e}") # Log the full error
             messagebox.showerror("API Error", f"Failed to enhance prompt:\n{error_type}: {e}")
@@ -0,0 +1,271 @@
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from bisect import bisect_right
+from pathlib import Path
+
+WILDCARD_PATH = Path("wildcards")  # __name__ reads wildcards/name.txt, one option per line
+MAX_WILDCARD_DEPTH = 8  # Wildcard lines may reference other wildcards, up to this depth
+
+_WILDCARD_RE = re.compile(r"__([\w\-./]+?)__")
+_WEIGHT_RE = re.compile(r"\s*(\d+(?:\.\d*)?)::")
+_SPACES_RE = re.compile(r"\s+")
+_SPACE_BEFORE_COMMA_RE = re.compile(r"\s+,")
+
+
+class TemplateError(ValueError):
+    """Malformed template or missing wildcard file."""
+
+
+class _Choice:
+    """One of several weighted options; each option is a tuple of parts (str or _Choice)."""
+
+    __slots__ = ("options", "weights", "counts", "total", "cumulative")
+
+    def __init__(self, options, weights):
+        self.options = options
+        self.weights = weights
+        self.counts = [_count(option) for option in options]
+        self.total = sum(self.counts)
+        self.cumulative = []
+        running = 0
+        for count in self.counts:
+            self.cumulative.append(running)
+            running += count
+
+
+def _count(parts):
+    total = 1
+    for part in parts:
+        if isinstance(part, _Choice):
+            total *= part.total
+    return total
+
+
+class Template:
+    """Compiled prompt template: literals, {a|b|2::c} alternations and __wildcard__ files.
+
+    len() is the number of distinct combinations (weights only affect sampling).
+    Every combination has an index, so the full product can be walked or sliced
+    lazily without building it.
+    """
+
+    def __init__(self, text, wildcard_path=WILDCARD_PATH):
+        self.text = text
+        self.wildcard_path = Path(wildcard_path)
+        self._wildcards = {}
+        self.parts = self._parse(text, 0)
+        self.total = _count(self.parts)
+
+    # --- Parsing ---
+    def _parse(self, text, depth):
+        return self._parse_sequence(text, 0, depth, top_level=True)[0]
+
+    def _parse_sequence(self, text, pos, depth, top_level=False):
+        parts = []
+        literal = []
+        while pos < len(text):
+            char = text[pos]
+            if char == "{":
+                if literal:
+                    parts.append("".join(literal))
+                    literal = []
+                choice, pos = self._parse_choice(text, pos + 1, depth)
+                parts.append(choice)
+                continue
+            if char in "|}" and not top_level:
+                break
+            if char == "_":
+                match = _WILDCARD_RE.match(text, pos)
+                if match:
+                    if literal:
+                        parts.append("".join(literal))
+                        literal = []
+                    parts.append(self._wildcard(match.group(1), depth))
+                    pos = match.end()
+                    continue
+            literal.append(char)
+            pos += 1
+        if literal:
+            parts.append("".join(literal))
+        return tuple(parts), pos
+
+    def _parse_choice(self, text, pos, depth):
+        options, weights = [], []
+        while True:
+            weight = 1.0
+            match = _WEIGHT_RE.match(text, pos)
+            if match:
+                weight = float(match.group(1))
+                pos = match.end()
+            option, pos = self._parse_sequence(text, pos, depth)
+            options.append(option)
+            weights.append(weight)
+            if pos >= len(text):
+                raise TemplateError(f"Unclosed '{{' in template: {text!r}")
+            if text[pos] == "}":
+                if not any(weights):
+                    raise TemplateError(f"Every option has weight 0 in template: {text!r}")
+                return _Choice(options, weights), pos + 1
+            pos += 1  # '|'
+
+    def _wildcard(self, name, depth):
+        if depth >= MAX_WILDCARD_DEPTH:
+            raise TemplateError(f"Wildcards nested deeper than {MAX_WILDCARD_DEPTH} at __{name}__")
+        if "/" in name or "\\" in name or ".." in name:  # Keep reads inside the wildcard folder
+            raise TemplateError(f"Wildcard name __{name}__ may not contain path separators or '..'")
+        if name not in self._wildcards:
+            path = self.wildcard_path / f"{name}.txt"
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    lines = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+            except OSError as e:
+                raise TemplateError(f"Wildcard __{name}__ not found ({path}): {e}")
+            if not lines:
+                raise TemplateError(f"Wildcard file {path} has no options")
+            options, weights = [], []
+            for line in lines:
+                match = _WEIGHT_RE.match(line)
+                weights.append(float(match.group(1)) if match else 1.0)
+                options.append(self._parse_sequence(line[match.end():] if match else line, 0, depth + 1, top_level=True)[0])
+            if not any(weights):
+                raise TemplateError(f"Every option has weight 0 in wildcard file {path}")
+            self._wildcards[name] = _Choice(options, weights)
+        return self._wildcards[name]
+
+    # --- Expansion ---
+    def __len__(self):
+        return self.total
+
+    def _expand_parts(self, parts, index, pieces):
+        """Appends combination `index` of parts (mixed radix, the last choice varies fastest)."""
+        digits = []
+        for part in reversed(parts):
+            if isinstance(part, _Choice):
+                index, digit = divmod(index, part.total)
+                digits.append(digit)
+        for part in parts:
+            if isinstance(part, _Choice):
+                digit = digits.pop()
+                option = bisect_right(part.cumulative, digit) - 1
+                self._expand_parts(part.options[option], digit - part.cumulative[option], pieces)
+            else:
+                pieces.append(part)
+
+    def expand(self, index):
+        """The combination with this index, 0 <= index < len(self)."""
+        if not 0 <= index < self.total:
+            raise IndexError(f"combination {index} out of range ({self.total})")
+        pieces = []
+        self._expand_parts(self.parts, index, pieces)
+        return _tidy("".join(pieces))
+
+    def _sample_parts(self, parts, rng, pieces):
+        for part in parts:
+            if isinstance(part, _Choice):
+                option = rng.choices(part.options, part.weights)[0]
+                self._sample_parts(option, rng, pieces)
+            else:
+                pieces.append(part)
+
+    def sample_one(self, rng=random):
+        pieces = []
+        self._sample_parts(self.parts, rng, pieces)
+        return _tidy("".join(pieces))
+
+    def iter_all(self, start=0, limit=None):
+        """Lazily walks the full product (optionally a slice of it)."""
+        stop = self.total if limit is None else min(self.total, start + limit)
+        for index in range(start, stop):
+            yield self.expand(index)
+
+    def iter_sample(self, count, seed=None, unique=True):
+        """count random combinations.
+
+        unique: distinct combinations drawn uniformly by index (weights are ignored), or
+        the full product if count covers it. Otherwise: weighted picks, repeats possible.
+        """
+        rng = random.Random(seed)
+        if not unique:
+            for _ in range(count):
+                yield self.sample_one(rng)
+            return
+        if count >= self.total:
+            yield from self.iter_all()
+            return
+        if self.total <= sys.maxsize:
+            indices = rng.sample(range(self.total), count)
+        else:  # range() has no len() past sys.maxsize; collisions are negligible at this size
+            chosen = set()
+            while len(chosen) < count:
+                chosen.add(rng.randrange(self.total))
+            indices = list(chosen)
+        for index in indices:
+            yield self.expand(index)
+
+
+def _tidy(prompt):
+    return _SPACE_BEFORE_COMMA_RE.sub(",", _SPACES_RE.sub(" ", prompt)).strip()
+
+
+# --- Command Line ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expand a prompt template ({a|b}, {2::a|b}, __wildcard__) into base prompts.")
+    parser.add_argument("template")
+    parser.add_argument("--wildcards", default=str(WILDCARD_PATH), help="Folder with <name>.txt wildcard files")
+    parser.add_argument("--sample", type=int, help="Draw N distinct random combinations instead of the full product")
+    parser.add_argument("--weighted", action="store_true", help="With --sample: follow option weights (repeats possible)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--start", type=int, default=0, help="First combination of the full product")
+    parser.add_argument("--limit", type=int, help="At most this many combinations of the full product")
+    parser.add_argument("--count", action="store_true", help="Only print the number of combinations")
+    parser.add_argument("--enhance", action="store_true", help="Enhance every expansion and print NDJSON results")
+    parser.add_argument("--export", metavar="DIR", help="Enhance every expansion and export Fooocus files to DIR")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--style", default="Visual Detail")
+    parser.add_argument("--conciseness", type=float, default=75)
+    parser.add_argument("--nsfw", action="store_true")
+    parser.add_argument("--checkpoint", default="")
+    parser.add_argument("--lora", default="")
+    parser.add_argument("--style-tag", default="", help="Full style tag entry (name::positive::negative)")
+    args = parser.parse_args()
+
+    try:
+        template = Template(args.template, args.wildcards)
+    except TemplateError as e:
+        parser.error(str(e))
+    if args.count:
+        print(len(template))
+        sys.exit(0)
+
+    if args.sample is not None:
+        prompts = template.iter_sample(args.sample, seed=args.seed, unique=not args.weighted)
+    else:
+        prompts = template.iter_all(args.start, args.limit)
+
+    if not (args.enhance or args.export):
+        for prompt in prompts:
+            print(prompt)
+        sys.exit(0)
+
+    from fooocusexport import FooocusExporter, iter_enhanced
+
+    options = {"style": args.style, "nsfw": args.nsfw, "conciseness": args.conciseness,
+               "checkpoint": args.checkpoint, "lora": args.lora, "style_tag": args.style_tag}
+    start = time.perf_counter()
+    done = 0
+    exporter = FooocusExporter(args.export) if args.export else None
+    try:
+        for positive, negative in iter_enhanced(prompts, options, workers=args.workers):
+            done += 1
+            if exporter:
+                exporter.write(positive, negative)
+            else:
+                print(json.dumps({"positive": positive, "negative": negative}), flush=True)
+    finally:
+        if exporter:
+            exporter.close()
+    print(f"Enhanced {done} prompts in {time.perf_counter() - start:.1f}s.", file=sys.stderr)
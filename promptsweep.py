@@ -0,0 +1,162 @@
+import argparse
+import csv
+import html
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PromptEnhanceWeb import (
+    STYLES, assemble_prompt, build_messages, call_ollama, format_error,
+    get_lora_trigger, load_lora_triggers, load_style_tags, parse_style_tag,
+)
+
+SWEEP_WORKERS = 4  # Concurrent LLM calls; the adaptive limiter in call_ollama still applies
+
+# Named conciseness buckets, one representative slider value per system-prompt variant
+CONCISENESS_BUCKETS = {"sentences": 10, "phrases": 40, "compressed": 60, "tags": 90}
+
+
+def parse_conciseness(value):
+    value = str(value).lower()
+    return CONCISENESS_BUCKETS[value] if value in CONCISENESS_BUCKETS else float(value)
+
+
+def expand_sweep(prompt, styles, conciseness_levels, nsfw_values, loras, style_tags):
+    """Cartesian product of the axes, plus the unique LLM requests it actually needs.
+
+    LoRA and style tag only change the local assembly step, and conciseness
+    levels in the same bucket produce the same system prompt, so many
+    combinations share one request.
+    """
+    combos = []
+    unique = {}
+    for style, level, nsfw, lora, style_tag in itertools.product(styles, conciseness_levels, nsfw_values, loras, style_tags):
+        messages = build_messages(prompt, style, nsfw, level)
+        key = json.dumps(messages, sort_keys=True)
+        unique.setdefault(key, messages)
+        combos.append({"style": style, "conciseness": level, "nsfw": nsfw, "lora": lora, "style_tag": style_tag, "key": key})
+    return combos, unique
+
+
+def print_progress(done, total, elapsed):
+    eta = elapsed / done * (total - done) if done else 0.0
+    sys.stdout.write(f"\r[{done}/{total}] {elapsed:.1f}s elapsed, ETA {eta:.1f}s ")
+    sys.stdout.flush()
+    if done == total:
+        sys.stdout.write("\n")
+
+
+def run_sweep(prompt, styles, conciseness_levels, nsfw_values, loras, style_tag_entries,
+              checkpoint="", workers=SWEEP_WORKERS, progress=print_progress):
+    """Runs every unique request once, concurrently, and assembles the full result matrix."""
+    combos, unique = expand_sweep(prompt, styles, conciseness_levels, nsfw_values, loras, list(style_tag_entries))
+    print(f"Sweep: {len(combos)} combinations, {len(unique)} unique LLM requests.")
+
+    results = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(call_ollama, messages): key for key, messages in unique.items()}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                results[futures[future]] = (future.result(), "")
+            except Exception as e:
+                results[futures[future]] = (None, format_error(e))
+            if progress:
+                progress(done, len(futures), time.perf_counter() - start)
+
+    lora_triggers = load_lora_triggers()
+    rows = []
+    for combo in combos:
+        enhanced_ai_part, error = results[combo.pop("key")]
+        style_tag_entry = style_tag_entries[combo["style_tag"]]
+        style_tag_prefix, negative_prompt = parse_style_tag(style_tag_entry)
+        positive = ""
+        if enhanced_ai_part is not None:
+            lora_trigger = get_lora_trigger(combo["lora"], lora_triggers) if combo["lora"] else ""
+            final_prompt = assemble_prompt(enhanced_ai_part, combo["lora"], style_tag_prefix, lora_trigger)
+            positive = f"--checkpoint {checkpoint}\n{final_prompt}"
+        rows.append(dict(combo, positive=positive, negative=negative_prompt, error=error))
+    return rows
+
+
+# --- Result Writers ---
+FIELDS = ["style", "conciseness", "nsfw", "lora", "style_tag", "positive", "negative", "error"]
+
+
+def write_json(rows, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+
+
+def write_csv(rows, path):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_html(rows, path, prompt):
+    """Grid: one row per style/conciseness/NSFW, one column per LoRA/style tag."""
+    columns = list(dict.fromkeys((row["lora"], row["style_tag"]) for row in rows))
+    grid = {}
+    for row in rows:
+        grid.setdefault((row["style"], row["conciseness"], row["nsfw"]), {})[(row["lora"], row["style_tag"])] = row
+
+    out = [f"<html><head><meta charset='utf-8'><title>Sweep: {html.escape(prompt)}</title>",
+           "<style>td,th{border:1px solid #ccc;padding:4px;vertical-align:top;font:12px sans-serif}"
+           " table{border-collapse:collapse} .error{color:#c00}</style></head><body>",
+           f"<h2>{html.escape(prompt)}</h2><table><tr><th>Style / Conciseness / NSFW</th>"]
+    for lora, style_tag in columns:
+        out.append(f"<th>{html.escape(lora or 'no LoRA')}<br>{html.escape(style_tag or 'no style tag')}</th>")
+    out.append("</tr>")
+    for (style, level, nsfw), cells in grid.items():
+        out.append(f"<tr><th>{html.escape(style)}<br>{level:g}{' / NSFW' if nsfw else ''}</th>")
+        for column in columns:
+            row = cells.get(column)
+            if row is None:
+                out.append("<td></td>")
+            elif row["error"]:
+                out.append(f"<td class='error'>{html.escape(row['error'])}</td>")
+            else:
+                out.append(f"<td>{html.escape(row['positive']).replace(chr(10), '<br>')}"
+                           f"<br><i>{html.escape(row['negative'])}</i></td>")
+        out.append("</tr>")
+    out.append("</table></body></html>")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(out))
+
+
+# --- Command Line ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enhance one base prompt across a grid of settings.")
+    parser.add_argument("prompt")
+    parser.add_argument("--styles", nargs="+", default=list(STYLES), choices=list(STYLES), metavar="STYLE")
+    parser.add_argument("--conciseness", nargs="+", default=list(CONCISENESS_BUCKETS),
+                        help=f"Slider values or buckets: {', '.join(CONCISENESS_BUCKETS)}")
+    parser.add_argument("--nsfw", choices=["off", "on", "both"], default="off")
+    parser.add_argument("--loras", nargs="+", default=[""], help="LoRA names ('' for none)")
+    parser.add_argument("--style-tags", nargs="+", default=[""], help="Style tag names ('' for none)")
+    parser.add_argument("--checkpoint", default="")
+    parser.add_argument("--workers", type=int, default=SWEEP_WORKERS)
+    parser.add_argument("--out", default="sweep", help="Output path prefix (.json/.csv/.html are written)")
+    args = parser.parse_args()
+
+    entries_by_name = {entry.split("::", 1)[0]: entry for entry in load_style_tags()}
+    style_tag_entries = {}
+    for name in args.style_tags:
+        if name and name not in entries_by_name:
+            parser.error(f"Unknown style tag: {name}")
+        style_tag_entries[name] = entries_by_name.get(name, "")
+
+    nsfw_values = {"off": [False], "on": [True], "both": [False, True]}[args.nsfw]
+    levels = list(dict.fromkeys(parse_conciseness(value) for value in args.conciseness))
+    rows = run_sweep(args.prompt, args.styles, levels, nsfw_values, args.loras, style_tag_entries,
+                     checkpoint=args.checkpoint, workers=args.workers)
+
+    write_json(rows, f"{args.out}.json")
+    write_csv(rows, f"{args.out}.csv")
+    write_html(rows, f"{args.out}.html", args.prompt)
+    failed = sum(1 for row in rows if row["error"])
+    print(f"Wrote {len(rows)} results to {args.out}.json/.csv/.html ({failed} failed).")
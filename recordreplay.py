@@ -0,0 +1,524 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import requests
+
+REPLAY_MODE_ENV = "PROMPT_BACKEND_MODE"  # "record" or "replay"; unset leaves every backend live
+REPLAY_FIXTURE_ENV = "PROMPT_BACKEND_FIXTURE"
+REPLAY_TIME_SCALE_ENV = "PROMPT_BACKEND_TIME_SCALE"
+REPLAY_FIXTURE = "backend_fixture.jsonl"
+REPLAY_TIME_SCALE = 1.0  # 1.0 replays the recorded timing, 0.5 twice as fast, 0 instantly
+RECORDED_URL_SUFFIX = "/chat/completions"  # Other requests.post calls (e.g. to the local API) stay live
+
+_VOLATILE_FIELDS = ("api_key", "api_base", "timeout", "request_timeout")
+
+
+class ReplayMiss(RuntimeError):
+    """Replay was asked for a request that is not in the fixture."""
+
+
+class ReplayedError(RuntimeError):
+    """Stands in for a recorded exception whose class can't be raised again."""
+
+
+def request_key(backend, request):
+    """Stable hash of a normalized request; hosts, keys and timeouts don't change it."""
+    normalized = {k: v for k, v in request.items() if k not in _VOLATILE_FIELDS}
+    text = json.dumps([backend, normalized], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:20]
+
+
+class Fixture:
+    """JSON lines of recorded calls. Repeated requests are served in recorded order, then cycled."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._served = {}
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self.dropped = 0  # Streams the caller abandoned before the end; not recorded
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+        return self
+
+    def append(self, entry):
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.recorded += 1
+
+    def take(self, backend, request):
+        key = request_key(backend, request)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise ReplayMiss(f"No recorded {backend} call for this request (key {key}) in {self.path}")
+            index = self._served.get(key, 0)
+            self._served[key] = index + 1
+            self.replayed += 1
+            return entries[index % len(entries)]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": sum(len(e) for e in self._entries.values()), "recorded": self.recorded,
+                    "replayed": self.replayed, "misses": self.misses, "dropped": self.dropped}
+
+
+class _Recording:
+    """Collects one call's outcome and timing, then appends it to the fixture."""
+
+    def __init__(self, fixture, backend, request):
+        self.fixture = fixture
+        self.entry = {"backend": backend, "key": request_key(backend, request),
+                      "request": {k: v for k, v in request.items() if k not in _VOLATILE_FIELDS}}
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.chunks = None
+
+    def chunk(self, data):
+        """One streamed chunk, with the delay since the previous one."""
+        now = time.perf_counter()
+        if self.chunks is None:
+            self.chunks = []
+        self.chunks.append([round(now - self.last, 6), data])
+        self.last = now
+
+    def finish(self, **fields):
+        self.entry.update(fields)
+        self.entry["latency"] = round(time.perf_counter() - self.start, 6)
+        if self.chunks is not None:
+            self.entry["chunks"] = self.chunks
+        self.fixture.append(self.entry)
+
+    def fail(self, error):
+        self.finish(error={"type": type(error).__name__, "module": type(error).__module__, "message": str(error)})
+
+
+def _raise_recorded(error, candidates):
+    for module in candidates:
+        cls = getattr(module, error["type"], None)
+        if isinstance(cls, type) and issubclass(cls, BaseException):
+            try:
+                raise cls(error["message"])
+            except TypeError:  # Constructor needs more than a message
+                break
+    raise ReplayedError(f"{error['type']}: {error['message']}")
+
+
+class _Player:
+    """Sleeps out recorded delays, scaled."""
+
+    def __init__(self, entry, time_scale):
+        self.entry = entry
+        self.time_scale = time_scale
+
+    def wait(self, seconds):
+        if self.time_scale > 0 and seconds > 0:
+            time.sleep(seconds * self.time_scale)
+
+    def whole(self):
+        """Waits the full latency of a non-streamed call."""
+        self.wait(self.entry.get("latency", 0))
+
+    def chunks(self):
+        for delay, data in self.entry.get("chunks") or []:
+            self.wait(delay)
+            yield data
+
+
+# --- Ollama (requests.post to an OpenAI-compatible endpoint) ---
+class _RecordingResponse:
+    """Wraps a live requests.Response and records what the caller reads from it."""
+
+    def __init__(self, response, recording, stream):
+        self._response = response
+        self._recording = recording
+        self._stream = stream
+        self._done = False
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def raise_for_status(self):
+        if self._response.status_code >= 400 and not self._done:
+            self._done = True
+            self._recording.finish(status=self._response.status_code, body=self._response.text,
+                                   headers=dict(self._response.headers))
+        return self._response.raise_for_status()
+
+    def json(self, **kwargs):
+        if not self._done:
+            self._done = True
+            self._recording.finish(status=self._response.status_code, body=self._response.text,
+                                   headers=dict(self._response.headers))
+        return self._response.json(**kwargs)
+
+    def iter_lines(self, chunk_size=512, decode_unicode=False, delimiter=None):
+        for line in self._response.iter_lines(chunk_size=chunk_size, decode_unicode=True, delimiter=delimiter):
+            self._recording.chunk(line)
+            yield line if decode_unicode else line.encode("utf-8")
+        if not self._done:
+            self._done = True
+            self._recording.finish(status=self._response.status_code, headers=dict(self._response.headers))
+
+    def close(self):
+        if not self._done:
+            self._done = True
+            chunks = self._recording.chunks
+            if self._stream and chunks and chunks[-1][1].strip() == "data: [DONE]":
+                # Callers stop reading at the SSE terminator, so the stream is complete
+                self._recording.finish(status=self._response.status_code, headers=dict(self._response.headers))
+            elif self._stream:
+                with self._recording.fixture._lock:
+                    self._recording.fixture.dropped += 1
+            else:
+                self._recording.finish(status=self._response.status_code, body=self._response.text,
+                                       headers=dict(self._response.headers))
+        self._response.close()
+
+
+class _ReplayResponse:
+    """Enough of requests.Response for the apps: status, json/text, iter_lines and raise_for_status."""
+
+    def __init__(self, entry, time_scale):
+        self._player = _Player(entry, time_scale)
+        self.status_code = entry.get("status", 200)
+        self.headers = requests.structures.CaseInsensitiveDict(entry.get("headers") or {})
+        self.text = entry.get("body", "")
+        self.content = self.text.encode("utf-8")
+        self.ok = self.status_code < 400
+        if "chunks" not in entry:
+            self._player.whole()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error (replayed)", response=self)
+
+    def json(self, **kwargs):
+        return json.loads(self.text, **kwargs)
+
+    def iter_lines(self, chunk_size=512, decode_unicode=False, delimiter=None):
+        for line in self._player.chunks():
+            yield line if decode_unicode else line.encode("utf-8")
+
+
+def _patch_requests(fixture, mode, time_scale):
+    live_post = requests.post
+
+    def post(url, data=None, json=None, **kwargs):
+        if not str(url).endswith(RECORDED_URL_SUFFIX):
+            return live_post(url, data=data, json=json, **kwargs)
+        stream = kwargs.get("stream", False)
+        request = {"body": json if json is not None else data, "stream": stream}
+        if mode == "replay":
+            entry = fixture.take("ollama", request)
+            if "error" in entry:
+                _raise_recorded(entry["error"], [requests.exceptions])
+            return _ReplayResponse(entry, time_scale)
+        recording = _Recording(fixture, "ollama", request)
+        try:
+            response = live_post(url, data=data, json=json, **kwargs)
+        except requests.exceptions.RequestException as e:
+            recording.fail(e)
+            raise
+        return _RecordingResponse(response, recording, stream)
+
+    requests.post = post
+
+
+# --- OpenAI (openai<1.0 ChatCompletion.create) ---
+def _plain(obj):
+    """OpenAIObject (a dict subclass) -> plain JSON data."""
+    return json.loads(json.dumps(obj, default=str))
+
+
+def _patch_openai(fixture, mode, time_scale):
+    try:
+        import openai
+    except ImportError:
+        return
+    live_create = openai.ChatCompletion.create
+    errors = [getattr(openai, "error", openai)]
+
+    def replay_stream(player):
+        yield from player.chunks()
+
+    def record_stream(chunks, recording):
+        finished = False
+        try:
+            for chunk in chunks:
+                recording.chunk(_plain(chunk))
+                yield chunk
+            finished = True
+            recording.finish()
+        finally:
+            if not finished:
+                with fixture._lock:
+                    fixture.dropped += 1
+
+    def create(*args, **kwargs):
+        request = dict(kwargs)
+        if mode == "replay":
+            entry = fixture.take("openai", request)
+            player = _Player(entry, time_scale)
+            if "error" in entry:
+                player.whole()
+                _raise_recorded(entry["error"], errors)
+            if kwargs.get("stream"):
+                return replay_stream(player)
+            player.whole()
+            return entry["response"]
+        recording = _Recording(fixture, "openai", request)
+        try:
+            response = live_create(*args, **kwargs)
+        except Exception as e:
+            recording.fail(e)
+            raise
+        if kwargs.get("stream"):
+            return record_stream(response, recording)
+        recording.finish(response=_plain(response))
+        return response
+
+    openai.ChatCompletion.create = create
+
+
+# --- Gemini (google.generativeai GenerativeModel.generate_content; chat sessions call it too) ---
+def _genai_contents(contents):
+    """Plain [role, [texts]] form of whatever generate_content was given."""
+    if isinstance(contents, str):
+        return [["user", [contents]]]
+    if isinstance(contents, dict):
+        return [[contents.get("role", "user"), [str(p) for p in contents.get("parts", [])]]]
+    if isinstance(contents, (list, tuple)):
+        return [turn for item in contents for turn in _genai_contents(item)]
+    parts = getattr(contents, "parts", None)
+    if parts is not None:
+        return [[getattr(contents, "role", "user"), [getattr(p, "text", str(p)) for p in parts]]]
+    return [["user", [str(contents)]]]
+
+
+def _genai_content(text):
+    """A model Content message, so ChatSession can add the replayed reply to its history."""
+    try:
+        import google.generativeai as genai
+        protos = getattr(genai, "protos", None)
+        if protos is None:
+            import google.ai.generativelanguage as protos
+        return protos.Content(role="model", parts=[protos.Part(text=text)])
+    except (ImportError, AttributeError):
+        return SimpleNamespace(role="model", parts=[SimpleNamespace(text=text)])
+
+
+def _genai_usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    return {name: getattr(usage, name, None) for name in
+            ("prompt_token_count", "candidates_token_count", "total_token_count")} if usage else None
+
+
+def _genai_text(response):
+    try:
+        return response.text
+    except ValueError:  # Blocked or non-text parts
+        return ""
+
+
+def _genai_block_reason(response):
+    try:
+        reason = response.prompt_feedback.block_reason
+    except AttributeError:
+        return 0
+    return getattr(reason, "name", reason) if reason else 0
+
+
+class _ReplayGenaiResponse:
+    """Replayed GenerateContentResponse: .text, iteration over chunks, usage and prompt feedback."""
+
+    def __init__(self, entry, player, stream):
+        self._entry = entry
+        self._player = player
+        self._stream = stream
+        self._done = not stream
+        self.text = entry.get("text", "")
+        self.usage_metadata = SimpleNamespace(**entry["usage"]) if entry.get("usage") else None
+        self.prompt_feedback = SimpleNamespace(block_reason=entry.get("block_reason", 0))
+        self.candidates = [SimpleNamespace(content=_genai_content(self.text), finish_reason=1)] if self.text else []
+        if not stream:
+            player.whole()
+
+    def __iter__(self):
+        if not self._stream:
+            yield self
+            return
+        for text in self._player.chunks():
+            yield SimpleNamespace(text=text)
+        self._done = True
+
+    def resolve(self):
+        for _ in self:
+            pass
+
+
+class _RecordingGenaiStream:
+    """Wraps a live streamed response; chunks are recorded as the caller iterates."""
+
+    def __init__(self, response, recording):
+        self._response = response
+        self._recording = recording
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __iter__(self):
+        finished = False
+        try:
+            for chunk in self._response:
+                self._recording.chunk(_genai_text(chunk))
+                yield chunk
+            finished = True
+            self._recording.finish(text="".join(text for _, text in self._recording.chunks or []),
+                                   usage=_genai_usage(self._response),
+                                   block_reason=_genai_block_reason(self._response))
+        finally:
+            if not finished:
+                with self._recording.fixture._lock:
+                    self._recording.fixture.dropped += 1
+
+    def resolve(self):
+        for _ in self:
+            pass
+
+
+def _patch_genai(fixture, mode, time_scale):
+    try:
+        import google.generativeai as genai
+    except ImportError:
+        return
+    live_generate = genai.GenerativeModel.generate_content
+    errors = []
+    try:
+        from google.api_core import exceptions as api_exceptions
+        errors.append(api_exceptions)
+    except ImportError:
+        pass
+    try:
+        from google.generativeai.types import generation_types
+        errors.append(generation_types)
+    except ImportError:
+        pass
+
+    def generate_content(self, contents=None, *args, stream=False, **kwargs):
+        request = {"model": self.model_name, "contents": _genai_contents(contents)}
+        if mode == "replay":
+            entry = fixture.take("gemini", request)
+            player = _Player(entry, time_scale)
+            if "error" in entry:
+                player.whole()
+                _raise_recorded(entry["error"], errors)
+            return _ReplayGenaiResponse(entry, player, stream)
+        recording = _Recording(fixture, "gemini", request)
+        try:
+            response = live_generate(self, contents, *args, stream=stream, **kwargs)
+        except Exception as e:
+            recording.fail(e)
+            raise
+        if stream:
+            return _RecordingGenaiStream(response, recording)
+        recording.finish(text=_genai_text(response), usage=_genai_usage(response),
+                         block_reason=_genai_block_reason(response))
+        return response
+
+    genai.GenerativeModel.generate_content = generate_content
+
+
+# --- Installation ---
+_installed = None
+
+
+def install(mode, fixture_path=REPLAY_FIXTURE, time_scale=REPLAY_TIME_SCALE):
+    """Routes every backend through the fixture: "record" calls live and saves, "replay" never touches the network.
+
+    Safe to call more than once; only the first call patches. Returns the Fixture.
+    """
+    global _installed
+    if _installed is not None:
+        return _installed
+    if mode not in ("record", "replay"):
+        raise ValueError(f"Unknown backend mode '{mode}' (use 'record' or 'replay')")
+    fixture = Fixture(fixture_path)
+    if mode == "replay":
+        fixture.load()
+    _patch_requests(fixture, mode, time_scale)
+    _patch_openai(fixture, mode, time_scale)
+    _patch_genai(fixture, mode, time_scale)
+    _installed = fixture
+    print(f"Backend {mode} mode: {fixture_path}" + (f" (time scale {time_scale})" if mode == "replay" else ""))
+    return fixture
+
+
+def install_from_env():
+    """install() when PROMPT_BACKEND_MODE is set; a no-op otherwise."""
+    mode = os.getenv(REPLAY_MODE_ENV, "").strip().lower()
+    if not mode:
+        return None
+    return install(mode, os.getenv(REPLAY_FIXTURE_ENV, REPLAY_FIXTURE),
+                   float(os.getenv(REPLAY_TIME_SCALE_ENV, REPLAY_TIME_SCALE)))
+
+
+def replay_stats():
+    return _installed.stats() if _installed is not None else None
+
+
+# --- Fixture summary ---
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize a recorded backend fixture.")
+    parser.add_argument("fixture", nargs="?", default=REPLAY_FIXTURE)
+    args = parser.parse_args()
+
+    summary = {}
+    with open(args.fixture, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            item = summary.setdefault(entry["backend"], {"calls": 0, "streamed": 0, "errors": 0, "seconds": 0.0, "keys": set()})
+            item["calls"] += 1
+            item["streamed"] += "chunks" in entry
+            item["errors"] += "error" in entry or entry.get("status", 200) >= 400
+            item["seconds"] += entry.get("latency", 0)
+            item["keys"].add(entry["key"])
+    for backend, item in sorted(summary.items()):
+        print(f"{backend}: {item['calls']} calls ({len(item['keys'])} distinct, {item['streamed']} streamed, "
+              f"{item['errors']} errors), {item['seconds']:.1f}s recorded")
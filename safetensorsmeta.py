@@ -0,0 +1,155 @@
+import json
+import os
+import struct
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+HEADER_CACHE_PATH = Path("lora_header_cache.json")  # Scan results keyed by path, size and mtime
+MAX_HEADER_BYTES = 32 * 1024 * 1024  # Refuse absurd header lengths from corrupt files
+SCAN_WORKERS = 8
+TRIGGER_MAX_TAGS = 3
+TRIGGER_MIN_SHARE = 0.9  # A tag counts as a trigger if it appears in ~all training images
+
+
+def read_safetensors_header(path):
+    """Reads only the JSON header of a .safetensors file (8-byte length + JSON), never the weights."""
+    with open(path, "rb") as f:
+        prefix = f.read(8)
+        if len(prefix) < 8:
+            raise ValueError("file too small for a safetensors header")
+        (header_len,) = struct.unpack("<Q", prefix)
+        if header_len > MAX_HEADER_BYTES:
+            raise ValueError(f"header length {header_len} exceeds {MAX_HEADER_BYTES}")
+        data = f.read(header_len)
+    if len(data) < header_len:
+        raise ValueError("truncated safetensors header")
+    return json.loads(data)
+
+
+def extract_trigger(metadata):
+    """Derives trigger words from kohya/modelspec training metadata, or '' if there is nothing usable."""
+    for key in ("modelspec.trigger_phrase", "ss_trigger_words", "trigger_words"):
+        value = metadata.get(key)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+
+    raw_frequency = metadata.get("ss_tag_frequency")
+    if not raw_frequency:
+        return ""
+    try:
+        frequency = json.loads(raw_frequency) if isinstance(raw_frequency, str) else raw_frequency
+    except json.JSONDecodeError:
+        return ""
+
+    # ss_tag_frequency is {dataset folder: {tag: count}}; merge the folders
+    totals = Counter()
+    for tags in frequency.values():
+        if isinstance(tags, dict):
+            for tag, count in tags.items():
+                tag = tag.strip()
+                if tag and isinstance(count, (int, float)):
+                    totals[tag] += count
+    if not totals:
+        return ""
+    top_count = totals.most_common(1)[0][1]
+    triggers = [tag for tag, count in totals.most_common(TRIGGER_MAX_TAGS) if count >= top_count * TRIGGER_MIN_SHARE]
+    return ", ".join(triggers)
+
+
+class TriggerScanner:
+    """Scans .safetensors headers for trigger words, caching results by file size and mtime."""
+
+    def __init__(self, cache_path=HEADER_CACHE_PATH, workers=SCAN_WORKERS):
+        self.cache_path = Path(cache_path)
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.entries = self._load_cache()  # path -> {'name', 'size', 'mtime_ns', 'trigger'}
+
+    def _load_cache(self):
+        try:
+            if self.cache_path.exists():
+                with open(self.cache_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"Error loading header cache from {self.cache_path}: {e}")
+        return {}
+
+    def _save_cache(self):
+        try:
+            tmp_path = self.cache_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"Error saving header cache to {self.cache_path}: {e}")
+
+    @staticmethod
+    def _scan_file(path, stat):
+        entry = {"name": path.stem, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "trigger": ""}
+        try:
+            header = read_safetensors_header(path)
+            entry["trigger"] = extract_trigger(header.get("__metadata__") or {})
+        except Exception as e:
+            print(f"Could not read safetensors header of {path.name}: {e}")
+        return str(path), entry
+
+    def scan(self, lora_dir):
+        """Re-reads headers of new or changed files under lora_dir. Returns the trigger registry."""
+        lora_dir = Path(lora_dir)
+        if not lora_dir.is_dir():
+            return self.triggers()
+
+        with self._lock:
+            fresh = {}
+            todo = []
+            for path in lora_dir.rglob("*.safetensors"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                cached = self.entries.get(str(path))
+                if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+                    fresh[str(path)] = cached
+                else:
+                    todo.append((path, stat))
+
+            if todo:
+                with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    for key, entry in pool.map(lambda item: self._scan_file(*item), todo):
+                        fresh[key] = entry
+            removed = len(self.entries.keys() - fresh.keys())
+            self.entries = fresh
+            if todo or removed:
+                print(f"Scanned {len(todo)} LoRA headers ({len(fresh)} cached, {removed} removed).")
+                self._save_cache()
+        return self.triggers()
+
+    def triggers(self):
+        """Scanned triggers in the loras.json shape: {lora name: {'trigger': ...}}."""
+        with self._lock:
+            return {entry["name"]: {"trigger": entry["trigger"]}
+                    for entry in self.entries.values() if entry["trigger"]}
+
+
+def merge_triggers(hand_maintained, scanned):
+    """loras.json entries win; scanned triggers fill in LoRAs it doesn't list."""
+    merged = dict(scanned)
+    merged.update(hand_maintained)
+    return merged
+
+
+# --- Scan a LoRA folder from the command line ---
+if __name__ == "__main__":
+    import sys
+    import time
+
+    if len(sys.argv) < 2:
+        print("Usage: python safetensorsmeta.py <lora folder>")
+        sys.exit(1)
+    start = time.perf_counter()
+    found = TriggerScanner().scan(sys.argv[1])
+    print(f"{len(found)} LoRAs with triggers in {time.perf_counter() - start:.2f}s")
+    for name, entry in sorted(found.items()):
+        print(f"{name}: {entry['trigger']}")
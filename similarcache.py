@@ -0,0 +1,165 @@
+import random
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+
+SIMILAR_THRESHOLD = 0.75  # Jaccard similarity of normalized word sets needed for a hit
+REORDERED_SIMILARITY = 0.99  # Reported for equal word sets whose text differs ("dog chasing cat" vs "cat chasing dog")
+SIMILAR_MAX_ENTRIES = 500000
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16  # 16 bands x 4 rows: pairs at 0.75 similarity share a bucket 99.8% of the time, at 0.3 only 12%
+MAX_BUCKET_SIZE = 64  # Newest entries kept per bucket, so a hot bucket can't slow lookups down
+
+_WORD_RE = re.compile(r"[^\W_]+")
+_STOPWORDS = frozenset("a an the of in on at to and or with by for from into over under is are of its their his her".split())
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(_PRIME)) for _ in range(MINHASH_PERMUTATIONS)]
+
+
+def normalize(prompt):
+    """Casefolded words in their original order; only equal normalized text counts as an exact hit."""
+    return " ".join(_WORD_RE.findall(prompt.casefold()))
+
+
+def shingles(prompt):
+    """Normalized word set: case, punctuation, word order, stopwords and plural -s don't matter."""
+    words = _WORD_RE.findall(prompt.casefold())
+    tokens = {word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+              for word in words if word not in _STOPWORDS}
+    return frozenset(tokens or words)
+
+
+@lru_cache(maxsize=200000)
+def _token_hashes(token):
+    h = zlib.crc32(token.encode("utf-8"))
+    return [(a * h + b) % _PRIME for a, b in _PERMUTATIONS]
+
+
+def minhash(tokens):
+    return [min(column) for column in zip(*(_token_hashes(token) for token in tokens))]
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+class _Entry:
+    __slots__ = ("tokens", "prompt", "value", "band_keys")
+
+    def __init__(self, tokens, prompt, value, band_keys):
+        self.tokens = tokens
+        self.prompt = prompt
+        self.value = value
+        self.band_keys = band_keys
+
+
+class SimilarCache:
+    """Approximate cache: returns the result of an earlier, nearly identical base prompt.
+
+    Prompts are only compared within the same settings (style, conciseness, LoRA, ...).
+    MinHash/LSH narrows the lookup to a handful of candidates whose exact Jaccard
+    similarity is then checked, so lookups stay well under a millisecond at hundreds of
+    thousands of entries. Only prompts with the same normalized text (casing and punctuation
+    aside) hit through a plain dict with similarity 1.0; anything else, even the same words in
+    a different order, is reported below 1.0 so callers flag it as similar.
+    """
+
+    def __init__(self, threshold=SIMILAR_THRESHOLD, max_entries=SIMILAR_MAX_ENTRIES, bands=LSH_BANDS):
+        if MINHASH_PERMUTATIONS % bands:
+            raise ValueError(f"bands must divide {MINHASH_PERMUTATIONS}")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.bands = bands
+        self.rows = MINHASH_PERMUTATIONS // bands
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (settings, normalized text) -> _Entry, oldest first
+        self._buckets = {}  # band key -> list of entry keys
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+
+    def _band_keys(self, settings, tokens):
+        signature = minhash(tokens)
+        return [hash((settings, band, tuple(signature[band * self.rows:(band + 1) * self.rows])))
+                for band in range(self.bands)]
+
+    def get(self, settings, prompt):
+        """(value, similarity, earlier prompt) of the best match at or above the threshold, else None."""
+        start = time.perf_counter()
+        tokens = shingles(prompt)
+        with self._lock:
+            match = None
+            entry = self._entries.get((settings, normalize(prompt)))
+            if entry is not None:
+                match = (entry.value, 1.0, entry.prompt)
+            elif tokens:
+                best, best_similarity = None, self.threshold
+                seen = set()
+                for band_key in self._band_keys(settings, tokens):
+                    for key in self._buckets.get(band_key, ()):
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        candidate = self._entries[key]
+                        similarity = min(jaccard(tokens, candidate.tokens), REORDERED_SIMILARITY)
+                        if similarity >= best_similarity:
+                            best, best_similarity = candidate, similarity
+                if best is not None:
+                    match = (best.value, round(best_similarity, 3), best.prompt)
+            if match is None:
+                self.misses += 1
+            elif match[1] == 1.0:
+                self.hits += 1
+            else:
+                self.similar_hits += 1
+            self.lookup_seconds += time.perf_counter() - start
+            return match
+
+    def put(self, settings, prompt, value):
+        tokens = shingles(prompt)
+        if not tokens:
+            return
+        key = (settings, normalize(prompt))
+        band_keys = self._band_keys(settings, tokens)
+        with self._lock:
+            if key in self._entries:
+                self._entries[key].value = value
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = _Entry(tokens, prompt, value, band_keys)
+            for band_key in band_keys:
+                bucket = self._buckets.setdefault(band_key, [])
+                bucket.append(key)
+                if len(bucket) > MAX_BUCKET_SIZE:
+                    del bucket[0]
+            while len(self._entries) > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        key, entry = self._entries.popitem(last=False)
+        for band_key in entry.band_keys:
+            bucket = self._buckets.get(band_key)
+            if bucket is None:
+                continue
+            try:
+                bucket.remove(key)
+            except ValueError:  # Already pushed out of a full bucket
+                pass
+            if not bucket:
+                del self._buckets[band_key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {"entries": len(self._entries), "exact_hits": self.hits, "similar_hits": self.similar_hits,
+                    "misses": self.misses,
+                    "hit_rate": round((self.hits + self.similar_hits) / lookups, 3) if lookups else 0.0,
+                    "mean_lookup_ms": round(self.lookup_seconds / lookups * 1000, 4) if lookups else None}
@@ -0,0 +1,111 @@
+import threading
+
+
+class _Call:
+    """One in-flight upstream call shared by every caller with the same key."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks = []
+        self.finished = False
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent identical requests onto one upstream call.
+
+    Only calls that overlap in time are shared; once a call finishes its key is
+    forgotten, so this never serves stale results the way a cache would.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.requests = 0
+        self.upstream_calls = 0
+
+    def _join(self, key):
+        with self._lock:
+            self.requests += 1
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self.upstream_calls += 1
+            return call, True
+
+    def _finish(self, key, call, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        with call.cond:
+            call.result = result
+            call.error = error
+            call.finished = True
+            call.cond.notify_all()
+
+    def do(self, key, fn):
+        """Returns fn(), running it at most once across concurrent callers of key."""
+        call, leader = self._join(key)
+        if leader:
+            try:
+                result = fn()
+            except BaseException as e:
+                self._finish(key, call, error=e)
+                raise
+            self._finish(key, call, result=result)
+            return result
+
+        with call.cond:
+            call.cond.wait_for(lambda: call.finished)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stream(self, key, fn):
+        """Yields the chunks of fn()'s iterator, sharing one upstream stream per key.
+
+        A background thread drains the upstream iterator so a slow or abandoned
+        consumer never stalls the other callers.
+        """
+        call, leader = self._join(key)
+        if leader:
+            def drain():
+                try:
+                    for chunk in fn():
+                        with call.cond:
+                            call.chunks.append(chunk)
+                            call.cond.notify_all()
+                except BaseException as e:
+                    self._finish(key, call, error=e)
+                else:
+                    self._finish(key, call)
+
+            threading.Thread(target=drain, daemon=True).start()
+
+        index = 0
+        while True:
+            with call.cond:
+                call.cond.wait_for(lambda: index < len(call.chunks) or call.finished)
+                pending = call.chunks[index:]
+                finished = call.finished
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if finished and index >= len(call.chunks):
+                break
+        if call.error is not None:
+            raise call.error
+
+    def stats(self):
+        with self._lock:
+            requests = self.requests
+            upstream = self.upstream_calls
+        coalesced = requests - upstream
+        return {
+            "requests": requests,
+            "upstream_calls": upstream,
+            "coalesced": coalesced,
+            "coalescing_ratio": round(coalesced / requests, 3) if requests else 0.0,
+        }
@@ -0,0 +1,243 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+import requests
+
+import PromptEnhanceWeb as web
+from enhanceapi import serve_api
+from stubollama import StubOllama
+
+try:
+    import psutil
+except ImportError:  # Falls back to /proc (Linux) or the peak RSS from resource
+    psutil = None
+
+SOAK_DURATION = 3600.0  # Seconds
+SOAK_WARMUP = 60.0  # Seconds before the baseline is taken, so imports and caches settle
+SOAK_SAMPLE_INTERVAL = 30.0
+SOAK_CONCURRENCY = 4
+SOAK_MIX = "enhance=5,stream=3,api=2,suggest=2,refresh=1"
+MAX_RSS_GROWTH_MB = 50.0
+MAX_TRACED_GROWTH_MB = 20.0
+TRACE_FRAMES = 5
+TOP_GROWTH_SITES = 10
+
+_WORDS = ("castle knight dragon forest city neon rain portrait cat ship ocean desert robot garden "
+          "mountain witch tavern temple storm sunset ruins market train lantern wolf bridge").split()
+
+
+def current_rss():
+    """Resident set size in bytes."""
+    if psutil:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Peak, not current, on this fallback
+
+
+def log(message):
+    """Progress output; goes to the real stdout even while the app's own prints are silenced."""
+    print(message, file=sys.__stdout__, flush=True)
+
+
+def parse_mix(text):
+    """'enhance=5,stream=3' -> ([names], [weights])."""
+    names, weights = [], []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name.strip()}' (choose from {', '.join(OPERATIONS)})")
+        names.append(name.strip())
+        weights.append(float(weight or 1))
+    return names, weights
+
+
+def random_inputs(rng):
+    prompt = " ".join(rng.sample(_WORDS, rng.randint(2, 5)))
+    return (prompt, rng.choice(list(web.STYLES)), rng.random() < 0.2, rng.choice([10, 40, 60, 90]),
+            "", rng.choice([""] + (web.loras or [""])), "")
+
+
+# --- Operations: each returns True on success ---
+def op_enhance(rng, api_url):
+    positive, _ = web.enhance_prompt(*random_inputs(rng))
+    return positive.startswith("--checkpoint")
+
+
+def op_stream(rng, api_url):
+    positive = ""
+    for positive, _ in web.enhance_prompt_stream(*random_inputs(rng)):
+        pass
+    return positive.startswith("--checkpoint")
+
+
+def op_api(rng, api_url):
+    prompt, style, nsfw, level, checkpoint, lora, _ = random_inputs(rng)
+    item = {"prompt": prompt, "style": style, "nsfw": nsfw, "conciseness": level, "lora": lora}
+    return requests.post(f"{api_url}/enhance", json=item, timeout=60).status_code == 200
+
+
+def op_suggest(rng, api_url):
+    web.suggest_for_prompt(random_inputs(rng)[0])
+    return True
+
+
+def op_refresh(rng, api_url):
+    web.refresh_loras("")
+    return True
+
+
+OPERATIONS = {"enhance": op_enhance, "stream": op_stream, "api": op_api, "suggest": op_suggest, "refresh": op_refresh}
+
+
+class SoakRunner:
+    def __init__(self, mix=SOAK_MIX, concurrency=SOAK_CONCURRENCY, seed=0):
+        self.names, self.weights = parse_mix(mix)
+        self.concurrency = concurrency
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.counts = {name: 0 for name in self.names}
+        self.errors = 0
+        self.stop = threading.Event()
+
+    def worker(self, index, api_url):
+        rng = random.Random(self.seed + index)
+        while not self.stop.is_set():
+            name = rng.choices(self.names, self.weights)[0]
+            try:
+                ok = OPERATIONS[name](rng, api_url)
+            except Exception as e:
+                log(f"{name} raised {type(e).__name__}: {e}")
+                ok = False
+            with self.lock:
+                self.counts[name] += 1
+                self.errors += not ok
+
+    def totals(self):
+        with self.lock:
+            return sum(self.counts.values()), self.errors, dict(self.counts)
+
+
+def top_growth(baseline, snapshot, limit=TOP_GROWTH_SITES):
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+    stats = snapshot.filter_traces(filters).compare_to(baseline.filter_traces(filters), "lineno")
+    return [{"site": str(stat.traceback), "size_diff_kb": round(stat.size_diff / 1024, 1), "count_diff": stat.count_diff}
+            for stat in stats[:limit] if stat.size_diff > 0]
+
+
+def run_soak(duration=SOAK_DURATION, warmup=SOAK_WARMUP, sample_interval=SOAK_SAMPLE_INTERVAL,
+             concurrency=SOAK_CONCURRENCY, mix=SOAK_MIX, latency=0.05,
+             max_rss_growth_mb=MAX_RSS_GROWTH_MB, max_traced_growth_mb=MAX_TRACED_GROWTH_MB):
+    """Drives the web handlers against a stub Ollama and returns (passed, report)."""
+    tracemalloc.start(TRACE_FRAMES)
+    stub = StubOllama(latency=latency).start()
+    web.OLLAMA_ENDPOINT = stub.endpoint
+    web.refresh_loras("")  # Populates the module-level lists the UI normally loads in __main__
+    api_server = serve_api(web.run_enhancement, web.format_error, stats_fn=web.backend_stats, port=0,
+                           styles=web.STYLES)
+    api_url = "http://{}:{}".format(*api_server.server_address[:2])
+
+    runner = SoakRunner(mix, concurrency)
+    threads = [threading.Thread(target=runner.worker, args=(i, api_url), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    start = time.monotonic()
+    baseline = baseline_rss = baseline_traced = None
+    samples = []
+    failure = ""
+    try:
+        while time.monotonic() - start < duration:
+            time.sleep(min(sample_interval, max(0.0, duration - (time.monotonic() - start))))
+            elapsed = time.monotonic() - start
+            ops, errors, counts = runner.totals()
+            rss = current_rss()
+            traced, _ = tracemalloc.get_traced_memory()
+            sample = {"elapsed": round(elapsed, 1), "ops": ops, "errors": errors,
+                      "rss_mb": round(rss / 2 ** 20, 2), "traced_mb": round(traced / 2 ** 20, 2)}
+            samples.append(sample)
+
+            if baseline is None and elapsed >= warmup:
+                baseline, baseline_rss, baseline_traced = tracemalloc.take_snapshot(), rss, traced
+                log(f"Baseline after {elapsed:.0f}s warm-up: RSS {sample['rss_mb']} MB, traced {sample['traced_mb']} MB")
+            rss_growth = (rss - baseline_rss) / 2 ** 20 if baseline else 0.0
+            traced_growth = (traced - baseline_traced) / 2 ** 20 if baseline else 0.0
+            log(f"[{elapsed:7.0f}s] {ops} ops ({ops / elapsed:.1f}/s), {errors} errors, "
+                f"RSS {sample['rss_mb']} MB (+{rss_growth:.1f}), traced {sample['traced_mb']} MB (+{traced_growth:.1f})")
+
+            if rss_growth > max_rss_growth_mb:
+                failure = f"RSS grew {rss_growth:.1f} MB past the {max_rss_growth_mb} MB threshold"
+            elif traced_growth > max_traced_growth_mb:
+                failure = f"Python heap grew {traced_growth:.1f} MB past the {max_traced_growth_mb} MB threshold"
+            if failure:
+                break
+    finally:
+        runner.stop.set()
+        for thread in threads:
+            thread.join(timeout=30)
+        api_server.shutdown()
+        stub.stop()
+
+    if baseline is None and not failure:
+        failure = f"No memory baseline: the run ended before the {warmup:.0f}s warm-up"
+    growth = top_growth(baseline, tracemalloc.take_snapshot()) if baseline else []
+    tracemalloc.stop()
+    ops, errors, counts = runner.totals()
+    report = {"failure": failure, "ops": ops, "errors": errors, "counts": counts,
+              "stub_requests": stub.requests, "samples": samples, "top_growth": growth,
+              "backend": web.backend_stats()}
+    return not failure, report
+
+
+# --- Command Line ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Soak-test the web app's handlers against a stub Ollama server.")
+    parser.add_argument("--duration", type=float, default=SOAK_DURATION, help="Seconds to run")
+    parser.add_argument("--warmup", type=float, default=SOAK_WARMUP, help="Seconds before the memory baseline")
+    parser.add_argument("--sample-interval", type=float, default=SOAK_SAMPLE_INTERVAL)
+    parser.add_argument("--concurrency", type=int, default=SOAK_CONCURRENCY)
+    parser.add_argument("--mix", default=SOAK_MIX, help=f"Weighted operations, e.g. '{SOAK_MIX}'")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub Ollama latency per call")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=MAX_RSS_GROWTH_MB)
+    parser.add_argument("--max-traced-growth-mb", type=float, default=MAX_TRACED_GROWTH_MB)
+    parser.add_argument("--report", help="Write samples and growth sites as JSON to this path")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's per-request console output")
+    args = parser.parse_args()
+
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.duration <= args.warmup:
+        parser.error("--duration must exceed --warmup, or no memory baseline is taken and growth can't be checked")
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+    try:
+        passed, report = run_soak(args.duration, args.warmup, args.sample_interval, args.concurrency, args.mix,
+                                  args.latency, args.max_rss_growth_mb, args.max_traced_growth_mb)
+    finally:
+        sys.stdout = sys.__stdout__
+
+    print(f"\n{report['ops']} operations ({report['counts']}), {report['errors']} errors, "
+          f"{report['stub_requests']} stub Ollama calls")
+    print("Top allocation growth since baseline:")
+    for site in report["top_growth"]:
+        print(f"  +{site['size_diff_kb']:>9.1f} KB  {site['count_diff']:+7d} blocks  {site['site']}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.report}")
+    print("PASS" if passed else f"FAIL: {report['failure']}")
+    sys.exit(0 if passed else 1)
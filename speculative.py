@@ -0,0 +1,197 @@
+import threading
+import time
+from collections import OrderedDict
+
+SPECULATE_DEBOUNCE = 0.8  # Seconds of no edits before a speculative enhancement starts
+SPECULATOR_SESSIONS = 256  # Most recently active UI sessions that keep their own speculator
+
+
+class SpeculationCancelled(Exception):
+    """Raised inside a speculative run once its inputs have been edited."""
+
+
+class _Speculation:
+    def __init__(self, key):
+        self.key = key
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.start = time.monotonic()
+        self.end = None
+        self.result = None
+        self.error = None
+        self.discarded = False
+
+    def duration(self):
+        return (self.end or time.monotonic()) - self.start
+
+
+class Speculator:
+    """Runs an enhancement in the background while the user is still editing.
+
+    schedule(key, fn) is called on every edit; after `debounce` seconds without
+    further edits fn(cancelled_event) runs on a background thread. A new key
+    cancels the previous run, and take(key) hands over a matching result (or
+    waits for a matching run still in flight) when the user clicks Enhance.
+    Speculation is low priority: it only starts when can_start() says the
+    backend has spare capacity (otherwise it waits another debounce), and
+    only one run exists at a time.
+    """
+
+    def __init__(self, debounce=SPECULATE_DEBOUNCE, can_start=None):
+        self.debounce = debounce
+        self.can_start = can_start
+        self._lock = threading.Lock()
+        self._timer = None
+        self._current = None
+        self.started = 0
+        self.skipped = 0  # Debounce fired while the backend was busy; retried later
+        self.hits = 0
+        self.joined = 0  # Hits that still had to wait for the run to finish
+        self.misses = 0
+        self.cancelled = 0
+        self.saved_seconds = 0.0
+        self.wasted_seconds = 0.0  # Backend time spent on results nobody used
+
+    def _discard(self, speculation):
+        """Caller holds the lock."""
+        if speculation.discarded:
+            return
+        speculation.discarded = True
+        speculation.cancelled.set()
+        self.cancelled += 1
+        if speculation.done.is_set():
+            self.wasted_seconds += speculation.duration()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def schedule(self, key, fn):
+        """Restarts the debounce for key; a run for a different key is cancelled."""
+        with self._lock:
+            self._cancel_timer()
+            current = self._current
+            if current is not None and current.key == key and current.error is None:
+                return  # Already running or finished for these inputs
+            if current is not None:
+                self._discard(current)
+                self._current = None
+            self._timer = threading.Timer(self.debounce, self._start, (key, fn))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self):
+        with self._lock:
+            self._cancel_timer()
+            if self._current is not None:
+                self._discard(self._current)
+                self._current = None
+
+    def _start(self, key, fn):
+        with self._lock:
+            self._timer = None
+            if self._current is not None:
+                return
+            if self.can_start is not None and not self.can_start():
+                self.skipped += 1  # Backend busy with real work: try again after another debounce
+                self._timer = threading.Timer(self.debounce, self._start, (key, fn))
+                self._timer.daemon = True
+                self._timer.start()
+                return
+            speculation = _Speculation(key)
+            self._current = speculation
+            self.started += 1
+        threading.Thread(target=self._run, args=(speculation, fn), daemon=True).start()
+
+    def _run(self, speculation, fn):
+        try:
+            speculation.result = fn(speculation.cancelled)
+        except SpeculationCancelled:
+            pass
+        except Exception as e:
+            speculation.error = e
+            print(f"Speculative enhancement failed: {type(e).__name__}: {e}")
+        with self._lock:
+            speculation.end = time.monotonic()
+            speculation.done.set()
+            if speculation.discarded:
+                self.wasted_seconds += speculation.duration()
+
+    def take(self, key):
+        """Result of a speculative run for key, or None if there is none to use."""
+        clicked = time.monotonic()
+        with self._lock:
+            self._cancel_timer()
+            speculation = self._current
+            self._current = None
+            if speculation is None or speculation.key != key or speculation.error is not None:
+                if speculation is not None:
+                    self._discard(speculation)
+                self.misses += 1
+                return None
+            finished = speculation.done.is_set()
+
+        speculation.done.wait()
+        with self._lock:
+            if speculation.error is not None or speculation.result is None:
+                self.misses += 1
+                self.wasted_seconds += speculation.duration()
+                return None
+            self.hits += 1
+            self.joined += not finished
+            # Time the user didn't have to wait: the whole run, or the part done before the click
+            self.saved_seconds += speculation.duration() if finished else clicked - speculation.start
+        return speculation.result
+
+    def stats(self):
+        with self._lock:
+            taken = self.hits + self.misses
+            return {
+                "started": self.started,
+                "skipped_busy": self.skipped,
+                "hits": self.hits,
+                "joined_in_flight": self.joined,
+                "misses": self.misses,
+                "cancelled": self.cancelled,
+                "hit_rate": round(self.hits / taken, 3) if taken else 0.0,
+                "saved_seconds": round(self.saved_seconds, 2),
+                "wasted_seconds": round(self.wasted_seconds, 2),
+            }
+
+
+class SessionSpeculators:
+    """One Speculator per UI session, so one user's edits never cancel another user's run.
+
+    Beyond max_sessions, the least recently used session's speculator is cancelled and dropped.
+    """
+
+    def __init__(self, max_sessions=SPECULATOR_SESSIONS, **speculator_options):
+        self.max_sessions = max_sessions
+        self.speculator_options = speculator_options
+        self._lock = threading.Lock()
+        self._speculators = OrderedDict()  # session -> Speculator, least recently used first
+
+    def get(self, session):
+        with self._lock:
+            speculator = self._speculators.get(session)
+            if speculator is None:
+                speculator = self._speculators[session] = Speculator(**self.speculator_options)
+            self._speculators.move_to_end(session)
+            while len(self._speculators) > self.max_sessions:
+                _, evicted = self._speculators.popitem(last=False)
+                evicted.cancel()
+            return speculator
+
+    def stats(self):
+        """Counters summed over sessions; get(session).stats() has one session's own figures."""
+        with self._lock:
+            speculators = list(self._speculators.values())
+        totals = {}
+        for stats in (speculator.stats() for speculator in speculators):
+            for name, value in stats.items():
+                if name != "hit_rate":
+                    totals[name] = round(totals.get(name, 0) + value, 2)
+        taken = totals.get("hits", 0) + totals.get("misses", 0)
+        totals["hit_rate"] = round(totals["hits"] / taken, 3) if taken else 0.0
+        return dict(sessions=len(speculators), **totals)
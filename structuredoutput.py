@@ -0,0 +1,166 @@
+import json
+import re
+import threading
+
+# Appended to the system prompt when structured output is enabled
+JSON_INSTRUCTION = (
+    " Respond ONLY with a JSON object of the form"
+    ' {"positive": ["tag", ...], "negative": ["tag", ...], "subject": "...", "style": "..."}.'
+    " positive holds the enhanced prompt as short tags or phrases, negative holds things to avoid"
+    " (may be empty), subject is the main subject and style the overall visual style."
+)
+
+# Response format understood by OpenAI's JSON mode and Ollama's OpenAI-compatible endpoint
+# (which maps it to Ollama's native `format: "json"`)
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_PREAMBLE_RE = re.compile(r"^\s*(sure|here|certainly|okay|of course)\b[^:\n]*:\s*", re.IGNORECASE)
+_LIST_MARKER_RE = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s*", re.MULTILINE)
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a reply can't be turned into the expected structure, even after repair."""
+
+
+def with_json_instruction(messages):
+    """Copy of [system, user] messages with the JSON instruction added to the system prompt."""
+    system = dict(messages[0], content=messages[0]["content"] + JSON_INSTRUCTION)
+    return [system] + list(messages[1:])
+
+
+def _as_tags(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list):
+        return None
+    tags = [str(tag).strip() for tag in value if isinstance(tag, (str, int, float)) and str(tag).strip()]
+    return tags
+
+
+def validate(data):
+    """Checks and normalizes a decoded reply. Returns the cleaned dict or raises StructuredOutputError."""
+    if not isinstance(data, dict):
+        raise StructuredOutputError("reply is not a JSON object")
+    positive = _as_tags(data.get("positive"))
+    if not positive:
+        raise StructuredOutputError("missing or empty 'positive' tags")
+    negative = _as_tags(data.get("negative", [])) or []
+    return {
+        "positive": positive,
+        "negative": negative,
+        "subject": str(data.get("subject") or "").strip(),
+        "style": str(data.get("style") or "").strip(),
+    }
+
+
+def _balance(text):
+    """Closes brackets/quotes left open by a truncated reply."""
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    return text + ('"' if in_string else "") + "".join(reversed(stack))
+
+
+def repair(text):
+    """Cheap local fixes for common model mistakes; returns a decoded object or None."""
+    text = _FENCE_RE.sub("", text.strip().translate(_SMART_QUOTES))
+    start = text.find("{")
+    if start != -1:
+        end = text.rfind("}")
+        candidate = text[start:end + 1] if end > start else text[start:]
+        candidate = _TRAILING_COMMA_RE.sub(r"\1", _balance(candidate))
+        for attempt in (candidate, candidate.replace("'", '"')):
+            try:
+                return json.loads(attempt)
+            except json.JSONDecodeError:
+                continue
+        return None
+
+    # No JSON at all: salvage a plain tag list ("Sure! Here is your prompt: a, b, c" / numbered lists)
+    text = _LIST_MARKER_RE.sub("", _PREAMBLE_RE.sub("", text)).strip().strip('"')
+    tags = [tag.strip() for tag in re.split(r"[,\n]", text) if tag.strip()]
+    return {"positive": tags} if tags else None
+
+
+def parse_structured(text):
+    """Returns (structure, repaired). Tries strict JSON first, then the local repair pass."""
+    try:
+        return validate(json.loads(text)), False
+    except (json.JSONDecodeError, StructuredOutputError):
+        pass
+    data = repair(text)
+    if data is None:
+        raise StructuredOutputError("reply is not valid JSON and could not be repaired")
+    return validate(data), True
+
+
+class StructuredStats:
+    """Counts clean parses, local repairs, re-rolls (extra LLM calls) and hard failures."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.clean = 0
+        self.repaired = 0
+        self.rerolls = 0
+        self.failures = 0
+
+    def record(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "clean": self.clean,
+                "repaired": self.repaired,
+                "rerolls": self.rerolls,
+                "failures": self.failures,
+                "reroll_rate": round(self.rerolls / self.requests, 3) if self.requests else 0.0,
+            }
+
+
+def enhance_structured(call_fn, messages, stats, max_rerolls=1):
+    """Calls call_fn(messages) in JSON mode and returns the validated structure.
+
+    A malformed reply gets the local repair pass first; only if that fails is
+    the request re-rolled, up to max_rerolls extra calls.
+    """
+    messages = with_json_instruction(messages)
+    stats.record("requests")
+    for attempt in range(max_rerolls + 1):
+        text = call_fn(messages)
+        try:
+            result, repaired = parse_structured(text)
+        except StructuredOutputError as e:
+            if attempt < max_rerolls:
+                stats.record("rerolls")
+                print(f"Structured output unusable ({e}); re-rolling.")
+                continue
+            stats.record("failures")
+            raise
+        stats.record("repaired" if repaired else "clean")
+        return result
+
+
+def structured_to_prompt(result):
+    """(positive text, negative text) from a validated structure."""
+    return ", ".join(result["positive"]), ", ".join(result["negative"])
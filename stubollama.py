@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_HOST = "127.0.0.1"
+STUB_LATENCY = 0.05  # Seconds per (non-streamed) completion
+STUB_STREAM_CHUNKS = 8
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Answers /v1/chat/completions like Ollama's OpenAI-compatible endpoint, with canned text."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Keep soak/benchmark output readable
+
+    def _reply_text(self, body):
+        user = body["messages"][-1]["content"]
+        if body.get("response_format"):
+            return json.dumps({"positive": [f"enhanced {user}", "highly detailed", "sharp focus"],
+                               "negative": ["blurry"], "subject": user, "style": "stub"})
+        if user.startswith("["):  # Micro-batch request: a JSON array of prompts
+            return json.dumps([f"enhanced {item}, highly detailed" for item in json.loads(user)])
+        return f"enhanced {user}, highly detailed, sharp focus, dramatic lighting"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        text = self._reply_text(body)
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            words = text.split(" ")
+            step = max(1, len(words) // STUB_STREAM_CHUNKS)
+            try:
+                for i in range(0, len(words), step):
+                    time.sleep(server.latency / STUB_STREAM_CHUNKS)
+                    delta = " ".join(words[i:i + step]) + " "
+                    event = {"choices": [{"delta": {"content": delta}}]}
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Client cancelled the stream
+            self.close_connection = True
+            return
+
+        time.sleep(server.latency)
+        data = json.dumps({"choices": [{"message": {"role": "assistant", "content": text}}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubOllama:
+    """In-process fake Ollama server for soak tests and benchmarks (no model, fixed latency)."""
+
+    def __init__(self, host=STUB_HOST, port=0, latency=STUB_LATENCY):
+        self.server = ThreadingHTTPServer((host, port), _StubHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    @property
+    def requests(self):
+        with self.server.lock:
+            return self.server.requests
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# --- Run a stub server on a fixed port ---
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fake Ollama chat endpoint for load testing.")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=STUB_LATENCY)
+    args = parser.parse_args()
+    stub = StubOllama(port=args.port, latency=args.latency)
+    print(f"Stub Ollama listening at {stub.endpoint} (latency {args.latency}s). Ctrl+C to stop.")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
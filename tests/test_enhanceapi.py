@@ -0,0 +1,37 @@
+import pytest
+
+from enhanceapi import EnhanceAPI
+
+
+@pytest.fixture
+def api():
+    api = EnhanceAPI(lambda *args: args, styles=["Visual Detail", "Cinematic"])
+    yield api
+    api.executor.shutdown()
+
+
+def test_parse_item_applies_defaults(api):
+    assert api.parse_item({"prompt": " a cat ", "nsfw": True}, {"style": "Cinematic", "conciseness": "40"}) == (
+        "a cat", "Cinematic", True, 40.0, "", "", "")
+
+
+@pytest.mark.parametrize("item, message", [
+    ({}, "Missing 'prompt'"),
+    ({"prompt": "  "}, "Missing 'prompt'"),
+    ({"prompt": 5}, "'prompt' must be a string"),
+    ({"prompt": ["a", "b"]}, "'prompt' must be a string"),
+    ({"prompt": "cat", "style": "Unknown"}, "Unknown style 'Unknown'"),
+    ({"prompt": "cat", "conciseness": "lots"}, "'conciseness' must be a number"),
+    ({"prompt": "cat", "conciseness": float("inf")}, "'conciseness' must be a number"),
+    ({"prompt": "cat", "nsfw": "false"}, "'nsfw' must be true or false"),
+    ({"prompt": "cat", "nsfw": 0}, "'nsfw' must be true or false"),
+    ("a cat", "must be a JSON object"),
+    (["a cat"], "must be a JSON object"),
+])
+def test_parse_item_rejects_bad_input(api, item, message):
+    with pytest.raises(ValueError, match=message):
+        api.parse_item(item)
+
+
+def test_enhance_one_reports_bad_items_as_errors(api):
+    assert api.enhance_one({"prompt": "cat", "nsfw": "1"}) == {"error": "'nsfw' must be true or false."}
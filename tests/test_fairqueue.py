@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from fairqueue import BULK, INTERACTIVE, FairScheduler, QueueTimeout
+
+
+def queued(scheduler):
+    stats = scheduler.stats()
+    return stats[INTERACTIVE]["queued"] + stats[BULK]["queued"]
+
+
+def run_in_order(scheduler, requests):
+    """Holds the only slot, queues (name, session, priority) in order, then records the grant order."""
+    order = []
+    threads = []
+    scheduler.acquire("holder", BULK)  # Bulk, so it doesn't count towards the interactive streak
+    for name, session, priority in requests:
+        def work(name=name, session=session, priority=priority):
+            with scheduler.slot(session, priority, timeout=5):
+                order.append(name)
+        thread = threading.Thread(target=work)
+        thread.start()
+        threads.append(thread)
+        expected = len(threads)
+        deadline = time.monotonic() + 5
+        while queued(scheduler) < expected and time.monotonic() < deadline:
+            time.sleep(0.001)
+    scheduler.release("holder")
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def test_interactive_goes_before_bulk():
+    scheduler = FairScheduler(1)
+    order = run_in_order(scheduler, [("bulk1", "a", BULK), ("bulk2", "b", BULK), ("typed", "c", INTERACTIVE)])
+    assert order == ["typed", "bulk1", "bulk2"]
+
+
+def test_sessions_take_turns_within_a_class():
+    scheduler = FairScheduler(1)
+    order = run_in_order(scheduler, [("a1", "a", BULK), ("a2", "a", BULK), ("a3", "a", BULK), ("b1", "b", BULK)])
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_bulk_is_not_starved():
+    scheduler = FairScheduler(1, bulk_every=2)
+    order = run_in_order(scheduler, [("bulk", "a", BULK)] + [(f"i{n}", f"s{n}", INTERACTIVE) for n in range(4)])
+    assert order == ["i0", "i1", "bulk", "i2", "i3"]
+
+
+def test_session_cap_lets_other_sessions_through():
+    scheduler = FairScheduler(3, session_limit=1, session_limits={"batch-key": 2})
+    scheduler.acquire("a")
+    with pytest.raises(QueueTimeout):
+        scheduler.acquire("a", timeout=0.05)
+    scheduler.acquire("b", timeout=1)  # Capacity is still free for other sessions
+    scheduler.acquire("batch-key", BULK, timeout=1)
+    with pytest.raises(QueueTimeout):
+        scheduler.acquire("batch-key", BULK, timeout=0.05)  # Over capacity, not over its own cap of 2
+    stats = scheduler.stats()
+    assert stats["in_flight"] == 3
+    assert stats[INTERACTIVE]["timeouts"] == 1
+    assert stats[INTERACTIVE]["queued"] == stats[BULK]["queued"] == 0
+
+
+def test_callable_capacity_and_spare_capacity():
+    capacity = [1]
+    scheduler = FairScheduler(lambda: capacity[0])
+    assert scheduler.has_spare_capacity()
+    scheduler.acquire("a")
+    assert not scheduler.has_spare_capacity()
+    capacity[0] = 2
+    assert scheduler.has_spare_capacity()
+    scheduler.acquire("b", timeout=1)
+    scheduler.release("a")
+    scheduler.release("b")
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        FairScheduler(1).acquire("a", priority="urgent")
+
+
+def test_parked_slot_frees_capacity_but_keeps_the_session_cap():
+    scheduler = FairScheduler(1, session_limit=1)
+    with scheduler.parked():  # Holds no slot: nothing to hand back
+        assert scheduler.stats()["in_flight"] == 0
+    with scheduler.slot("a"):
+        with scheduler.parked():
+            scheduler.acquire("b", timeout=1)  # Capacity was handed back
+            with pytest.raises(QueueTimeout):
+                scheduler.acquire("a", timeout=0.05)  # Still at its own cap
+            scheduler.release("b")
+        assert scheduler.stats()["in_flight"] == 1
+    assert scheduler.stats()["in_flight"] == 0
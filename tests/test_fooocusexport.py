@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from fooocusexport import FooocusExporter, iter_ndjson_results, iter_saved_prompts, parse_enhanced, to_fooocus_job
+
+ENHANCED = "--checkpoint juggernautXL.safetensors\n<lora:add-detail:0.8>, a cat,  wearing a hat, <lora:film:1>"
+
+
+def saved_entry(positive, negative):
+    """One entry exactly as the Tk apps' Save button writes it."""
+    return ("--- Prompt ---\n" + "Positive Prompt:\n" + positive + "\n\n"
+            + "Negative Prompt:\n" + negative + "\n" + "--------------\n\n")
+
+
+def test_parse_enhanced_splits_checkpoint_and_loras():
+    record = parse_enhanced(ENHANCED, " blurry,  lowres ")
+    assert record == {"prompt": "a cat, wearing a hat", "negative_prompt": "blurry, lowres",
+                      "checkpoint": "juggernautXL.safetensors", "loras": [("add-detail", 0.8), ("film", 1.0)]}
+
+
+def test_fooocus_job_shape():
+    job = to_fooocus_job(parse_enhanced(ENHANCED))
+    assert job["base_model_name"] == "juggernautXL.safetensors"
+    assert job["loras"] == [{"model_name": "add-detail.safetensors", "weight": 0.8},
+                            {"model_name": "film.safetensors", "weight": 1.0}]
+
+
+def test_saved_prompts_stop_at_record_separators(tmp_path):
+    path = tmp_path / "enhanced_prompts.txt"
+    path.write_text(saved_entry("--checkpoint a.safetensors\ncat", "blurry")
+                    + saved_entry("dog", "") + saved_entry("bird\nin flight", "bad, ugly"), encoding="utf-8")
+    assert list(iter_saved_prompts(path)) == [("--checkpoint a.safetensors\ncat", "blurry"), ("dog", ""),
+                                              ("bird\nin flight", "bad, ugly")]
+
+
+def test_saved_prompts_without_separators(tmp_path):
+    path = tmp_path / "enhanced_prompts.txt"
+    path.write_text("Positive Prompt:\ncat\nNegative Prompt:\nblurry\nPositive Prompt:\ndog\n", encoding="utf-8")
+    assert list(iter_saved_prompts(path)) == [("cat", "blurry"), ("dog", "")]
+
+
+def test_ndjson_errors_become_empty_results(tmp_path):
+    path = tmp_path / "batch.ndjson"
+    path.write_text('{"positive": "p", "negative": "n"}\n\n{"error": "timeout"}\n', encoding="utf-8")
+    assert list(iter_ndjson_results(path)) == [("p", "n"), ("", "")]
+
+
+def test_exporter_writes_sharded_formats_and_skips_errors(tmp_path):
+    with FooocusExporter(tmp_path, name="run", shard_size=2) as exporter:
+        for index in range(3):
+            assert exporter.write(f"--checkpoint m.safetensors\n<lora:x:0.5>, cat {index}", "blurry")
+        assert not exporter.write("Error: backend unavailable")
+        assert not exporter.write("")
+    assert (exporter.written, exporter.skipped) == (3, 2)
+    assert (tmp_path / "wildcards" / "run_0000.txt").read_text(encoding="utf-8") == "cat 0\ncat 1\n"
+    assert (tmp_path / "wildcards" / "run_0001.txt").read_text(encoding="utf-8") == "cat 2\n"
+    assert (tmp_path / "run_0000_prompts.txt").read_text(encoding="utf-8") == "<lora:x:0.5>, cat 0\n<lora:x:0.5>, cat 1\n"
+    assert (tmp_path / "run_0001_negative.txt").read_text(encoding="utf-8") == "blurry\n"
+    job = json.loads((tmp_path / "run_0001.jsonl").read_text(encoding="utf-8"))
+    assert job == {"prompt": "cat 2", "negative_prompt": "blurry", "base_model_name": "m.safetensors",
+                   "loras": [{"model_name": "x.safetensors", "weight": 0.5}]}
+    assert len(exporter.paths()) == 8
+
+
+def test_exporter_without_sharding_and_unknown_format(tmp_path):
+    with FooocusExporter(tmp_path, formats=("jsonl",), shard_size=0) as exporter:
+        exporter.write("--checkpoint m.safetensors\ncat")
+    assert [path.name for path in exporter.paths()] == ["enhanced.jsonl"]
+    with pytest.raises(ValueError):
+        FooocusExporter(tmp_path, formats=("csv",))
@@ -0,0 +1,97 @@
+import json
+import threading
+
+from microbatch import MicroBatcher, parse_batch_response
+
+SYSTEM = {"role": "system", "content": "You are a prompt enhancer."}
+
+
+def submit_all(batcher, prompts):
+    results = {}
+    threads = [threading.Thread(target=lambda p=p: results.__setitem__(p, batcher.submit([SYSTEM, {"role": "user", "content": p}])))
+               for p in prompts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_parse_batch_response_accepts_array_with_chatter():
+    assert parse_batch_response('Sure! ["a cat ", "a dog"] Enjoy.', 2) == ["a cat", "a dog"]
+
+
+def test_parse_batch_response_rejects_unusable_replies():
+    assert parse_batch_response("no array here", 1) is None
+    assert parse_batch_response('["a", "b"]', 3) is None  # Wrong count
+    assert parse_batch_response('["a", ""]', 2) is None  # Empty item
+    assert parse_batch_response('["a", 1]', 2) is None  # Not a string
+    assert parse_batch_response('["a", "b"', 2) is None  # Truncated
+
+
+def test_full_group_is_sent_as_one_call():
+    calls = []
+
+    def call_fn(messages):
+        calls.append(messages)
+        items = json.loads(messages[-1]["content"])
+        return json.dumps([f"enhanced {item}" for item in items])
+
+    batcher = MicroBatcher(call_fn, window=5, max_size=3)
+    results = submit_all(batcher, ["a", "b", "c"])
+    assert results == {"a": "enhanced a", "b": "enhanced b", "c": "enhanced c"}
+    assert len(calls) == 1
+    assert "exactly 3 strings" in calls[0][0]["content"]
+    assert batcher.stats() == {"batches": 1, "batched_items": 3, "avg_batch_size": 3.0, "fallbacks": 0}
+
+
+def test_lone_request_is_sent_unchanged_after_the_window():
+    calls = []
+
+    def call_fn(messages):
+        calls.append(messages)
+        return "enhanced " + messages[-1]["content"]
+
+    batcher = MicroBatcher(call_fn, window=0.01, max_size=8)
+    assert batcher.submit([SYSTEM, {"role": "user", "content": "a"}]) == "enhanced a"
+    assert calls == [[SYSTEM, {"role": "user", "content": "a"}]]
+
+
+def test_unparseable_batch_reply_falls_back_to_single_calls():
+    def call_fn(messages):
+        if messages[-1]["content"].startswith("["):
+            return "I can't do lists"
+        return "single " + messages[-1]["content"]
+
+    batcher = MicroBatcher(call_fn, window=5, max_size=2)
+    assert submit_all(batcher, ["a", "b"]) == {"a": "single a", "b": "single b"}
+    assert batcher.stats()["fallbacks"] == 1
+
+
+def test_full_group_through_the_scheduler_is_one_call():
+    from fairqueue import FairScheduler
+    from microbatch import BATCH_SESSION
+
+    calls = []
+
+    def call_fn(messages):
+        calls.append(messages)
+        items = json.loads(messages[-1]["content"])
+        return json.dumps([f"enhanced {item}" for item in items])
+
+    scheduler = FairScheduler(capacity=2, session_limit=2, session_limits={BATCH_SESSION: 2})
+    batcher = MicroBatcher(call_fn, window=5, max_size=8, scheduler=scheduler)
+    results = {}
+
+    def session(index):
+        with scheduler.slot(f"session {index}", timeout=5):
+            results[index] = batcher.submit([SYSTEM, {"role": "user", "content": str(index)}])
+
+    threads = [threading.Thread(target=session, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == {index: f"enhanced {index}" for index in range(8)}
+    assert len(calls) == 1
+    assert scheduler.stats()["in_flight"] == 0
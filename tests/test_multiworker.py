@@ -0,0 +1,22 @@
+from adaptivelimit import AdaptiveLimiter
+from multiworker import ResponseCache, cache_key, share_limits
+
+
+def test_share_limits_splits_the_backend_budget():
+    limiter = AdaptiveLimiter("test", initial_limit=8, max_limit=16)
+    share_limits(limiter, 4)
+    assert (limiter.limit, limiter.max_limit) == (2.0, 4)
+
+
+def test_share_limits_keeps_at_least_min_limit():
+    limiter = AdaptiveLimiter("test", initial_limit=2, max_limit=16)
+    share_limits(limiter, 32)
+    assert (limiter.limit, limiter.max_limit) == (1.0, 1)
+
+
+def test_response_cache_round_trip(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3", ttl=60)
+    key = cache_key("a cat", "Cinematic", False, 60.0, "", "", "")
+    assert cache.get(key) is None
+    cache.put(key, ["positive", "negative"])
+    assert cache.get(key) == ["positive", "negative"]
@@ -0,0 +1,27 @@
+from promptcleanup import clean_prompt, split_tags
+
+
+def test_strips_stray_colons_and_normalizes_commas():
+    assert clean_prompt("masterpiece: best quality ,  detailed,,sharp ") == "masterpiece best quality, detailed, sharp"
+
+
+def test_keeps_lora_tags_verbatim():
+    assert clean_prompt("<lora:add-detail-xl:0.8>, portrait: soft light") == "<lora:add-detail-xl:0.8>, portrait soft light"
+
+
+def test_drops_repeated_tags_ignoring_case_and_spacing():
+    assert split_tags("Red  Hair, cat, red hair, CAT") == ["Red  Hair", "cat"]
+
+
+def test_dedupe_can_be_disabled():
+    assert split_tags("cat, cat", dedupe=False) == ["cat", "cat"]
+
+
+def test_lone_angle_bracket_is_kept_as_text():
+    assert clean_prompt("a < b, c") == "a < b, c"
+
+
+def test_empty_input():
+    assert clean_prompt("") == ""
+    assert clean_prompt(None) == ""
+    assert clean_prompt(" , ,") == ""
@@ -0,0 +1,79 @@
+import pytest
+
+from promptexpand import Template, TemplateError
+
+
+def test_counts_and_expands_every_combination_in_index_order():
+    template = Template("a {red|blue} {cat|dog}")
+    assert len(template) == 4
+    assert list(template.iter_all()) == ["a red cat", "a red dog", "a blue cat", "a blue dog"]
+    assert list(template.iter_all(start=1, limit=2)) == ["a red dog", "a blue cat"]
+
+
+def test_nested_alternations_and_weights():
+    template = Template("{3::sunny|{light|heavy} rain} day")
+    assert len(template) == 3
+    assert list(template.iter_all()) == ["sunny day", "light rain day", "heavy rain day"]
+
+
+def test_wildcards_may_nest(tmp_path):
+    (tmp_path / "animal.txt").write_text("# animals\ncat\n2::__bird__\n", encoding="utf-8")
+    (tmp_path / "bird.txt").write_text("owl\ncrow\n", encoding="utf-8")
+    template = Template("a __animal__ , at dusk", tmp_path)
+    assert list(template.iter_all()) == ["a cat, at dusk", "a owl, at dusk", "a crow, at dusk"]
+
+
+def test_template_errors(tmp_path):
+    with pytest.raises(TemplateError):
+        Template("{unclosed|choice")
+    with pytest.raises(TemplateError):
+        Template("__missing__", tmp_path)
+    (tmp_path / "loop.txt").write_text("__loop__\n", encoding="utf-8")
+    with pytest.raises(TemplateError):
+        Template("__loop__", tmp_path)
+
+
+def test_expand_rejects_out_of_range_index():
+    with pytest.raises(IndexError):
+        Template("{a|b}").expand(2)
+
+
+def test_unique_sample_is_distinct_and_reproducible():
+    template = Template("{a|b|c|d} {e|f|g} {h|i}")
+    sample = list(template.iter_sample(20, seed=3))
+    assert len(sample) == len(set(sample)) == 20
+    assert set(sample) <= set(template.iter_all())
+    assert list(template.iter_sample(20, seed=3)) == sample
+
+
+def test_unique_sample_covering_the_product_returns_all():
+    template = Template("{a|b} {c|d}")
+    assert sorted(template.iter_sample(10, seed=1)) == sorted(template.iter_all())
+
+
+def test_unique_sample_of_huge_product():
+    template = Template(" ".join("{a|b|c|d}" for _ in range(40)))  # 4**40 > sys.maxsize
+    sample = list(template.iter_sample(5, seed=1))
+    assert len(set(sample)) == 5
+
+
+def test_weighted_sample_follows_weights():
+    template = Template("{99::common|rare}")
+    sample = list(template.iter_sample(200, seed=1, unique=False))
+    assert len(sample) == 200
+    assert sample.count("common") > 180
+
+
+@pytest.mark.parametrize("name", ["../secret", "sub/name", "a..b"])
+def test_wildcard_names_stay_inside_the_folder(tmp_path, name):
+    with pytest.raises(TemplateError, match="path separators"):
+        Template(f"a __{name}__", tmp_path / "wildcards")
+
+
+def test_all_zero_weights_are_a_template_error(tmp_path):
+    with pytest.raises(TemplateError, match="weight 0"):
+        Template("{0::a|0::b}")
+    (tmp_path / "never.txt").write_text("0::a\n0::b\n", encoding="utf-8")
+    with pytest.raises(TemplateError, match="weight 0"):
+        Template("__never__", tmp_path)
+    assert list(Template("{0::a|1::b}").iter_sample(3, seed=1, unique=False)) == ["b", "b", "b"]
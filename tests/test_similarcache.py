@@ -0,0 +1,74 @@
+import pytest
+
+from similarcache import REORDERED_SIMILARITY, SimilarCache, jaccard, normalize, shingles
+
+SETTINGS = ("Cinematic", False, 60.0, "", "", "")
+
+
+def test_shingles_ignore_case_punctuation_stopwords_and_plurals():
+    assert shingles("The Cats, in a Garden!") == shingles("cat garden")
+    assert shingles("the of a") == frozenset({"the", "of", "a"})  # Only stopwords: keep them
+
+
+def test_normalize_keeps_word_order():
+    assert normalize("A dog, chasing a CAT!") == "a dog chasing a cat"
+
+
+def test_exact_hit_only_for_equal_normalized_text():
+    cache = SimilarCache()
+    cache.put(SETTINGS, "a dog chasing a cat", "dog result")
+    assert cache.get(SETTINGS, "A dog chasing a cat.") == ("dog result", 1.0, "a dog chasing a cat")
+
+
+def test_reordered_words_are_flagged_as_similar():
+    cache = SimilarCache()
+    cache.put(SETTINGS, "a dog chasing a cat", "dog result")
+    value, similarity, earlier = cache.get(SETTINGS, "a cat chasing a dog")
+    assert similarity == REORDERED_SIMILARITY < 1.0
+    cache.put(SETTINGS, "a cat chasing a dog", "cat result")
+    assert cache.get(SETTINGS, "a cat chasing a dog")[:2] == ("cat result", 1.0)
+    assert len(cache) == 2
+
+
+def test_one_changed_attribute_clears_the_default_threshold():
+    cache = SimilarCache()
+    cache.put(SETTINGS, "a girl with long red hair standing in a sunny flower field", "red")
+    value, similarity, _ = cache.get(SETTINGS, "a girl with long blue hair standing in a sunny flower field")
+    assert value == "red"
+    assert 0.75 <= similarity < 0.8
+
+
+def test_unrelated_prompts_and_other_settings_miss():
+    cache = SimilarCache()
+    cache.put(SETTINGS, "a knight in a neon city", "knight")
+    assert cache.get(SETTINGS, "an ocean at dawn") is None
+    assert cache.get(SETTINGS[:2] + (90.0,) + SETTINGS[3:], "a knight in a neon city") is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_eviction_drops_oldest_entries():
+    cache = SimilarCache(max_entries=2)
+    for word in ("castle", "dragon", "forest"):
+        cache.put(SETTINGS, f"a {word} at night", word)
+    assert len(cache) == 2
+    assert cache.get(SETTINGS, "a castle at night") is None
+    assert cache.get(SETTINGS, "a forest at night")[:2] == ("forest", 1.0)
+
+
+def test_stats_count_exact_and_similar_hits():
+    cache = SimilarCache()
+    cache.put(SETTINGS, "red castle on a hill", "v")
+    cache.get(SETTINGS, "red castle on a hill")
+    cache.get(SETTINGS, "hill red castle")
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["similar_hits"], stats["misses"]) == (1, 1, 0)
+
+
+def test_bands_must_divide_permutations():
+    with pytest.raises(ValueError):
+        SimilarCache(bands=7)
+
+
+def test_jaccard():
+    assert jaccard(frozenset("ab"), frozenset("bc")) == pytest.approx(1 / 3)
+    assert jaccard(frozenset(), frozenset()) == 1.0
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def upstream():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", upstream)))
+    leader.start()
+    assert started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("key", upstream))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {"requests": 4, "upstream_calls": 1, "coalesced": 3, "coalescing_ratio": 0.75}
+
+
+def test_finished_calls_are_not_cached():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.stats()["upstream_calls"] == 2
+
+
+def test_errors_reach_every_waiting_caller():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def upstream():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("backend down")
+
+    def call():
+        try:
+            flight.do("key", upstream)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert errors == ["backend down", "backend down"]
+
+
+def test_stream_replays_chunks_to_late_joiners():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def upstream():
+        yield "a"
+        release.wait(5)
+        yield "b"
+
+    first = flight.stream("key", upstream)
+    assert next(first) == "a"
+    second = flight.stream("key", upstream)
+    assert next(second) == "a"  # Joined mid-stream: earlier chunks are replayed
+    release.set()
+    assert list(first) == ["b"]
+    assert list(second) == ["b"]
+    assert flight.stats()["upstream_calls"] == 1
+
+
+def test_stream_error_is_raised_after_delivered_chunks():
+    flight = SingleFlight()
+
+    def upstream():
+        yield "a"
+        raise ValueError("cut off")
+
+    received = []
+    with pytest.raises(ValueError, match="cut off"):
+        for chunk in flight.stream("key", upstream):
+            received.append(chunk)
+    assert received == ["a"]
@@ -0,0 +1,69 @@
+import pytest
+
+from structuredoutput import (StructuredOutputError, StructuredStats, enhance_structured, parse_structured, repair,
+                              structured_to_prompt, validate)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n{"positive": ["cat"]}\n```', {"positive": ["cat"]}),
+    ('Here you go: {"positive": ["cat", "hat",],} hope it helps', {"positive": ["cat", "hat"]}),
+    ('{“positive”: [“cat”]}', {"positive": ["cat"]}),
+    ("{'positive': ['cat']}", {"positive": ["cat"]}),
+    ('{"positive": ["cat", "ha', {"positive": ["cat", "ha"]}),  # Truncated mid-string
+    ('{"positive": ["a \\"quoted\\" tag"', {"positive": ['a "quoted" tag']}),
+])
+def test_repair_fixes_common_json_mistakes(text, expected):
+    assert repair(text) == expected
+
+
+def test_repair_salvages_plain_tag_lists():
+    assert repair("Sure! Here is your prompt: a cat, a hat") == {"positive": ["a cat", "a hat"]}
+    assert repair("1. cat\n2) hat\n- scarf") == {"positive": ["cat", "hat", "scarf"]}
+
+
+def test_repair_gives_up_on_hopeless_replies():
+    assert repair("{not json at all") is None
+    assert repair("   ") is None
+
+
+def test_validate_normalizes_fields():
+    assert validate({"positive": "cat, hat ", "negative": ["blurry", ""], "subject": None, "style": " anime "}) == {
+        "positive": ["cat", "hat"], "negative": ["blurry"], "subject": "", "style": "anime"}
+    with pytest.raises(StructuredOutputError):
+        validate({"positive": []})
+    with pytest.raises(StructuredOutputError):
+        validate(["cat"])
+
+
+def test_parse_structured_reports_repairs():
+    assert parse_structured('{"positive": ["cat"]}')[1] is False
+    result, repaired = parse_structured('{"positive": ["cat"],}')
+    assert repaired and result["positive"] == ["cat"]
+    with pytest.raises(StructuredOutputError):
+        parse_structured("{]")
+
+
+def test_enhance_structured_rerolls_only_after_repair_fails():
+    replies = iter(["{]", '{"positive": ["cat"], "negative": ["blurry"]}'])
+    calls = []
+
+    def call_fn(messages):
+        calls.append(messages)
+        return next(replies)
+
+    stats = StructuredStats()
+    result = enhance_structured(call_fn, [{"role": "system", "content": "Enhance."}, {"role": "user", "content": "cat"}],
+                                stats)
+    assert structured_to_prompt(result) == ("cat", "blurry")
+    assert len(calls) == 2
+    assert calls[0][0]["content"].startswith("Enhance. Respond ONLY with a JSON object")
+    assert stats.stats() == {"requests": 1, "clean": 1, "repaired": 0, "rerolls": 1, "failures": 0,
+                             "reroll_rate": 1.0}
+
+
+def test_enhance_structured_fails_after_max_rerolls():
+    stats = StructuredStats()
+    with pytest.raises(StructuredOutputError):
+        enhance_structured(lambda messages: "{]", [{"role": "system", "content": ""}, {"role": "user", "content": ""}],
+                           stats, max_rerolls=0)
+    assert stats.stats()["failures"] == 1
@@ -0,0 +1,94 @@
+import tkinter as tk
+
+
+class Transcript:
+    """Message store behind a ScrolledText that only keeps a bounded window on screen.
+
+    Every message lives in `messages`; the widget shows messages[first_visible:].
+    Appending while scrolled to the bottom trims the oldest on-screen messages,
+    so insert cost does not grow with the session. Scrolling to the top pages
+    older messages back in from the store.
+    """
+
+    def __init__(self, text_widget, max_visible=200, page_size=50):
+        self.text = text_widget
+        self.max_visible = max_visible
+        self.page_size = page_size
+        self.messages = [] # [[text, tags]] - consecutive chunks of one message are merged
+        self.first_visible = 0
+        self._loading = False
+        self._vbar_set = text_widget.vbar.set
+        text_widget.config(yscrollcommand=self._on_yscroll)
+
+    def append(self, segments):
+        """Appends (text, tags) segments with one insert call (main thread only)."""
+        args = []
+        for text, tags in segments:
+            if not text:
+                continue
+            last = self.messages[-1] if len(self.messages) > self.first_visible else None
+            if last is not None and last[1] == tags and not last[0].endswith("\n"):
+                last[0] += text # Streamed chunk continuing the current message
+            else:
+                self.messages.append([text, tags])
+            args.extend((text, tags))
+        if not args:
+            return
+
+        at_bottom = self.text.yview()[1] > 0.95
+        self.text.config(state=tk.NORMAL)
+        self.text.insert(tk.END, *args)
+        if at_bottom: # Only trim when the user isn't reading older messages
+            self._trim()
+        self.text.config(state=tk.DISABLED)
+        if at_bottom: # Auto-scroll only if near the bottom
+            self.text.see(tk.END)
+
+    def remove_tag(self, tag):
+        """Deletes on-screen messages carrying `tag` (e.g. a placeholder) from widget and store."""
+        ranges = self.text.tag_ranges(tag)
+        if not ranges:
+            return
+        self.text.config(state=tk.NORMAL)
+        for start, end in reversed(list(zip(ranges[0::2], ranges[1::2]))):
+            self.text.delete(start, end)
+        self.text.config(state=tk.DISABLED)
+        for index in range(len(self.messages) - 1, self.first_visible - 1, -1):
+            if tag in self.messages[index][1]:
+                del self.messages[index]
+
+    def _trim(self):
+        excess = len(self.messages) - self.first_visible - self.max_visible
+        if excess <= 0:
+            return
+        chars = sum(len(text) for text, _ in self.messages[self.first_visible:self.first_visible + excess])
+        self.text.delete("1.0", f"1.0 + {chars} chars")
+        self.first_visible += excess
+
+    def load_older(self):
+        """Pages the previous batch of messages back in above the current view."""
+        if self.first_visible == 0:
+            return
+        start = max(0, self.first_visible - self.page_size)
+        args = []
+        chars = 0
+        for text, tags in self.messages[start:self.first_visible]:
+            args.extend((text, tags))
+            chars += len(text)
+        self.text.config(state=tk.NORMAL)
+        self.text.insert("1.0", *args)
+        self.text.config(state=tk.DISABLED)
+        self.first_visible = start
+        self.text.yview(f"1.0 + {chars} chars") # Keep the previously top message in place
+
+    def _on_yscroll(self, first, last):
+        self._vbar_set(first, last)
+        if float(first) <= 0.0 and self.first_visible > 0 and not self._loading:
+            self._loading = True
+            self.text.after_idle(self._load_older_idle)
+
+    def _load_older_idle(self):
+        try:
+            self.load_older()
+        finally:
+            self._loading = False